@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AdvertiseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'advertise'
+
+    def ready(self):
+        from advertise import signals  # noqa: F401
@@ -13,8 +13,10 @@ class Advertise(models.Model):
     title = models.CharField(max_length=100)
     time = models.IntegerField()
     video = models.FileField(upload_to=advertise_path)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     number_repeated = models.IntegerField()
+    # Maintained by advertise.signals. Impressions are the busiest write, so this is deliberately unindexed.
+    view_count = models.PositiveBigIntegerField(default=0, editable=False)
 
 
 class AdvertiseSeen(models.Model):
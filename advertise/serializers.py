@@ -6,7 +6,7 @@ from advertise.models import Advertise
 
 class DashboardAdvertiseSerializer(ModelSerializer):
     must_played = IntegerField(source='number_repeated')
-    view_number = CharField()
+    view_number = CharField(source='view_count')
 
     class Meta:
         model = Advertise
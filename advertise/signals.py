@@ -0,0 +1,16 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from advertise.models import Advertise, AdvertiseSeen
+
+
+@receiver(post_save, sender=AdvertiseSeen)
+def count_view(sender, instance, created, **kwargs):
+    if created:
+        Advertise.objects.filter(pk=instance.advertise_id).update(view_count=F('view_count') + 1)
+
+
+@receiver(post_delete, sender=AdvertiseSeen)
+def uncount_view(sender, instance, **kwargs):
+    Advertise.objects.filter(pk=instance.advertise_id, view_count__gt=0).update(view_count=F('view_count') - 1)
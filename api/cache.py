@@ -0,0 +1,81 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+CATALOG_CACHE = 'catalog'
+TAG_PREFIX = 'tag:'
+RESPONSE_PREFIX = 'response:'
+
+
+def visibility(request):
+    """
+    The class of users that see the same representation of a catalog resource.
+    """
+    user = request.user
+    if not user or not user.is_authenticated:
+        return 'anon'
+    return 'superuser' if user.is_superuser else 'auth'
+
+
+def tag_versions(cache, tags):
+    """
+    Current version of every tag, starting the ones the cache does not know yet.
+
+    Versions are timestamps rather than counters, so a tag evicted from the cache and started
+    again never matches a version an older response was stored under.
+    """
+    keys = [TAG_PREFIX + tag for tag in tags]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def response_key(request, view, versions):
+    raw = f"{view.basename}:{view.action}:{sorted(view.kwargs.items())}:{sorted(request.query_params.lists())}:" \
+          f"{visibility(request)}:{request.build_absolute_uri('/')}:{versions}"
+    return RESPONSE_PREFIX + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def bump(*tags):
+    """
+    Invalidate every response cached under any of ``tags`` once the current transaction commits.
+    """
+    def invalidate():
+        caches[CATALOG_CACHE].set_many({TAG_PREFIX + tag: time.time_ns() for tag in tags}, timeout=None)
+
+    if tags:
+        transaction.on_commit(invalidate)
+
+
+def cached_response(*tags):
+    """
+    Cache the data of successful responses of a viewset action in the ``catalog`` cache.
+
+    Responses are keyed by endpoint, URL kwargs, query parameters and ``visibility``. ``tags`` are
+    format strings filled with the URL kwargs, e.g. ``'movie:{pk}'``; ``bump`` on any of them
+    invalidates the responses stored under it.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(view, request, *args, **kwargs):
+            cache = caches[CATALOG_CACHE]
+            key = response_key(request, view, tag_versions(cache, [tag.format(**view.kwargs) for tag in tags]))
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+
+            response = func(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,109 @@
+"""
+Write-behind increments of the rollup rows (``DailyRollup``, ``EventRollup``).
+
+Every view and ad impression counts on today's row of its metric and on the hour's row for all
+subjects; updated in the request's transaction, those few rows serialize every such request.
+Instead the increments are added up per process once the transaction commits and applied every
+``COUNTER_FLUSH_INTERVAL`` seconds, one update per row. Increments of a process that dies before
+flushing are lost; ``backfill_daily_rollups`` and ``backfill_event_rollups`` recompute them.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction, close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    """
+    Pending deltas by ``(model label, key)``, applied with ``model.add(*key, delta)``.
+    """
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self.pending = Counter()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+
+    def add(self, model, *key, delta=1):
+        with self.lock:
+            self.pending[model._meta.label, key] += delta
+        self.start()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, Counter()
+            try:
+                with transaction.atomic():
+                    # A fixed order keeps concurrent flushes of several processes from deadlocking.
+                    for (label, key), delta in sorted(pending.items()):
+                        if delta:
+                            apps.get_model(label).add(*key, delta)
+            except Exception:
+                with self.lock:
+                    self.pending.update(pending)
+                raise
+            return len(pending)
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='counter-flusher', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Counter flush failed, %s rows kept for the next one", len(self.pending))
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """
+    The buffer of this process, created on first use (again after a fork).
+    """
+    global _buffer
+    if _buffer is None or _buffer.pid != os.getpid():
+        with _buffer_lock:
+            if _buffer is None or _buffer.pid != os.getpid():
+                buffer = CounterBuffer(settings.COUNTER_FLUSH_INTERVAL)
+                atexit.register(flush_at_exit, buffer)
+                _buffer = buffer
+    return _buffer
+
+
+def flush_at_exit(buffer):
+    try:
+        buffer.flush()
+    except Exception:
+        logger.exception("Counter flush at exit failed")
+
+
+def add(model, *key):
+    """
+    Count one event on the ``model`` row ``key`` once the current transaction commits, or right
+    away in it when ``COUNTER_FLUSH_INTERVAL`` is 0.
+    """
+    if not settings.COUNTER_FLUSH_INTERVAL:
+        model.add(*key, 1)
+        return
+    transaction.on_commit(lambda: get_buffer().add(model, *key))
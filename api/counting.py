@@ -0,0 +1,113 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from api.models import RowCount
+
+
+def exact_count(queryset):
+    return queryset.count(), False
+
+
+def signature(queryset):
+    sql, params = queryset.query.sql_with_params()
+    return 'count:' + hashlib.sha256(f"{sql}:{params!r}".encode()).hexdigest()
+
+
+def cached_count(queryset):
+    """
+    Exact count cached per SQL signature for ``PAGINATION_COUNT_TTL`` seconds; a cached count may be stale.
+    """
+    cache = caches[settings.PAGINATION_COUNT_CACHE]
+    key = signature(queryset)
+    count = cache.get(key)
+    if count is not None:
+        return count, True
+    count = queryset.count()
+    cache.set(key, count, settings.PAGINATION_COUNT_TTL)
+    return count, False
+
+
+def is_unfiltered(queryset):
+    query = queryset.query
+    return not query.where and not query.distinct and query.low_mark == 0 and query.high_mark is None
+
+
+def planner_estimate(queryset):
+    """
+    Row estimate of the PostgreSQL planner for the queryset, without running it.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+def counter_table_count(queryset):
+    """
+    Count of an unfiltered queryset from ``RowCount``, recounted once older than the refresh interval.
+
+    Counter rows are created by the first write to their table or by the ``refresh_row_counts``
+    command; without one the table is counted, and nothing is written while serving a page.
+    """
+    label = queryset.model._meta.label
+    counter = RowCount.objects.filter(label=label).first()
+    if counter is None:
+        return queryset.model._default_manager.count(), False
+
+    stale = timezone.now() - timedelta(seconds=settings.PAGINATION_ROW_COUNT_REFRESH)
+    if counter.counted_at >= stale:
+        return counter.count, True
+    count = queryset.model._default_manager.count()
+    RowCount.objects.filter(pk=counter.pk).update(count=count, counted_at=timezone.now())
+    return count, False
+
+
+def estimated_count(queryset):
+    """
+    Planner estimates on PostgreSQL when they are large enough to matter and counter rows on SQLite
+    for unfiltered lists; everything else falls back to ``cached_count``.
+    """
+    if connection.vendor == 'postgresql':
+        estimate = planner_estimate(queryset)
+        if estimate >= settings.PAGINATION_ESTIMATE_THRESHOLD:
+            return estimate, True
+    elif connection.vendor == 'sqlite' and is_unfiltered(queryset) and \
+            queryset.model._meta.label in settings.PAGINATION_COUNTED_MODELS:
+        return counter_table_count(queryset)
+    return cached_count(queryset)
+
+
+COUNT_STRATEGIES = {
+    'exact': exact_count,
+    'cached': cached_count,
+    'estimated': estimated_count,
+}
+
+
+class CountingPaginator(Paginator):
+    """
+    ``Paginator`` whose count comes from one of ``COUNT_STRATEGIES`` and records whether it is approximate.
+    """
+
+    def __init__(self, *args, count_strategy='exact', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_strategy = count_strategy
+        self.count_is_approximate = False
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        count, self.count_is_approximate = COUNT_STRATEGIES[self.count_strategy](self.object_list)
+        return count
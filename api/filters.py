@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.db.models import Case, When
+from rest_framework.filters import SearchFilter
+
+from movie.search import backend, search, index_exists
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    ``?search=`` backed by the full-text index of ``view.search_kind``, ranked by relevance.
+
+    Every term matches as a prefix. Only the best ``SEARCH_MAX_RESULTS`` matches are returned;
+    when a search reaches that many, ``view.search_capped`` is set and the paginated response
+    reports ``count_is_capped``. Databases without a full-text backend, or whose index was not
+    created yet, fall back to ``SearchFilter`` over ``view.search_fields``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if backend() is None or not index_exists(view.search_kind):
+            return super().filter_queryset(request, queryset, view)
+
+        query = request.query_params.get(self.search_param, '')
+        if not self.get_search_terms(request):
+            return queryset
+
+        pks = search(view.search_kind, query, settings.SEARCH_MAX_RESULTS)
+        view.search_capped = len(pks) >= settings.SEARCH_MAX_RESULTS
+        if not pks:
+            return queryset.none()
+        return queryset.filter(pk__in=pks).order_by(Case(*[When(pk=pk, then=rank) for rank, pk in enumerate(pks)]))
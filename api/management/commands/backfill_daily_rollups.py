@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from api.rollups import backfill
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily dashboard rollups from the users, views, subscriptions and ad impressions."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"DailyRollup: {backfill()} rows written")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.timeseries import backfill
+
+
+class Command(BaseCommand):
+    help = "Rebuild the hourly view and ad impression rollups behind the dashboard time series."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of rows inserted per batch.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"EventRollup: {backfill(options['batch_size'])} rows written")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from advertise.models import Advertise, AdvertiseSeen
+from plan.models import Plan, Subscription
+
+
+def counted(model, field):
+    return Coalesce(Subquery(model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+                             .annotate(count=Count('pk')).values('count')), 0)
+
+
+class Command(BaseCommand):
+    help = "Recompute the subscription count of every plan and the view count of every advertise."
+
+    def handle(self, *args, **options):
+        plans = Plan.objects.update(subscription_count=counted(Subscription, 'plan'))
+        self.stdout.write(f"Plan: {plans} rows updated")
+        advertises = Advertise.objects.update(view_count=counted(AdvertiseSeen, 'advertise'))
+        self.stdout.write(f"Advertise: {advertises} rows updated")
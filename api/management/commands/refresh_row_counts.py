@@ -0,0 +1,13 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.models import RowCount
+
+
+class Command(BaseCommand):
+    help = "Count the tables of PAGINATION_COUNTED_MODELS into their RowCount rows; run once on deploy."
+
+    def handle(self, *args, **options):
+        for label in settings.PAGINATION_COUNTED_MODELS:
+            self.stdout.write(f"{label}: {RowCount.refresh(apps.get_model(label))} rows")
@@ -0,0 +1,63 @@
+import logging
+
+from django.conf import settings
+
+from api.queries import QueryRecorder, check_budget
+
+logger = logging.getLogger(__name__)
+
+
+def view_budget(view_func, method):
+    """
+    The query budget a view declares for ``method``.
+
+    Views set ``query_budget`` for every action, or ``query_budgets`` mapping action names
+    (``list``, ``retrieve``, extra actions...) to budgets.
+    """
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return None
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower())
+    budgets = getattr(view_class, 'query_budgets', {})
+    if action in budgets:
+        return budgets[action]
+    return getattr(view_class, 'query_budget', None)
+
+
+class QueryBudgetMiddleware:
+    """
+    Records the queries of every request: count, total time and SQL run more than once.
+
+    The figures go to the log (warning when the view's budget is exceeded) and, with DEBUG,
+    to the ``X-Query-Stats`` header. With QUERY_BUDGET_STRICT an exceeded budget raises, which
+    the budget tests in ``api.tests`` switch on.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request.query_budget = None
+        with recorder.record():
+            response = self.get_response(request)
+
+        label = f"{request.method} {request.path}"
+        budget = request.query_budget
+        if budget is not None and recorder.count > budget:
+            logger.warning("%s ran %s, over its budget of %s", label, recorder.summary(), budget)
+            for sql, times in recorder.duplicates.items():
+                logger.warning("%s ran %sx: %s", label, times, sql)
+            if settings.QUERY_BUDGET_STRICT:
+                check_budget(recorder, budget, label)
+        else:
+            logger.debug("%s ran %s", label, recorder.summary())
+
+        if settings.DEBUG:
+            response['X-Query-Stats'] = f"count={recorder.count}; time={recorder.duration * 1000:.1f}ms; " \
+                                        f"duplicates={len(recorder.duplicates)}"
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = view_budget(view_func, request.method)
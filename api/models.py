@@ -1,3 +1,100 @@
 from django.db import models
+from django.utils import timezone
+
 
 # Create your models here.
+class ResourceVersion(models.Model):
+    """
+    Version stamp of a catalog resource such as ``series:12``, bumped on every write that changes
+    its representation and sent to clients as its ETag and Last-Modified.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def current(cls, key):
+        return cls.objects.get_or_create(key=key)[0]
+
+    @classmethod
+    def bump(cls, *keys):
+        if not keys:
+            return
+        now = timezone.now()
+        existing = set(cls.objects.filter(key__in=keys).values_list('key', flat=True))
+        cls.objects.filter(key__in=existing).update(version=models.F('version') + 1, updated_at=now)
+        cls.objects.bulk_create([cls(key=key, updated_at=now) for key in set(keys) - existing], ignore_conflicts=True)
+
+
+class RowCount(models.Model):
+    """
+    Row count of a table kept up to date by signals, for databases without planner estimates.
+
+    ``counted_at`` is the last exact count; the counter is recounted once it gets older than
+    ``PAGINATION_ROW_COUNT_REFRESH`` so bulk writes that bypass signals cannot drift it for long.
+    """
+    label = models.CharField(max_length=100, unique=True)
+    count = models.BigIntegerField()
+    counted_at = models.DateTimeField()
+
+    @classmethod
+    def adjust(cls, model, delta):
+        """
+        Move the counter of ``model`` by ``delta``; its first write counts the table instead.
+        """
+        if not cls.objects.filter(label=model._meta.label).update(count=models.F('count') + delta):
+            cls.refresh(model)
+
+    @classmethod
+    def refresh(cls, model):
+        count = model._default_manager.count()
+        cls.objects.update_or_create(label=model._meta.label, defaults={'count': count, 'counted_at': timezone.now()})
+        return count
+
+
+class DailyRollup(models.Model):
+    """
+    Change of a dashboard metric on one day, kept up to date by signals (``api.rollups``).
+
+    Summing a metric's rows up to a day gives its value on that day: sign-ups, views and ad
+    impressions only add up, active subscriptions count +1 on the day they start and -1 the
+    day after they end.
+    """
+    metric = models.CharField(max_length=30)
+    day = models.DateField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'day'], name='unique_daily_rollup'),
+        ]
+
+    @classmethod
+    def add(cls, metric, day, delta):
+        if not cls.objects.filter(metric=metric, day=day).update(count=models.F('count') + delta):
+            _, created = cls.objects.get_or_create(metric=metric, day=day, defaults={'count': delta})
+            if not created:
+                cls.objects.filter(metric=metric, day=day).update(count=models.F('count') + delta)
+
+
+class EventRollup(models.Model):
+    """
+    Number of view or ad impression events in one hour, for one media or advertise (``subject``)
+    or for all of them (``subject`` 0), kept up to date by signals (``api.timeseries``).
+    """
+    kind = models.CharField(max_length=20)
+    subject = models.BigIntegerField(default=0)
+    hour = models.DateTimeField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'subject', 'hour'], name='unique_event_rollup'),
+        ]
+
+    @classmethod
+    def add(cls, kind, subject, hour, delta):
+        if not cls.objects.filter(kind=kind, subject=subject, hour=hour).update(count=models.F('count') + delta):
+            _, created = cls.objects.get_or_create(kind=kind, subject=subject, hour=hour, defaults={'count': delta})
+            if not created:
+                cls.objects.filter(kind=kind, subject=subject, hour=hour).update(count=models.F('count') + delta)
@@ -1,14 +1,198 @@
-from rest_framework.pagination import PageNumberPagination
+import datetime
+import json
+import operator
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce, partial
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination, BasePagination
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+from api.counting import CountingPaginator
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Keeps the microseconds ``DjangoJSONEncoder`` drops, a cursor has to match its row exactly.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks past the last row of a page instead of using OFFSET.
+
+    The keyset is the queryset's own ``order_by`` (any number of fields, annotations and joined
+    fields included) with the primary key appended as tie-breaker, so the order is total and
+    stable under inserts. Cursors are opaque and the total count is only run on ``?count=true``.
+    Ordering fields must not be NULL.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    unsupported_ordering_message = 'This ordering cannot be paginated with a cursor, use page numbers.'
+
+    @staticmethod
+    def ordering(queryset):
+        return list(queryset.query.order_by) or list(queryset.model._meta.ordering) or ['-pk']
+
+    @classmethod
+    def supports(cls, queryset):
+        """
+        Whether the queryset is ordered by field names only; expressions such as search ranks have no keyset.
+        """
+        return all(isinstance(field, str) for field in cls.ordering(queryset))
+
+    def keyset(self, queryset):
+        """
+        ``(field, descending)`` pairs the queryset is ordered by, ending with the primary key.
+        """
+        if not self.supports(queryset):
+            raise ValidationError(self.unsupported_ordering_message)
+        keys = [(field.lstrip('-'), field.startswith('-')) for field in self.ordering(queryset)]
+        if keys[-1][0] not in ('pk', queryset.model._meta.pk.attname):
+            keys.append(('pk', keys[-1][1]))
+        return keys
+
+    @staticmethod
+    def seek(keys, values, backwards):
+        """
+        Rows strictly after ``values`` in keyset order, or strictly before them when ``backwards``.
+        """
+        conditions, equal = [], Q()
+        for index, ((_, descending), value) in enumerate(zip(keys, values)):
+            lookup = 'lt' if descending != backwards else 'gt'
+            conditions.append(equal & Q(**{f'keyset_{index}__{lookup}': value}))
+            equal &= Q(**{f'keyset_{index}': value})
+        return reduce(operator.or_, conditions)
+
+    def encode_cursor(self, values, backwards):
+        payload = json.dumps({'v': values, 'b': backwards}, cls=CursorEncoder, separators=(',', ':'))
+        return urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            return list(payload['v']), bool(payload['b'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        keys = self.keyset(queryset)
+        values, backwards = self.decode_cursor(request)
+        if values is not None and len(values) != len(keys):
+            raise NotFound(self.invalid_cursor_message)
+
+        self.count = queryset.count() if request.query_params.get(self.count_query_param, '').lower() in TRUE_VALUES \
+            else None
+
+        keyed = queryset.annotate(**{f'keyset_{index}': F(field) for index, (field, _) in enumerate(keys)})
+        if values is not None:
+            keyed = keyed.filter(self.seek(keys, values, backwards))
+        keyed = keyed.order_by(*[f"{'-' if descending != backwards else ''}keyset_{index}"
+                                 for index, (_, descending) in enumerate(keys)])
+
+        rows = list(keyed[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+
+        self.has_next = has_more if not backwards else True
+        self.has_previous = values is not None if not backwards else has_more
+        self.first = [getattr(rows[0], f'keyset_{index}') for index in range(len(keys))] if rows else None
+        self.last = [getattr(rows[-1], f'keyset_{index}') for index in range(len(keys))] if rows else None
+        return rows
+
+    def get_link(self, values, backwards):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values, backwards))
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.get_link(self.last, False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first is None:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.get_link(self.first, True)
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response['count'] = self.count
+        return Response(response)
 
 
 class CustomPageNumberPagination(PageNumberPagination):
+    """
+    Page number pagination that switches to ``KeysetPagination`` for ``?pagination=keyset`` or
+    whenever a cursor is given, unless the queryset is ordered by an expression (search results).
+    Views can also make keyset the default with ``pagination_class``.
+
+    The total count comes from the view's ``count_strategy``, one of ``api.counting.COUNT_STRATEGIES``.
+    ``count_is_capped`` tells when it stops at the ``SEARCH_MAX_RESULTS`` a full-text search returns.
+    """
     page_size_query_param = 'page_size'
     max_page_size = 1000
+    mode_query_param = 'pagination'
+    keyset = None
+    count_strategy = 'exact'
+    count_is_capped = False
+
+    @property
+    def django_paginator_class(self):
+        return partial(CountingPaginator, count_strategy=self.count_strategy)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (request.query_params.get(self.mode_query_param) == 'keyset' or
+                KeysetPagination.cursor_query_param in request.query_params) and KeysetPagination.supports(queryset):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.count_strategy = getattr(view, 'count_strategy', self.count_strategy)
+        self.count_is_capped = getattr(view, 'search_capped', False)
+        return super().paginate_queryset(queryset, request, view)
 
     def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
         return Response({
             'count': self.page.paginator.count,
+            'count_is_approximate': self.page.paginator.count_is_approximate,
+            'count_is_capped': self.count_is_capped,
             'total_pages': self.page.paginator.num_pages,
             'results': data,
         })
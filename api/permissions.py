@@ -1,6 +1,9 @@
+from django.db.models import Q
+from django.utils import timezone
 from rest_framework import permissions
 
-from movie.models import Collection
+from movie.models import Collection, Media, Movie
+from plan.models import Subscription
 from user.models import User
 
 
@@ -25,3 +28,33 @@ class CollectionRetrievePermission(permissions.BasePermission):
             return request.user == obj.user
 
         return request.user.is_superuser
+
+
+class CanPlay(permissions.BasePermission):
+    """
+    Playback of a ``Movie`` or ``Episode``: subscription media needs an active subscription.
+    Unpublished media is hidden from non-superusers by ``published`` instead.
+    """
+    message = 'An active subscription is required to play this title.'
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated)
+
+    def has_object_permission(self, request, view, obj):
+        media = obj.media if isinstance(obj, Movie) else obj.season.series.media
+        if request.user.is_superuser or media.value != Media.MediaType.SUBSCRIPTION:
+            return True
+        return Subscription.objects.filter(user=request.user, end_date__gt=timezone.now()).exists()
+
+    @staticmethod
+    def published(queryset, user):
+        """
+        ``queryset`` of movies or episodes without the ones not released yet, unless ``user`` is a superuser.
+        """
+        if user.is_superuser:
+            return queryset
+        now = timezone.now()
+        if queryset.model is Movie:
+            return queryset.filter(media__release_date__lte=now)
+        return queryset.filter(Q(publication_date__lte=now), Q(season__publication_date__lte=now),
+                               Q(season__series__media__release_date__lte=now))
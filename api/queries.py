@@ -0,0 +1,72 @@
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+
+class QueryRecorder:
+    """
+    ``execute_wrapper`` that records the SQL and duration of every query run while it is installed.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @contextmanager
+    def record(self, aliases=None):
+        with ExitStack() as stack:
+            for alias in aliases or connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    @property
+    def duplicates(self):
+        """
+        ``{sql: times}`` of the statements run more than once, parameters aside: the usual sign of an N+1.
+        """
+        counts = Counter(sql for sql, _ in self.queries)
+        return {sql: times for sql, times in counts.items() if times > 1}
+
+    def summary(self):
+        return f"{self.count} queries in {self.duration * 1000:.1f}ms, {len(self.duplicates)} duplicated"
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def check_budget(recorder, budget, label):
+    if budget is not None and recorder.count > budget:
+        duplicated = '\n'.join(f"  {times}x {sql}" for sql, times in recorder.duplicates.items())
+        raise QueryBudgetExceeded(f"{label} ran {recorder.summary()}, over its budget of {budget}."
+                                  + (f"\nDuplicated:\n{duplicated}" if duplicated else ''))
+
+
+@contextmanager
+def query_budget(budget, label='Block'):
+    """
+    Fail the test when the block runs more than ``budget`` queries::
+
+        with query_budget(6):
+            self.client.get(reverse('dashboard-recently_comment'))
+    """
+    recorder = QueryRecorder()
+    with recorder.record():
+        yield recorder
+    check_budget(recorder, budget, label)
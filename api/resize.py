@@ -0,0 +1,144 @@
+import hashlib
+import os
+import threading
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files import locks
+
+FITS = ('cover', 'contain')
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+
+
+def within(path, directories):
+    return any(os.path.commonpath([path, directory]) == directory for directory in directories)
+
+
+def resolve_source(path):
+    """
+    Absolute path of a public media image, or None when ``path`` is not an image inside one of
+    the ``IMAGE_RESIZE_DIRECTORIES`` of ``MEDIA_ROOT``.
+    """
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    source = os.path.realpath(os.path.join(media_root, path))
+    public = [os.path.join(media_root, directory) for directory in settings.IMAGE_RESIZE_DIRECTORIES]
+    private = [os.path.join(media_root, directory) for directory in settings.IMAGE_RESIZE_PRIVATE_DIRECTORIES]
+    if not within(source, public) or within(source, private):
+        return None
+    if not source.lower().endswith(SOURCE_EXTENSIONS) or not os.path.isfile(source):
+        return None
+    return source
+
+
+def render(source, width, height, fit, image_format):
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if fit == 'cover':
+            image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        else:
+            image = ImageOps.contain(image, (width, height), Image.LANCZOS)
+
+    if image_format == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+
+    buffer = BytesIO()
+    image.save(buffer, format=FORMATS[image_format][0], quality=settings.IMAGE_DERIVATIVE_QUALITY)
+    return buffer.getvalue()
+
+
+class ResizeCache:
+    """
+    Size-bounded disk cache of resized images with least-recently-used eviction.
+
+    Recency is the file mtime, refreshed on every hit. Renders of the same derivative are
+    collapsed with a lock file, which serializes threads and worker processes alike.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = None
+        self.size_lock = threading.Lock()
+
+    def path(self, source, width, height, fit, image_format):
+        stat = os.stat(source)
+        key = hashlib.sha256(f"{source}:{stat.st_mtime_ns}:{width}x{height}:{fit}".encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], f"{key}.{image_format}")
+
+    def get(self, source, width, height, fit, image_format):
+        path = self.path(source, width, height, fit, image_format)
+        if self.touch(path):
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.lock", 'wb') as lock_file:
+            locks.lock(lock_file, locks.LOCK_EX)
+            try:
+                if self.touch(path):
+                    return path
+                data = render(source, width, height, fit, image_format)
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            finally:
+                locks.unlock(lock_file)
+
+        self.account(len(data))
+        return path
+
+    @staticmethod
+    def touch(path):
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(tuple(f".{image_format}" for image_format in FORMATS)):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def account(self, size):
+        with self.size_lock:
+            if self.size is None:
+                self.size = sum(entry_size for _, entry_size, _ in self.entries())
+            else:
+                self.size += size
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """
+        Drop the least recently used entries until the cache is back under 90% of its bound.
+        """
+        entries = sorted(self.entries())
+        self.size = sum(entry_size for _, entry_size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, entry_size, path in entries:
+            if self.size <= target:
+                break
+            for stale in (path, f"{path}.lock"):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+            self.size -= entry_size
+
+
+resize_cache = ResizeCache(settings.IMAGE_RESIZE_CACHE_DIR, settings.IMAGE_RESIZE_CACHE_MAX_BYTES)
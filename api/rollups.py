@@ -0,0 +1,93 @@
+from collections import defaultdict, Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Sum, Q, Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from advertise.models import AdvertiseSeen
+from api.models import DailyRollup
+from movie.models import SeenMedia
+from plan.models import Subscription
+from user.models import User
+
+SIGNUPS = 'signups'
+VIEWS = 'views'
+AD_IMPRESSIONS = 'ad_impressions'
+SUBSCRIPTIONS = 'subscriptions'
+
+# Metrics that count rows of a model, by the field holding the day they count on.
+EVENT_METRICS = {
+    SIGNUPS: (User, 'date_joined'),
+    VIEWS: (SeenMedia, 'created_at'),
+    AD_IMPRESSIONS: (AdvertiseSeen, 'created_at'),
+}
+
+
+def day_of(value):
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+def subscription_days(subscription):
+    """
+    The day a subscription starts counting as active and the day it stops.
+    """
+    return day_of(subscription.created_at), day_of(subscription.end_date) + timedelta(days=1)
+
+
+def record(metric, when, delta=1):
+    DailyRollup.add(metric, day_of(when), delta)
+
+
+def record_many(metric, whens):
+    """
+    Count an event at each of ``whens``, with one update per day.
+    """
+    for day, count in Counter(day_of(when) for when in whens).items():
+        DailyRollup.add(metric, day, count)
+
+
+def record_subscription(subscription, delta=1):
+    start, stop = subscription_days(subscription)
+    DailyRollup.add(SUBSCRIPTIONS, start, delta)
+    DailyRollup.add(SUBSCRIPTIONS, stop, -delta)
+
+
+def header_totals(days=7):
+    """
+    Every metric today and ``days`` ago, from one aggregate over the rollup rows.
+
+    Days are whole days: a subscription still counts as active on the day it ends.
+    """
+    today = timezone.localdate()
+    before = today - timedelta(days=days)
+    totals = {}
+    for metric in (SIGNUPS, VIEWS, AD_IMPRESSIONS, SUBSCRIPTIONS):
+        totals[f'{metric}_total'] = Sum('count', filter=Q(metric=metric, day__lte=today), default=0)
+        totals[f'{metric}_old'] = Sum('count', filter=Q(metric=metric, day__lte=before), default=0)
+    return DailyRollup.objects.aggregate(**totals)
+
+
+def backfill():
+    """
+    Rebuild every rollup row from the source tables.
+
+    Rows written by signals while this runs may be counted twice or not at all; run it when
+    traffic is low and again if the numbers look off.
+    """
+    counts = defaultdict(int)
+    for metric, (model, field) in EVENT_METRICS.items():
+        for row in model.objects.order_by().annotate(day=TruncDate(field)).values('day').annotate(count=Count('pk')):
+            counts[metric, row['day']] += row['count']
+
+    for field, sign, shift in (('created_at', 1, 0), ('end_date', -1, 1)):
+        for row in Subscription.objects.order_by().annotate(day=TruncDate(field)).values('day') \
+                .annotate(count=Count('pk')):
+            counts[SUBSCRIPTIONS, row['day'] + timedelta(days=shift)] += sign * row['count']
+
+    rows = [DailyRollup(metric=metric, day=day, count=count) for (metric, day), count in counts.items() if count]
+    with transaction.atomic():
+        DailyRollup.objects.all().delete()
+        DailyRollup.objects.bulk_create(rows)
+    return len(rows)
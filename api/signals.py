@@ -0,0 +1,230 @@
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from advertise.models import AdvertiseSeen
+from api import rollups, timeseries, counters
+from api.cache import bump
+from api.conditional import CATALOG_KEY
+from api.models import ResourceVersion, RowCount, DailyRollup, EventRollup
+from movie.models import Media, Slider, Collection, Comment, Cast, MediaGallery, Movie, TvSeries, Season, Episode, \
+    MediaFile, Genre, Country, Artist, SeenMedia, ProcessingJob
+from movie.heartbeat import sessions_started
+from movie.jobs import job_finished
+from movie.ratings import rating_changed
+from plan.models import Subscription
+
+
+def touch(*keys):
+    """
+    Invalidate the cached responses of resources and bump their version stamps.
+    """
+    bump(*keys)
+    ResourceVersion.bump(*keys)
+
+
+def detail_keys(media_ids):
+    """
+    Keys of the movie and series detail resources that embed any of ``media_ids``.
+    """
+    keys = [f"movie:{pk}" for pk in Movie.objects.filter(media_id__in=media_ids).values_list('pk', flat=True)]
+    keys += [f"series:{pk}" for pk in TvSeries.objects.filter(media_id__in=media_ids).values_list('pk', flat=True)]
+    return keys
+
+
+@receiver(post_save, sender=Media)
+@receiver(post_delete, sender=Media)
+def invalidate_media(sender, instance, **kwargs):
+    bump('slider')
+    touch(*detail_keys([instance.pk]))
+
+
+@receiver(post_save, sender=Slider)
+@receiver(post_delete, sender=Slider)
+def invalidate_slider(sender, instance, **kwargs):
+    bump('slider')
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def invalidate_collection(sender, instance, **kwargs):
+    bump('collection')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Cast)
+@receiver(post_delete, sender=Cast)
+@receiver(post_save, sender=MediaGallery)
+@receiver(post_delete, sender=MediaGallery)
+def invalidate_media_relation(sender, instance, **kwargs):
+    keys = detail_keys([instance.media_id])
+    if instance.episode_id is not None:
+        keys.append(f"episode:{instance.episode_id}")
+    touch(*keys)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def invalidate_movie(sender, instance, **kwargs):
+    touch(f"movie:{instance.pk}")
+
+
+@receiver(post_save, sender=TvSeries)
+@receiver(post_delete, sender=TvSeries)
+def invalidate_series(sender, instance, **kwargs):
+    touch(f"series:{instance.pk}")
+
+
+@receiver(post_save, sender=Season)
+@receiver(post_delete, sender=Season)
+def invalidate_season(sender, instance, **kwargs):
+    touch(f"season:{instance.pk}", f"series:{instance.series_id}")
+
+
+@receiver(post_save, sender=Episode)
+@receiver(post_delete, sender=Episode)
+def invalidate_episode(sender, instance, **kwargs):
+    touch(f"episode:{instance.pk}", f"season:{instance.season_id}")
+
+
+def media_file_keys(media_file_id):
+    """
+    Keys of the resources that embed a media file.
+    """
+    media_ids = Media.objects.filter(Q(trailer=media_file_id) | Q(movie__video=media_file_id) |
+                                     Q(mediagallery__file=media_file_id)).values_list('pk', flat=True)
+    episode_ids = Episode.objects.filter(Q(video=media_file_id) | Q(trailer=media_file_id) |
+                                         Q(mediagallery__file=media_file_id)).values_list('pk', flat=True)
+    return detail_keys(list(media_ids)) + [f"episode:{pk}" for pk in episode_ids]
+
+
+@receiver(post_save, sender=MediaFile)
+def invalidate_media_file(sender, instance, **kwargs):
+    if not instance.is_complete:
+        return
+    touch(*media_file_keys(instance.pk))
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+@receiver(post_save, sender=Artist)
+@receiver(post_delete, sender=Artist)
+def invalidate_catalog(sender, instance, **kwargs):
+    touch(CATALOG_KEY)
+
+
+# Receivers invalidating what shows an object's images, by the model holding them.
+IMAGE_INVALIDATORS = {
+    Media: invalidate_media,
+    Slider: invalidate_slider,
+    Collection: invalidate_collection,
+    Season: invalidate_season,
+    Episode: invalidate_episode,
+    Genre: invalidate_catalog,
+    Country: invalidate_catalog,
+    Artist: invalidate_catalog,
+}
+
+
+@receiver(job_finished, sender=ProcessingJob)
+def invalidate_processed(sender, job, **kwargs):
+    """
+    Jobs write derivative images and ``processing_state`` without save signals; their results
+    show up in srcsets and media file representations.
+    """
+    if job.media_file_id is not None:
+        touch(*media_file_keys(job.media_file_id))
+    if job.kind == ProcessingJob.JobKind.IMAGE_DERIVATIVES:
+        model = apps.get_model(job.payload['model'])
+        instance = model.objects.filter(pk=job.payload['pk']).first()
+        if instance is not None and model in IMAGE_INVALIDATORS:
+            IMAGE_INVALIDATORS[model](model, instance)
+
+
+@receiver(rating_changed, sender=Media)
+def invalidate_media_rating(sender, pk, **kwargs):
+    touch(*detail_keys([pk]))
+
+
+@receiver(rating_changed, sender=Episode)
+def invalidate_episode_rating(sender, pk, **kwargs):
+    touch(f"episode:{pk}")
+
+
+def count_created(sender, instance, created, **kwargs):
+    if created and connection.vendor == 'sqlite':
+        RowCount.adjust(sender, 1)
+
+
+def count_deleted(sender, instance, **kwargs):
+    if connection.vendor == 'sqlite':
+        RowCount.adjust(sender, -1)
+
+
+for label in settings.PAGINATION_COUNTED_MODELS:
+    post_save.connect(count_created, sender=apps.get_model(label))
+    post_delete.connect(count_deleted, sender=apps.get_model(label))
+
+
+def rollup_created(sender, instance, created, **kwargs):
+    if created:
+        metric, field = ROLLUP_METRICS[sender]
+        counters.add(DailyRollup, metric, rollups.day_of(getattr(instance, field)))
+
+
+def rollup_deleted(sender, instance, **kwargs):
+    metric, field = ROLLUP_METRICS[sender]
+    rollups.record(metric, getattr(instance, field), -1)
+
+
+ROLLUP_METRICS = {model: (metric, field) for metric, (model, field) in rollups.EVENT_METRICS.items()}
+for model in ROLLUP_METRICS:
+    post_save.connect(rollup_created, sender=model)
+    post_delete.connect(rollup_deleted, sender=model)
+
+
+@receiver(pre_save, sender=Subscription)
+def remember_subscription_days(sender, instance, **kwargs):
+    instance.previous_rollup = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Subscription)
+def rollup_subscription(sender, instance, **kwargs):
+    previous = getattr(instance, 'previous_rollup', None)
+    if previous is not None:
+        if rollups.subscription_days(previous) == rollups.subscription_days(instance):
+            return
+        rollups.record_subscription(previous, -1)
+    rollups.record_subscription(instance)
+
+
+@receiver(post_delete, sender=Subscription)
+def rollup_subscription_deleted(sender, instance, **kwargs):
+    rollups.record_subscription(instance, -1)
+
+
+def record_event(sender, instance, created, **kwargs):
+    if created:
+        for row in timeseries.rows(instance):
+            counters.add(EventRollup, *row)
+
+
+def forget_event(sender, instance, **kwargs):
+    timeseries.record(instance, -1)
+
+
+for model in (SeenMedia, AdvertiseSeen):
+    post_save.connect(record_event, sender=model)
+    post_delete.connect(forget_event, sender=model)
+
+
+@receiver(sessions_started, sender=SeenMedia)
+def record_sessions(sender, instances, **kwargs):
+    rollups.record_many(rollups.VIEWS, [seen.created_at for seen in instances])
+    timeseries.record_views(instances)
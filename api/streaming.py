@@ -0,0 +1,195 @@
+import mmap
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.crypto import get_random_string
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+from rest_framework.negotiation import BaseContentNegotiation
+
+RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+MAX_RANGES = 16
+BLOCK_SIZE = 64 * 1024
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """
+    Media players send all kinds of ``Accept`` headers; the response is raw bytes either way.
+    """
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class RangeFile:
+    """
+    File wrapper that yields at most ``length`` bytes starting at ``start``.
+
+    ``fileno`` is kept so WSGI servers whose ``wsgi.file_wrapper`` uses sendfile(2), such as
+    gunicorn and uWSGI, send the range straight from the page cache: they start at the current
+    file offset and stop after ``Content-Length`` bytes.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range_header(header, size):
+    """
+    Parse a ``Range`` header into a list of inclusive ``(start, end)`` byte ranges.
+
+    Returns None when the header should be ignored, and an empty list when none of the
+    ranges can be satisfied.
+    """
+    unit, _, ranges_spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not ranges_spec:
+        return None
+
+    specs = ranges_spec.split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        match = RANGE_RE.match(spec)
+        if match is None:
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+        elif last:
+            if int(last) == 0:
+                continue
+            start = max(size - int(last), 0)
+            end = size - 1
+        else:
+            return None
+
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+
+    return ranges
+
+
+def file_etag(media_file, stat):
+    if media_file.content_hash:
+        return f'"{media_file.content_hash}"'
+    return f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+
+
+def if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is None:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    modified_since = parse_http_date_safe(if_range)
+    return modified_since is not None and modified_since == last_modified
+
+
+def offload_response(media_file, content_type):
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_STREAM_OFFLOAD == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_STREAM_ACCEL_PREFIX + quote(media_file.file.name)
+    else:
+        response['X-Sendfile'] = media_file.file.path
+    return response
+
+
+def multipart_content(path, ranges, content_type, size, boundary):
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for start, end in ranges:
+            yield (f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+                   f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n").encode()
+            for offset in range(start, end + 1, BLOCK_SIZE):
+                yield mapped[offset:min(offset + BLOCK_SIZE, end + 1)]
+            yield b"\r\n"
+        yield f"--{boundary}--\r\n".encode()
+
+
+def multipart_length(ranges, content_type, size, boundary):
+    length = len(f"--{boundary}--\r\n")
+    for start, end in ranges:
+        length += len(f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+                      f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n")
+        length += end - start + 1 + 2
+    return length
+
+
+def stream_media_file(request, media_file):
+    """
+    Serve a complete ``MediaFile`` with ``Range``/``If-Range`` and ETag support.
+
+    A single range is sent through ``wsgi.file_wrapper`` so capable servers use sendfile(2),
+    several ranges are sent as ``multipart/byteranges`` from a memory map, and when
+    ``MEDIA_STREAM_OFFLOAD`` is set the transfer is handed to the front-end web server.
+    """
+    path = media_file.file.path
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = file_etag(media_file, stat)
+    last_modified = int(stat.st_mtime)
+    content_type = media_file.mimetype or 'application/octet-stream'
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and etag in [tag.removeprefix('W/') for tag in parse_etags(if_none_match)] + ['*']:
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    if settings.MEDIA_STREAM_OFFLOAD:
+        response = offload_response(media_file, content_type)
+    else:
+        ranges = None
+        range_header = request.META.get('HTTP_RANGE')
+        if range_header and if_range_matches(request, etag, last_modified):
+            ranges = parse_range_header(range_header, size)
+
+        if ranges is None:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response['Content-Length'] = size
+        elif not ranges:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            response = FileResponse(RangeFile(open(path, 'rb'), start, end - start + 1), status=206,
+                                    content_type=content_type)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        else:
+            boundary = get_random_string(length=24)
+            response = StreamingHttpResponse(multipart_content(path, ranges, content_type, size, boundary),
+                                             status=206,
+                                             content_type=f"multipart/byteranges; boundary={boundary}")
+            response['Content-Length'] = multipart_length(ranges, content_type, size, boundary)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -1,3 +1,1207 @@
-from django.test import TestCase
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import http_date
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import rollups, timeseries, counters
+from api.cache import CATALOG_CACHE, tag_versions
+from api.counting import counter_table_count
+from api.models import ResourceVersion, RowCount, DailyRollup, EventRollup
+from api.queries import QueryBudgetExceeded, query_budget
+from api.resize import ResizeCache
+from advertise.models import Advertise, AdvertiseSeen
+from api.streaming import parse_range_header, MAX_RANGES
+from movie import jobs, heartbeat, search, autocomplete, ratings, uploads, sweeper
+from movie.models import Media, MediaFile, Movie, ProcessingJob, Slider, TvSeries, Season, Episode, Comment, Cast, \
+    Artist, Genre, Country, MediaGallery, SeenMedia, Rating
+from movie.images import generate_derivatives, record_derivatives, srcset
+from movie.uploads import write_chunk
+from plan.models import Plan, Payment, Subscription
+from user import stats as user_stats
+from user.models import User, UserStats
+
+
+def create_media_file(user, name='file.mp4'):
+    return MediaFile.objects.create(user=user, file=name, uploaded_on=timezone.now(), total_chunk=1,
+                                    is_complete=True)
+
+
+def create_media(user, name):
+    return Media.objects.create(name=name, trailer=create_media_file(user), synopsis=f"About {name}",
+                                thumbnail='thumbnail.jpg', poster='poster.jpg', release_date=timezone.now())
+
+
+def create_movie(user, name):
+    return Movie.objects.create(media=create_media(user, name), video=create_media_file(user, 'video.mp4'), time=90)
+
+
+def create_episode(user, season, number):
+    return Episode.objects.create(season=season, number=number, video=create_media_file(user, 'video.mp4'),
+                                  trailer=create_media_file(user), time=40, thumbnail='thumbnail.jpg',
+                                  poster='poster.jpg', publication_date=timezone.now())
+
+
+class AdminTestCase(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+
+class KeysetPaginationTests(AdminTestCase):
+
+    def test_keyset_walks_every_row_once(self):
+        names = [f"Title {index}" for index in range(5)]
+        for name in names:
+            create_media(self.admin, name)
+
+        seen, params = [], {'pagination': 'keyset', 'page_size': 2}
+        url = reverse('v1:media-list')
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen += [item['name'] for item in response.data['results']]
+            url, params = response.data['next'], None
+
+        self.assertEqual(seen, names[::-1])
+
+
+class ProcessingInvalidationTests(AdminTestCase):
+
+    def run_job(self, kind, **kwargs):
+        job = jobs.enqueue(kind, **kwargs)
+        with mock.patch.dict(jobs.HANDLERS, {kind: lambda job: None}):
+            jobs.run(job.pk)
+
+    def test_finished_media_file_job_bumps_the_movie_version(self):
+        movie = create_movie(self.admin, 'Heat')
+        before = ResourceVersion.current(f"movie:{movie.pk}").version
+
+        self.run_job(ProcessingJob.JobKind.HLS, media_file=movie.video)
+
+        self.assertEqual(MediaFile.objects.get(pk=movie.video_id).processing_state, MediaFile.ProcessingState.READY)
+        self.assertGreater(ResourceVersion.current(f"movie:{movie.pk}").version, before)
+
+    def test_image_derivatives_bump_the_movie_version(self):
+        movie = create_movie(self.admin, 'Heat')
+        before = ResourceVersion.current(f"movie:{movie.pk}").version
+
+        self.run_job(ProcessingJob.JobKind.IMAGE_DERIVATIVES,
+                     payload={'model': 'movie.Media', 'pk': movie.media_id, 'field': 'poster'})
+
+        self.assertGreater(ResourceVersion.current(f"movie:{movie.pk}").version, before)
+
+    def test_image_derivatives_invalidate_cached_sliders(self):
+        slider = Slider.objects.create(media=create_media(self.admin, 'Heat'), description='', title='Heat',
+                                       priority=1, thumbnail='thumbnail.jpg', poster='poster.jpg')
+        cache = caches[CATALOG_CACHE]
+        before = tag_versions(cache, ['slider'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_job(ProcessingJob.JobKind.IMAGE_DERIVATIVES,
+                         payload={'model': 'movie.Slider', 'pk': slider.pk, 'field': 'poster'})
+
+        self.assertNotEqual(tag_versions(cache, ['slider']), before)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(AdminTestCase):
+    """
+    Budgeted endpoints stay within their budget however many rows they show.
+    """
+
+    def create_catalog(self, count):
+        genre = Genre.objects.create(title='Drama', poster='genre.jpg')
+        country = Country.objects.create(name='Iran', flag='flag.jpg')
+        artist = Artist.objects.create(name='Artist', biography='', image='artist.jpg')
+        series = TvSeries.objects.create(media=create_media(self.admin, 'Series'))
+        self.season = Season.objects.create(series=series, number=1, thumbnail='thumbnail.jpg', poster='poster.jpg',
+                                            publication_date=timezone.now())
+        for number in range(count):
+            movie = create_movie(self.admin, f"Movie {number}")
+            movie.media.genres.add(genre)
+            movie.media.countries.add(country)
+            episode = create_episode(self.admin, self.season, number)
+            Cast.objects.create(media=series.media, episode=episode, artist=artist)
+            MediaGallery.objects.create(file=create_media_file(self.admin), media=series.media, episode=episode)
+            Comment.objects.create(user=self.admin, media=series.media, episode=episode, comment='Nice', title='Nice',
+                                   state=Comment.CommentState.ACCEPT)
+            Comment.objects.create(user=self.admin, media=movie.media, comment='Nice', title='Nice')
+
+    def test_budgeted_endpoints(self):
+        self.create_catalog(5)
+        urls = [
+            reverse('v1:dashboard-header'),
+            reverse('v1:dashboard-recently_user'),
+            reverse('v1:dashboard-recently_comment'),
+            reverse('v1:dashboard-popular_plan'),
+            reverse('v1:dashboard-advertise'),
+            reverse('v1:dashboard-views_series'),
+            reverse('v1:dashboard-advertise_series'),
+            reverse('v1:admin-media-movie'),
+            reverse('v1:admin-media-series'),
+            reverse('v1:series-season-episode', args=[self.season.pk]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_stats_header_only_in_debug(self):
+        url = reverse('v1:dashboard-header')
+        self.assertNotIn('X-Query-Stats', self.client.get(url))
+        with self.settings(DEBUG=True):
+            self.assertIn('X-Query-Stats', self.client.get(url))
+
+    def test_query_budget_fails_the_block(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with query_budget(1):
+                list(User.objects.all())
+                list(User.objects.all())
+
+
+class RowCountTests(AdminTestCase):
+
+    def test_first_save_creates_the_counter(self):
+        create_movie(self.admin, 'Heat')
+        create_movie(self.admin, 'Ronin')
+
+        self.assertEqual(RowCount.objects.get(label='movie.Movie').count, 2)
+
+    def test_serving_a_page_writes_nothing(self):
+        create_movie(self.admin, 'Heat')
+        RowCount.objects.all().delete()
+
+        with self.assertNumQueries(2):
+            self.assertEqual(counter_table_count(Movie.objects.all()), (1, False))
+        self.assertFalse(RowCount.objects.exists())
+
+
+class HeartbeatBufferTests(TestCase):
+
+    def setUp(self):
+        spill_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spill_dir.cleanup)
+        self.spill_dir = spill_dir.name
+        self.user = User.objects.create_user('viewer', 'viewer@example.com', 'password')
+        self.movie = create_movie(self.user, 'Heat')
+        series = TvSeries.objects.create(media=create_media(self.user, 'Dark'))
+        season = Season.objects.create(series=series, number=1, thumbnail='thumbnail.jpg', poster='poster.jpg',
+                                       publication_date=timezone.now())
+        self.episodes = [create_episode(self.user, season, number) for number in range(1, 5)]
+
+    def buffer(self, max_streams=100):
+        # The flusher thread never wakes up on its own; the tests flush by hand.
+        return heartbeat.HeartbeatBuffer(self.spill_dir, max_streams, flush_size=1000, flush_interval=3600)
+
+    def test_flush_keeps_the_latest_heartbeat_of_a_stream(self):
+        buffer = self.buffer()
+        buffer.add(self.user.pk, self.movie.pk, None, 10, at=1000.0)
+        buffer.add(self.user.pk, self.movie.pk, None, 30, at=1002.0)
+        buffer.add(self.user.pk, self.movie.pk, None, 20, at=1001.0)
+
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(SeenMedia.objects.get().position, 30)
+        self.assertEqual(os.listdir(self.spill_dir), [])
+
+    def test_flush_counts_new_sessions(self):
+        buffer = self.buffer()
+        buffer.add(self.user.pk, self.movie.pk, None, 10)
+        for episode in self.episodes:
+            buffer.add(self.user.pk, None, episode.pk, 10)
+        buffer.flush()
+
+        self.assertEqual(UserStats.objects.get(user=self.user).seen_count, 5)
+        self.assertEqual(DailyRollup.objects.get(metric=rollups.VIEWS).count, 5)
+        counts = dict(EventRollup.objects.filter(kind=timeseries.VIEWS).values_list('subject', 'count'))
+        self.assertEqual(counts, {timeseries.ALL: 5, self.movie.media_id: 1, self.episodes[0].season.series.media_id: 4})
+
+    def test_flush_updates_counters_once_per_key(self):
+        def flush_queries(user, episodes):
+            buffer = self.buffer()
+            for episode in episodes:
+                buffer.add(user.pk, None, episode.pk, 10)
+            with CaptureQueriesContext(connection) as queries:
+                buffer.flush()
+            return len(queries)
+
+        flush_queries(self.user, self.episodes[:1])
+        few = flush_queries(User.objects.create_user('few', 'few@example.com', 'password'), self.episodes[:2])
+        many = flush_queries(User.objects.create_user('many', 'many@example.com', 'password'), self.episodes)
+
+        self.assertEqual(few, many)
+
+    def test_new_streams_wait_when_full(self):
+        buffer = self.buffer(max_streams=1)
+        buffer.add(self.user.pk, self.movie.pk, None, 10)
+        buffer.add(self.user.pk, self.movie.pk, None, 20)
+
+        with self.assertRaises(heartbeat.BufferFull):
+            buffer.add(self.user.pk, None, self.episodes[0].pk, 10)
+
+    def test_failed_flush_keeps_the_heartbeats(self):
+        buffer = self.buffer()
+        buffer.add(self.user.pk, self.movie.pk, None, 10)
+        with mock.patch.object(heartbeat, 'write', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                buffer.flush()
+
+        self.assertEqual(len(os.listdir(self.spill_dir)), 1)
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(os.listdir(self.spill_dir), [])
+
+    def test_replays_the_spill_file_of_a_dead_process(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        with open(os.path.join(self.spill_dir, f'{process.pid}{heartbeat.SPILL_SUFFIX}'), 'w') as file:
+            # The last line was cut short by the crash.
+            file.write(f'[{self.user.pk}, {self.movie.pk}, null, 40, 1000.0]\n[{self.user.pk}, ')
+
+        buffer = self.buffer()
+        buffer.replay()
+
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(SeenMedia.objects.get().position, 40)
+        self.assertEqual(os.listdir(self.spill_dir), [])
+
+
+class FullTextSearchTests(TransactionTestCase):
+    # An FTS5 table created inside a transaction that is rolled back breaks the SQLite connection.
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        for name in ('God Help', 'Godzilla', 'The Godfather', 'Casablanca'):
+            create_media(self.admin, name)
+        self.addCleanup(search._tables.clear)
+
+    def create_index(self):
+        search.rebuild('media')
+        self.addCleanup(connection.cursor().execute, f"DROP TABLE {search.table_name('media')}")
+
+    def test_saves_never_create_the_index(self):
+        with connection.cursor() as cursor:
+            self.assertNotIn(search.table_name('media'), connection.introspection.table_names(cursor))
+
+    def test_count_reports_the_cap(self):
+        self.create_index()
+        url = reverse('v1:media-list')
+
+        with self.settings(SEARCH_MAX_RESULTS=2):
+            response = self.client.get(url, {'search': 'god'})
+        self.assertEqual((response.data['count'], response.data['count_is_capped']), (2, True))
+
+        response = self.client.get(url, {'search': 'god'})
+        self.assertEqual((response.data['count'], response.data['count_is_capped']), (3, False))
+
+    def test_search_falls_back_to_page_numbers(self):
+        self.create_index()
+
+        response = self.client.get(reverse('v1:media-list'), {'search': 'godz', 'pagination': 'keyset'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual([item['name'] for item in response.data['results']], ['Godzilla'])
+
+    def test_index_created_by_another_process_is_found(self):
+        self.assertFalse(search.index_exists('media'))
+        self.create_index()
+        # As if the index had been created by another process.
+        search._tables[connection.alias, 'media'] = time.monotonic()
+
+        self.assertFalse(search.index_exists('media'))
+        with self.settings(SEARCH_INDEX_CHECK_INTERVAL=0):
+            self.assertTrue(search.index_exists('media'))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(search.index_exists('media'))
+        self.assertEqual(len(queries), 0)
+
+
+class AutocompleteTests(AdminTestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches[CATALOG_CACHE].clear()
+        autocomplete.indexes.clear()
+        autocomplete.state.update(generation=None, removed=None, checked_at=0.0)
+        self.heat = create_media(self.admin, 'Heat')
+        self.ronin = create_media(self.admin, 'Ronin')
+
+    def generation(self):
+        return caches[CATALOG_CACHE].get(autocomplete.GENERATION_KEY)
+
+    def test_save_without_rename_keeps_the_indexes(self):
+        generation = self.generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.heat.synopsis = "Thieves and a detective"
+            self.heat.save()
+            self.ronin.save(update_fields=['synopsis'])
+        self.assertEqual(self.generation(), generation)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.heat.name = 'Heat 2'
+            self.heat.save()
+        self.assertNotEqual(self.generation(), generation)
+
+    def test_delete_removes_the_entry_from_every_process(self):
+        index, pk = autocomplete.get_index('media'), self.heat.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.heat.delete()
+        # As if the index belonged to a process that has not seen the delete yet.
+        index.add(pk, 'Heat')
+        autocomplete.state['checked_at'] = 0.0
+
+        self.assertEqual(autocomplete.suggest('media', 'he', 10), [])
+        self.assertIs(autocomplete.get_index('media'), index)
+        self.assertEqual(autocomplete.suggest('media', 'ro', 10), [(self.ronin.pk, 'Ronin')])
+
+    def test_delete_rebuilds_other_processes_without_atomic_incr(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = FileBasedCache(directory.name, {})
+        index, pk = autocomplete.get_index('media'), self.heat.pk
+        with mock.patch('movie.autocomplete.generation_cache', return_value=cache):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.heat.delete()
+            self.assertIsNone(cache.get(autocomplete.REMOVED_KEY))
+            generation = cache.get(autocomplete.GENERATION_KEY)
+            self.assertIsNotNone(generation)
+            # As if the index belonged to a process that has not seen the delete yet.
+            autocomplete.state.update(generation=None, checked_at=0.0)
+
+            self.assertEqual(autocomplete.suggest('media', 'he', 10), [])
+            self.assertIsNot(autocomplete.get_index('media'), index)
+
+
+@override_settings(MEDIA_UPLOAD_BLOCK_SIZE=1024)
+class ChunkWriteTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'upload.bin')
+        self.content = os.urandom(10 * 1024 + 7)
+
+    def temporary_file(self):
+        file_obj = TemporaryUploadedFile('chunk.bin', 'application/octet-stream', len(self.content), None)
+        self.addCleanup(file_obj.close)
+        file_obj.write(self.content)
+        file_obj.seek(0)
+        return file_obj
+
+    def test_chunks_are_read_in_blocks(self):
+        for file_obj in (SimpleUploadedFile('chunk.bin', self.content), self.temporary_file()):
+            with self.subTest(type(file_obj).__name__), \
+                    mock.patch.object(file_obj.file, 'read', wraps=file_obj.file.read) as read:
+                digest = write_chunk(file_obj, self.path, append=True)
+
+                self.assertTrue(read.call_args_list)
+                for call in read.call_args_list:
+                    self.assertEqual(call.args, (1024,))
+                self.assertEqual(digest, hashlib.sha256(self.content).hexdigest())
+            os.remove(self.path)
+
+    def test_new_file_takes_over_the_temporary_file(self):
+        file_obj = self.temporary_file()
+        digest = write_chunk(file_obj, self.path)
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(digest, hashlib.sha256(self.content).hexdigest())
+
+
+class ImageResizeTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_root = os.path.join(directory.name, 'media')
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        cache = mock.patch('api.views.resize_cache', ResizeCache(os.path.join(directory.name, 'cache'), 1024 * 1024))
+        cache.start()
+        self.addCleanup(cache.stop)
+        for name in ('poster/heat.png', 'thumbnail/file/upload.png', 'upload.png'):
+            os.makedirs(os.path.dirname(os.path.join(media_root, name)), exist_ok=True)
+            Image.new('RGB', (40, 60), 'red').save(os.path.join(media_root, name))
+
+    def resize(self, path):
+        return self.client.get(reverse('v1:image'), {'path': path, 'w': 100, 'h': 150})
+
+    def test_serves_public_images(self):
+        response = self.resize('poster/heat.png')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        response.close()
+
+    def test_hides_uploaded_files(self):
+        for path in ('thumbnail/file/upload.png', 'upload.png', 'poster/../upload.png'):
+            with self.subTest(path):
+                self.assertEqual(self.resize(path).status_code, 404)
+
+
+class ImageDerivativeTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=directory.name, IMAGE_DERIVATIVE_WIDTHS=[20],
+                                           IMAGE_DERIVATIVE_FORMATS=['webp'])
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        for name in ('genre/drama.png', 'genre/comedy.png'):
+            os.makedirs(os.path.join(directory.name, 'genre'), exist_ok=True)
+            Image.new('RGB', (40, 60), 'red').save(os.path.join(directory.name, name))
+        self.genre = Genre.objects.create(title='Drama', poster='genre/drama.png')
+
+    def jobs(self):
+        return ProcessingJob.objects.filter(kind=ProcessingJob.JobKind.IMAGE_DERIVATIVES)
+
+    def build(self, instance, field_name):
+        generate_derivatives(getattr(instance, field_name))
+        record_derivatives(instance, field_name)
+
+    def test_new_image_is_queued_once(self):
+        self.genre.save()
+        self.genre.title = 'Thriller'
+        self.genre.save()
+
+        self.assertEqual(self.jobs().count(), 1)
+
+    def test_pending_job_covers_a_replaced_image(self):
+        genre = Genre.objects.get(pk=self.genre.pk)
+        genre.poster = 'genre/comedy.png'
+        genre.save()
+
+        self.assertEqual(self.jobs().count(), 1)
+
+    def test_saving_a_loaded_row_does_not_query_its_images(self):
+        genre = Genre.objects.get(pk=self.genre.pk)
+        genre.title = 'Thriller'
+        with CaptureQueriesContext(connection) as queries:
+            genre.save()
+
+        self.assertEqual([query['sql'] for query in queries.captured_queries
+                          if 'movie_genre' in query['sql'] or 'movie_processingjob' in query['sql']],
+                         [queries.captured_queries[0]['sql']])
+
+    def test_recorded_derivatives_are_served_without_storage_access(self):
+        self.build(self.genre, 'poster')
+        genre = Genre.objects.get(pk=self.genre.pk)
+
+        self.assertEqual(genre.derived_images, ['genre/drama.png'])
+        with mock.patch.object(genre.poster.storage, 'exists') as exists:
+            self.assertIsNotNone(srcset(genre.poster))
+        exists.assert_not_called()
+
+    def test_replaced_image_is_not_recorded_by_the_old_job(self):
+        stale = Genre.objects.get(pk=self.genre.pk)
+        Genre.objects.filter(pk=self.genre.pk).update(poster='genre/comedy.png')
+        self.build(stale, 'poster')
+
+        self.assertEqual(Genre.objects.get(pk=self.genre.pk).derived_images, [])
+
+    def test_replacing_an_image_queues_its_derivatives(self):
+        self.build(self.genre, 'poster')
+        self.jobs().delete()
+        genre = Genre.objects.get(pk=self.genre.pk)
+        genre.save()
+        self.assertFalse(self.jobs().exists())
+
+        genre.poster = 'genre/comedy.png'
+        genre.save()
+
+        self.assertEqual(self.jobs().get().payload, {'model': 'movie.Genre', 'pk': genre.pk, 'field': 'poster'})
+        self.assertIsNone(srcset(genre.poster))
+
+    def test_backfill_records_existing_derivatives(self):
+        generate_derivatives(self.genre.poster)
+        self.jobs().delete()
+        Genre.objects.create(title='Comedy', poster='genre/comedy.png')
+        self.jobs().delete()
+
+        call_command('record_image_derivatives', stdout=StringIO())
+
+        self.assertEqual(Genre.objects.get(pk=self.genre.pk).derived_images, ['genre/drama.png'])
+        self.assertEqual(self.jobs().count(), 1)
+
+
+def create_subscription(user, end_date):
+    plan = Plan.objects.create(title='Monthly', description='One month', days=30, price=100)
+    payment = Payment.objects.create(date=timezone.now(), price=100, tracking_code=1, receipt_number=1,
+                                     is_successful=True, user=user)
+    return Subscription.objects.create(user=user, payment=payment, plan=plan, created_at=timezone.now(),
+                                       end_date=end_date, title_plan=plan.title, description_plan=plan.description,
+                                       days_plan=plan.days, price_plan=plan.price)
+
+
+class RangeHeaderTests(TestCase):
+
+    def test_parses_ranges(self):
+        self.assertEqual(parse_range_header('bytes=0-9', 100), [(0, 9)])
+        self.assertEqual(parse_range_header('bytes=90-', 100), [(90, 99)])
+        self.assertEqual(parse_range_header('bytes=-10', 100), [(90, 99)])
+        self.assertEqual(parse_range_header('bytes=95-200', 100), [(95, 99)])
+        self.assertEqual(parse_range_header('bytes=0-1, 10-11', 100), [(0, 1), (10, 11)])
+
+    def test_unsatisfiable_ranges(self):
+        self.assertEqual(parse_range_header('bytes=100-', 100), [])
+        self.assertEqual(parse_range_header('bytes=-0', 100), [])
+
+    def test_ignored_headers(self):
+        for header in ('items=0-9', 'bytes=9-0', 'bytes=a-b', 'bytes=-', 'bytes=',
+                       'bytes=' + ','.join(['0-0'] * (MAX_RANGES + 1))):
+            with self.subTest(header):
+                self.assertIsNone(parse_range_header(header, 100))
+
+
+class StreamTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=directory.name, MEDIA_STREAM_OFFLOAD='')
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.content = bytes(range(256)) * 4
+        with open(os.path.join(directory.name, 'video.mp4'), 'wb') as f:
+            f.write(self.content)
+
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.viewer = User.objects.create_user('viewer', 'viewer@example.com', 'password')
+        self.movie = create_movie(self.admin, 'Heat')
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+        self.url = reverse('v1:movie-stream', args=[self.movie.pk])
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_single_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(self.body(response), self.content[10:20])
+
+    def test_multiple_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1,1000-')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        body = self.body(response)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertIn(b'Content-Range: bytes 0-1/1024\r\n\r\n' + self.content[:2], body)
+        self.assertIn(b'Content-Range: bytes 1000-1023/1024\r\n\r\n' + self.content[1000:], body)
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2000-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_if_range(self):
+        full = self.client.get(self.url)
+        self.assertEqual(full.status_code, 200)
+        self.assertEqual(self.body(full), self.content)
+        last_modified = full['Last-Modified']
+        later = http_date(os.stat(self.movie.video.file.path).st_mtime + 60)
+
+        for if_range, status_code in ((full['ETag'], 206), ('"stale"', 200), (last_modified, 206), (later, 200)):
+            with self.subTest(if_range):
+                response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=if_range)
+                self.assertEqual(response.status_code, status_code)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_subscription_media_needs_a_subscription(self):
+        Media.objects.filter(pk=self.movie.media_id).update(value=Media.MediaType.SUBSCRIPTION)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        create_subscription(self.viewer, timezone.now() - timedelta(days=1))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        create_subscription(self.viewer, timezone.now() + timedelta(days=1))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_unreleased_media_is_hidden(self):
+        Media.objects.filter(pk=self.movie.media_id).update(release_date=timezone.now() + timedelta(days=1))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_unpublished_episode_is_hidden(self):
+        series = TvSeries.objects.create(media=create_media(self.admin, 'Dark'))
+        season = Season.objects.create(series=series, number=1, thumbnail='thumbnail.jpg', poster='poster.jpg',
+                                       publication_date=timezone.now())
+        episode = create_episode(self.admin, season, 1)
+        url = reverse('v1:series-season-episode-stream', args=[episode.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        Episode.objects.filter(pk=episode.pk).update(publication_date=timezone.now() + timedelta(days=1))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_raw_files_are_for_superusers(self):
+        url = reverse('v1:file-stream', args=[self.movie.video_id])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class EventTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('viewer', 'viewer@example.com', 'password')
+        self.movie = create_movie(self.user, 'Heat')
+        series = TvSeries.objects.create(media=create_media(self.user, 'Dark'))
+        season = Season.objects.create(series=series, number=1, thumbnail='thumbnail.jpg', poster='poster.jpg',
+                                       publication_date=timezone.now())
+        self.episode = create_episode(self.user, season, 1)
+        self.advertise = Advertise.objects.create(title='Ad', time=10, video='ad.mp4', number_repeated=1)
+
+    def impress(self, count):
+        for _ in range(count):
+            AdvertiseSeen.objects.create(advertise=self.advertise, user=self.user, movie=self.movie,
+                                         episode=self.episode, times=1)
+
+    def counts(self, kind):
+        return dict(EventRollup.objects.filter(kind=kind).values_list('subject', 'count'))
+
+
+class EventRollupTests(EventTestCase):
+
+    def test_views_count_per_media_and_overall(self):
+        SeenMedia.objects.create(user=self.user, movie=self.movie)
+        SeenMedia.objects.create(user=self.user, episode=self.episode)
+        seen = SeenMedia.objects.create(user=self.user, episode=self.episode)
+        seen.delete()
+
+        self.assertEqual(self.counts(timeseries.VIEWS),
+                         {timeseries.ALL: 2, self.movie.media_id: 1, self.episode.season.series.media_id: 1})
+
+    def test_backfill_matches_the_signals(self):
+        SeenMedia.objects.create(user=self.user, movie=self.movie)
+        self.impress(2)
+        before = sorted(EventRollup.objects.values_list('kind', 'subject', 'hour', 'count'))
+
+        timeseries.backfill()
+
+        self.assertEqual(sorted(EventRollup.objects.values_list('kind', 'subject', 'hour', 'count')), before)
+
+    def test_series_fills_empty_buckets(self):
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=3)
+        EventRollup.add(timeseries.VIEWS, timeseries.ALL, start, 2)
+        EventRollup.add(timeseries.VIEWS, timeseries.ALL, start + timedelta(hours=2), 5)
+
+        seconds, starts, counts = timeseries.series(timeseries.VIEWS, start, start + timedelta(hours=3))
+
+        self.assertEqual(seconds, timeseries.HOUR)
+        self.assertEqual(counts, [2, 0, 5])
+        self.assertEqual(starts[0], start)
+
+
+@override_settings(COUNTER_FLUSH_INTERVAL=3600)
+class CounterBufferTests(EventTestCase):
+
+    def setUp(self):
+        super().setUp()
+        buffer = mock.patch.object(counters, '_buffer', counters.CounterBuffer(3600))
+        self.buffer = buffer.start()
+        self.addCleanup(buffer.stop)
+
+    def impress(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            super().impress(count)
+
+    def test_impressions_are_counted_at_the_flush(self):
+        self.impress(3)
+        self.assertEqual(self.counts(timeseries.AD_IMPRESSIONS), {})
+
+        self.buffer.flush()
+        self.assertEqual(self.counts(timeseries.AD_IMPRESSIONS), {timeseries.ALL: 3, self.advertise.pk: 3})
+
+    def test_flush_updates_each_row_once(self):
+        def flush_queries(count):
+            self.impress(count)
+            with CaptureQueriesContext(connection) as queries:
+                self.buffer.flush()
+            return len(queries)
+
+        flush_queries(1)
+        self.assertEqual(flush_queries(2), flush_queries(5))
+        self.assertEqual(self.counts(timeseries.AD_IMPRESSIONS), {timeseries.ALL: 8, self.advertise.pk: 8})
+
+    def test_rolled_back_impressions_are_not_counted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                super().impress(1)
+                raise RuntimeError
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_failed_flush_keeps_the_increments(self):
+        self.impress(2)
+        with mock.patch.object(EventRollup, 'add', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.buffer.flush()
+
+        self.buffer.flush()
+        self.assertEqual(self.counts(timeseries.AD_IMPRESSIONS), {timeseries.ALL: 2, self.advertise.pk: 2})
+
+
+class DailyRollupTests(EventTestCase):
+
+    def rollups(self):
+        return sorted(DailyRollup.objects.values_list('metric', 'day', 'count'))
+
+    def test_events_count_on_their_day(self):
+        SeenMedia.objects.create(user=self.user, movie=self.movie)
+        self.impress(2)
+        today = timezone.localdate()
+
+        self.assertIn((rollups.VIEWS, today, 1), self.rollups())
+        self.assertIn((rollups.AD_IMPRESSIONS, today, 2), self.rollups())
+        self.assertIn((rollups.SIGNUPS, today, 1), self.rollups())
+
+    def test_subscription_counts_until_its_end(self):
+        create_subscription(self.user, timezone.now() + timedelta(days=3))
+        totals = rollups.header_totals(days=7)
+
+        self.assertEqual(totals['subscriptions_total'], 1)
+        self.assertEqual(totals['subscriptions_old'], 0)
+
+        Subscription.objects.get().delete()
+        self.assertEqual(rollups.header_totals()['subscriptions_total'], 0)
+
+    def test_backfill_matches_the_signals(self):
+        SeenMedia.objects.create(user=self.user, movie=self.movie)
+        self.impress(2)
+        create_subscription(self.user, timezone.now() + timedelta(days=3))
+        before = [row for row in self.rollups() if row[2]]
+
+        rollups.backfill()
+
+        self.assertEqual(self.rollups(), before)
+
+    @override_settings(COUNTER_FLUSH_INTERVAL=3600)
+    def test_impressions_are_counted_at_the_flush(self):
+        buffer = counters.CounterBuffer(3600)
+        with mock.patch.object(counters, '_buffer', buffer):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.impress(3)
+            self.assertFalse(DailyRollup.objects.filter(metric=rollups.AD_IMPRESSIONS).exists())
+
+            buffer.flush()
+        self.assertEqual(DailyRollup.objects.get(metric=rollups.AD_IMPRESSIONS).count, 3)
+
+
+class RatingAggregateTests(AdminTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = User.objects.create_user('viewer', 'viewer@example.com', 'password')
+        self.heat = create_media(self.admin, 'Heat')
+        self.ronin = create_media(self.admin, 'Ronin')
+        for user, media, value in ((self.admin, self.heat, 8), (self.viewer, self.heat, 6),
+                                   (self.viewer, self.ronin, 4)):
+            ratings.upsert_rating(user, value, media=media)
+
+    def aggregates(self, media):
+        media.refresh_from_db()
+        return media.rating_sum, media.rating_count, media.rating_histogram
+
+    def test_deleted_rating_is_removed_at_once(self):
+        Rating.objects.get(user=self.viewer, media=self.heat).delete()
+
+        self.assertEqual(self.aggregates(self.heat)[:2], (8, 1))
+
+    def test_cascade_recomputes_each_target_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.viewer.delete()
+
+        self.assertEqual(self.aggregates(self.heat)[:2], (8, 1))
+        self.assertEqual(self.aggregates(self.ronin), (0, 0, ratings.empty_histogram()))
+
+    def test_deleted_media_is_looked_up_once(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.heat.delete()
+
+        lookup = 'FROM "movie_media" WHERE "movie_media"."id"'
+        lookups = [query for query in queries.captured_queries
+                   if query['sql'].startswith('SELECT') and lookup in query['sql']]
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual(self.aggregates(self.ronin)[:2], (4, 1))
+
+
+class RatingSubmitTests(AdminTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.heat = create_media(self.admin, 'Heat')
+
+    def rate(self, value):
+        return self.client.post(reverse('v1:rating-list'), {'rating': value, 'media': self.heat.pk})
+
+    def aggregates(self):
+        self.heat.refresh_from_db()
+        return self.heat.rating_sum, self.heat.rating_count
+
+    def test_first_rating_is_inserted(self):
+        response = self.rate(7)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['user'], response.data['rating']), (self.admin.pk, 7))
+        self.assertEqual(self.aggregates(), (7, 1))
+
+    def test_new_value_updates_the_rating(self):
+        self.rate(7)
+        response = self.rate(3)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Rating.objects.get().rating, 3)
+        self.assertEqual(self.aggregates(), (3, 1))
+
+    def test_duplicate_submit_keeps_one_rating(self):
+        self.rate(7)
+        response = self.rate(7)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Rating.objects.count(), 1)
+        self.assertEqual(self.aggregates(), (7, 1))
+
+    def test_rating_deleted_after_the_conflict_is_inserted_again(self):
+        self.rate(7)
+        select_for_update = Rating.objects.select_for_update
+
+        def deleted_first(*args, **kwargs):
+            Rating.objects.all().delete()
+            lock.side_effect = select_for_update
+            return select_for_update(*args, **kwargs)
+
+        with mock.patch.object(Rating.objects, 'select_for_update', side_effect=deleted_first) as lock, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.rate(5)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Rating.objects.get().rating, 5)
+        self.assertEqual(self.aggregates(), (5, 1))
+
+
+class UploadTestCase(AdminTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=directory.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.chunks = [os.urandom(100) for _ in range(3)]
+
+    def upload(self, chunk_index, upload_id=None, name='notes.bin', **data):
+        data.update(file=SimpleUploadedFile(name, self.chunks[chunk_index]), chunk_index=chunk_index,
+                    total_chunk=len(self.chunks))
+        if upload_id is not None:
+            data['id'] = upload_id
+        return self.client.post(reverse('v1:upload'), data, format='multipart')
+
+    def upload_all(self, name='notes.bin'):
+        upload_id = self.upload(0, name=name).data['upload_id']
+        for chunk_index in range(1, len(self.chunks)):
+            response = self.upload(chunk_index, upload_id)
+        return MediaFile.objects.get(pk=response.data['id'])
+
+    def read(self, media_file):
+        with media_file.file.open('rb') as f:
+            return f.read()
+
+
+class ParallelUploadTests(UploadTestCase):
+
+    def test_parts_are_assembled_in_order(self):
+        upload_id = self.upload(2, parallel=1).data['upload_id']
+        response = self.upload(0, upload_id)
+        self.assertEqual((response.data['chunks_uploaded'], response.data['total_chunk']), (2, 3))
+
+        response = self.upload(1, upload_id)
+
+        self.assertEqual(response.status_code, 201)
+        media_file = MediaFile.objects.get(pk=response.data['id'])
+        self.assertTrue(media_file.is_complete)
+        self.assertEqual(self.read(media_file), b''.join(self.chunks))
+        self.assertFalse(os.path.exists(uploads.parts_dir(media_file)))
+
+    def test_repeated_part_is_counted_once(self):
+        upload_id = self.upload(0, parallel=1).data['upload_id']
+
+        response = self.upload(0, upload_id)
+
+        self.assertEqual(response.data['chunks_uploaded'], 1)
+        self.assertEqual(sorted(os.listdir(uploads.parts_dir(MediaFile.objects.get(upload_id=upload_id)))),
+                         ['.lock', '0.part'])
+
+    def test_bitmap(self):
+        bitmap = uploads.empty_bitmap(10)
+        for chunk_index in (0, 9, 9):
+            bitmap = uploads.set_chunk(bitmap, chunk_index)
+
+        self.assertEqual(len(bitmap), 2)
+        self.assertEqual(uploads.count_chunks(bitmap), 2)
+
+
+class JobQueueTests(TestCase):
+    kind = ProcessingJob.JobKind.THUMBNAIL
+
+    def setUp(self):
+        self.jobs = [jobs.enqueue(self.kind, payload={'number': number}) for number in range(3)]
+
+    def state(self, job):
+        job.refresh_from_db()
+        return job.state
+
+    def test_claims_the_oldest_pending_jobs(self):
+        claimed = jobs.claim(2)
+
+        self.assertEqual(claimed, [job.pk for job in self.jobs[:2]])
+        self.assertEqual([self.state(job) for job in self.jobs], [ProcessingJob.JobState.RUNNING] * 2 +
+                         [ProcessingJob.JobState.PENDING])
+        self.assertEqual(self.jobs[0].attempts, 1)
+
+    def test_a_job_is_claimed_once(self):
+        jobs.claim(1)
+
+        self.assertEqual(jobs.claim(3), [job.pk for job in self.jobs[1:]])
+        self.assertEqual(jobs.claim(3), [])
+
+    def test_stale_jobs_are_requeued(self):
+        jobs.claim(3)
+        ProcessingJob.objects.filter(pk=self.jobs[0].pk) \
+            .update(started_at=timezone.now() - timedelta(seconds=settings.MEDIA_JOB_TIMEOUT + 1))
+
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.claim(3), [self.jobs[0].pk])
+
+    @override_settings(MEDIA_JOB_MAX_ATTEMPTS=2)
+    def test_failed_job_is_retried_until_the_last_attempt(self):
+        def fail(job):
+            raise ValueError("broken image")
+
+        job = self.jobs[0]
+        with mock.patch.dict(jobs.HANDLERS, {self.kind: fail}):
+            for expected in (ProcessingJob.JobState.PENDING, ProcessingJob.JobState.FAILED):
+                self.assertIn(job.pk, jobs.claim(3))
+                self.assertEqual(jobs.run(job.pk), expected)
+
+        job.refresh_from_db()
+        self.assertIn("broken image", job.error)
+
+
+class DeduplicationTests(UploadTestCase):
+
+    def test_identical_upload_shares_the_stored_file(self):
+        original = self.upload_all()
+        duplicate = self.upload_all()
+
+        self.assertEqual(duplicate.content_hash, original.content_hash)
+        self.assertEqual(duplicate.file.name, original.file.name)
+        self.assertEqual(os.listdir(os.path.dirname(original.file.path)), [os.path.basename(original.file.name)])
+
+    def test_different_content_is_stored_apart(self):
+        original = self.upload_all()
+        self.chunks[1] = os.urandom(100)
+        other = self.upload_all()
+
+        self.assertNotEqual(other.content_hash, original.content_hash)
+        self.assertNotEqual(other.file.name, original.file.name)
+        self.assertEqual(self.read(other), b''.join(self.chunks))
+
+    def test_shared_file_is_kept_until_its_last_upload_is_deleted(self):
+        original = self.upload_all()
+        duplicate = self.upload_all()
+        path = original.file.path
+
+        original.delete()
+        self.assertTrue(os.path.exists(path))
+        duplicate.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_content_digest_needs_every_chunk(self):
+        digests = {str(chunk_index): hashlib.sha256(chunk).hexdigest() for chunk_index, chunk in enumerate(self.chunks)}
+
+        self.assertIsNotNone(uploads.content_digest(digests, 3))
+        del digests['1']
+        self.assertIsNone(uploads.content_digest(digests, 3))
+
+
+class SweeperTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=directory.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.old = timezone.now() - timedelta(days=30)
+
+    def stored(self, name, is_complete=True, old=True, content_hash=None):
+        media_file = MediaFile.objects.create(user=self.user, file=f'upload/{name}', total_chunk=1,
+                                              is_complete=is_complete, content_hash=content_hash)
+        media_file.file.save(name, ContentFile(b'x' * 10), save=False)
+        MediaFile.objects.filter(pk=media_file.pk).update(file=media_file.file.name,
+                                                          uploaded_on=self.old if old else timezone.now())
+        return media_file
+
+    def exists(self, media_file):
+        return MediaFile.objects.filter(pk=media_file.pk).exists(), os.path.exists(media_file.file.path)
+
+    def test_expired_and_orphaned_uploads_are_removed(self):
+        expired = self.stored('expired.bin', is_complete=False)
+        partial = self.stored('partial.bin', is_complete=False, old=False)
+        orphan = self.stored('orphan.bin')
+        recent = self.stored('recent.bin', old=False)
+        attached = self.stored('attached.bin')
+        Movie.objects.create(media=create_media(self.user, 'Heat'), video=attached, time=90)
+
+        stats = sweeper.sweep_all(batch_size=1)
+
+        self.assertEqual((stats['expired'].rows, stats['orphaned'].rows), (1, 1))
+        for media_file in (expired, orphan):
+            self.assertEqual(self.exists(media_file), (False, False))
+        for media_file in (partial, recent, attached):
+            self.assertEqual(self.exists(media_file), (True, True))
+
+    def test_file_shared_by_a_kept_upload_is_kept(self):
+        orphan = self.stored('orphan.bin', content_hash='a' * 64)
+        kept = self.stored('kept.bin', old=False, content_hash='a' * 64)
+        MediaFile.objects.filter(pk=kept.pk).update(file=orphan.file.name)
+
+        sweeper.sweep(sweeper.orphaned_files())
+
+        self.assertEqual(self.exists(orphan), (False, True))
+
+    def test_dry_run_deletes_nothing(self):
+        orphan = self.stored('orphan.bin')
+
+        stats = sweeper.sweep(sweeper.orphaned_files(), dry_run=True)
+
+        self.assertEqual((stats.rows, stats.files, stats.bytes), (1, 1, 10))
+        self.assertEqual(self.exists(orphan), (True, True))
+
+
+class UserStatsTests(EventTestCase):
+
+    def stats(self):
+        return UserStats.objects.get(user=self.user)
+
+    def test_views_are_counted(self):
+        first = SeenMedia.objects.create(user=self.user, movie=self.movie)
+        second = SeenMedia.objects.create(user=self.user, episode=self.episode)
+        self.assertEqual((self.stats().seen_count, self.stats().last_seen_at), (2, second.created_at))
+
+        second.delete()
+        self.assertEqual((self.stats().seen_count, self.stats().last_seen_at), (1, first.created_at))
+        first.delete()
+        self.assertEqual((self.stats().seen_count, self.stats().last_seen_at), (0, None))
+
+    def test_premium_lasts_until_the_latest_subscription(self):
+        now = timezone.now()
+        longer = create_subscription(self.user, now + timedelta(days=30))
+        shorter = create_subscription(self.user, now + timedelta(days=10))
+        self.assertEqual(self.stats().premium_until, longer.end_date)
+        self.assertTrue(self.stats().is_premium)
+
+        longer.end_date = now - timedelta(days=1)
+        longer.save()
+        self.assertEqual(self.stats().premium_until, shorter.end_date)
+
+        shorter.delete()
+        self.assertEqual(self.stats().premium_until, longer.end_date)
+        self.assertFalse(self.stats().is_premium)
+
+    def test_deleted_user_leaves_no_stats(self):
+        user = User.objects.create_user('guest', 'guest@example.com', 'password')
+        SeenMedia.objects.create(user=user, movie=self.movie)
+        create_subscription(user, timezone.now() + timedelta(days=30))
+        user_pk = user.pk
+
+        user.delete()
+
+        self.assertFalse(UserStats.objects.filter(user_id=user_pk).exists())
+
+    def test_rebuild_matches_the_signals(self):
+        SeenMedia.objects.create(user=self.user, movie=self.movie)
+        subscription = create_subscription(self.user, timezone.now() + timedelta(days=30))
+        expected = self.stats()
+        UserStats.objects.all().delete()
+
+        user_stats.rebuild()
+
+        self.assertEqual((self.stats().seen_count, self.stats().last_seen_at, self.stats().premium_until),
+                         (expected.seen_count, expected.last_seen_at, subscription.end_date))
+
+
+class PopularityCounterTests(EventTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.plan = Plan.objects.create(title='Monthly', description='One month', days=30, price=100)
+
+    def subscribe(self):
+        payment = Payment.objects.create(date=timezone.now(), price=100, tracking_code=1, receipt_number=1,
+                                         is_successful=True, user=self.user)
+        return Subscription.objects.create(user=self.user, payment=payment, plan=self.plan, created_at=timezone.now(),
+                                           end_date=timezone.now() + timedelta(days=30), title_plan=self.plan.title,
+                                           description_plan=self.plan.description, days_plan=self.plan.days,
+                                           price_plan=self.plan.price)
+
+    def counters(self):
+        self.plan.refresh_from_db()
+        self.advertise.refresh_from_db()
+        return self.plan.subscription_count, self.advertise.view_count
+
+    def test_counters_follow_creates_and_deletes(self):
+        subscription = self.subscribe()
+        self.subscribe()
+        self.impress(3)
+        self.assertEqual(self.counters(), (2, 3))
+
+        subscription.delete()
+        AdvertiseSeen.objects.first().delete()
+        self.assertEqual(self.counters(), (1, 2))
+
+    def test_rebuild_recounts(self):
+        self.subscribe()
+        self.impress(2)
+        Plan.objects.update(subscription_count=5)
+        Advertise.objects.update(view_count=0)
+
+        call_command('rebuild_popularity_counters', stdout=StringIO())
+
+        self.assertEqual(self.counters(), (1, 2))
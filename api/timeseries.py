@@ -0,0 +1,156 @@
+import math
+from collections import defaultdict, Counter
+from datetime import timedelta, datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncHour, Coalesce
+from django.utils import timezone
+
+from advertise.models import AdvertiseSeen
+from api.models import EventRollup
+from movie.models import SeenMedia, Media, Movie, Episode
+
+VIEWS = 'views'
+AD_IMPRESSIONS = 'ad_impressions'
+# Every subject's events are also counted under this one.
+ALL = 0
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+BUCKETS = {'hour': HOUR, 'day': DAY}
+
+
+def truncate_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def seen_media_id(seen):
+    if seen.movie_id is not None:
+        return Movie.objects.filter(pk=seen.movie_id).values_list('media', flat=True).first()
+    return Media.objects.filter(tvseries__season__episode=seen.episode_id).values_list('pk', flat=True).first()
+
+
+def seen_media_ids(views):
+    """
+    The media id of each ``SeenMedia`` in ``views``, in one query per kind.
+    """
+    movies = dict(Movie.objects.filter(pk__in={seen.movie_id for seen in views if seen.movie_id is not None})
+                  .values_list('pk', 'media'))
+    episodes = dict(Episode.objects.filter(pk__in={seen.episode_id for seen in views if seen.episode_id is not None})
+                    .values_list('pk', 'season__series__media'))
+    return [movies.get(seen.movie_id) if seen.movie_id is not None else episodes.get(seen.episode_id)
+            for seen in views]
+
+
+def event(seen):
+    """
+    ``(kind, subject, hour)`` a ``SeenMedia`` or ``AdvertiseSeen`` counts under.
+    """
+    if isinstance(seen, AdvertiseSeen):
+        return AD_IMPRESSIONS, seen.advertise_id, truncate_hour(seen.created_at)
+    return VIEWS, seen_media_id(seen), truncate_hour(seen.created_at)
+
+
+def rows(seen):
+    """
+    ``(kind, subject, hour)`` of every ``EventRollup`` row an event counts on.
+    """
+    kind, subject, hour = event(seen)
+    if subject is None:
+        return [(kind, ALL, hour)]
+    return [(kind, subject, hour), (kind, ALL, hour)]
+
+
+def record(seen, delta=1):
+    for row in rows(seen):
+        EventRollup.add(*row, delta)
+
+
+def record_views(views):
+    """
+    Count the ``SeenMedia`` rows ``views`` with one update per media and hour.
+    """
+    counts = Counter()
+    for seen, subject in zip(views, seen_media_ids(views)):
+        hour = truncate_hour(seen.created_at)
+        if subject is not None:
+            counts[subject, hour] += 1
+        counts[ALL, hour] += 1
+    for (subject, hour), count in counts.items():
+        EventRollup.add(VIEWS, subject, hour, count)
+
+
+def event_rows():
+    """
+    ``(kind, subject, hour, count)`` of every hour with events, straight from the event tables.
+    """
+    views = SeenMedia.objects.order_by().annotate(
+        subject=Coalesce(F('movie__media'), F('episode__season__series__media')), hour=TruncHour('created_at'))
+    ads = AdvertiseSeen.objects.order_by().annotate(subject=F('advertise'), hour=TruncHour('created_at'))
+    for kind, queryset in ((VIEWS, views), (AD_IMPRESSIONS, ads)):
+        for row in queryset.values('subject', 'hour').annotate(count=Count('pk')).iterator():
+            yield kind, row['subject'], row['hour'], row['count']
+
+
+def backfill(batch_size=1000):
+    """
+    Rebuild every event rollup from ``SeenMedia`` and ``AdvertiseSeen``.
+    """
+    counts = defaultdict(int)
+    for kind, subject, hour, count in event_rows():
+        if subject is not None:
+            counts[kind, subject, hour] += count
+        counts[kind, ALL, hour] += count
+    rows = [EventRollup(kind=kind, subject=subject, hour=hour, count=count)
+            for (kind, subject, hour), count in counts.items()]
+    with transaction.atomic():
+        EventRollup.objects.all().delete()
+        EventRollup.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def bucket_size(start, end, bucket=None):
+    """
+    Seconds per bucket: ``bucket`` if given, else hourly up to ``TIMESERIES_HOURLY_MAX_DAYS``
+    and daily beyond, widened to a multiple of that so no series exceeds ``TIMESERIES_MAX_POINTS``.
+    """
+    span = (end - start).total_seconds()
+    if bucket is None:
+        bucket = 'hour' if span <= settings.TIMESERIES_HOURLY_MAX_DAYS * DAY else 'day'
+    seconds = BUCKETS[bucket]
+    return seconds * max(math.ceil(span / seconds / settings.TIMESERIES_MAX_POINTS), 1)
+
+
+def align(start, seconds):
+    """
+    Move ``start`` back to a bucket boundary: the hour, or midnight for buckets of whole days.
+    """
+    start = truncate_hour(timezone.localtime(start))
+    if seconds % DAY == 0:
+        start = start.replace(hour=0)
+    return start
+
+
+def series(kind, start, end, subject=ALL, bucket=None):
+    """
+    Event counts of ``kind`` between ``start`` and ``end`` in equal buckets, empty ones included.
+
+    Returns the bucket width in seconds, the bucket start times and the counts.
+    """
+    seconds = bucket_size(start, end, bucket)
+    start = align(start, seconds)
+    rows = EventRollup.objects.filter(kind=kind, subject=subject, hour__gte=start, hour__lt=end) \
+        .values_list('hour', 'count')
+    hours, counts = zip(*rows) if rows else ((), ())
+
+    origin = start.timestamp()
+    length = max(math.ceil((end.timestamp() - origin) / seconds), 1)
+    offsets = np.fromiter((hour.timestamp() for hour in hours), dtype=np.float64, count=len(hours)) - origin
+    totals = np.bincount((offsets // seconds).astype(np.int64), weights=np.asarray(counts, dtype=np.float64),
+                         minlength=length)[:length].astype(np.int64)
+    starts = origin + np.arange(length) * seconds
+    return seconds, [timezone.localtime(datetime.fromtimestamp(value, dt_timezone.utc)) for value in starts], \
+        totals.tolist()
@@ -4,7 +4,8 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from api.views import AuthViewSet, GenreViewSet, CountryViewSet, ArtistViewSet, MovieViewSet, SeriesViewSet, \
     SeasonViewSet, EpisodeViewSet, MediaGalleryViewSet, SliderViewSet, CollectionViewSet, CommentViewSet, RatingViewSet, \
-    DashboardViewSet, AdminMediaViewSet, MediaUploaderView, MediaViewSet
+    DashboardViewSet, AdminMediaViewSet, MediaUploaderView, MediaViewSet, MediaFileViewSet, ImageResizeView, \
+    AutocompleteViewSet, HeartbeatViewSet
 
 url = DefaultRouter()
 url.register('auth', AuthViewSet, basename='auth')
@@ -23,8 +24,12 @@ url.register('rating', RatingViewSet, basename='rating')
 url.register('dashboard', DashboardViewSet, basename='dashboard')
 url.register('admin/media', AdminMediaViewSet, basename='admin-media')
 url.register('media', MediaViewSet, basename='media')
+url.register('file', MediaFileViewSet, basename='file')
+url.register('autocomplete', AutocompleteViewSet, basename='autocomplete')
+url.register('heartbeat', HeartbeatViewSet, basename='heartbeat')
 
 urlpatterns = [
                   path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
                   path('upload/', MediaUploaderView.as_view(), name='upload'),
+                  path('image/', ImageResizeView.as_view(), name='image'),
               ] + url.get_urls()
@@ -1,40 +1,53 @@
-import os
 from datetime import timedelta
-from io import BytesIO
-from PIL import Image
+from django.conf import settings
 from django.contrib.sites.shortcuts import get_current_site
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 import mimetypes
-from moviepy.video.io.VideoFileClip import VideoFileClip
 from rest_framework import status, mixins, filters
 from rest_framework.decorators import action
-from rest_framework.exceptions import ValidationError, NotFound
+from rest_framework.exceptions import ValidationError, NotFound, Throttled
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ViewSet, ModelViewSet, GenericViewSet
 from django.core.mail import EmailMessage
-from advertise.models import AdvertiseSeen, Advertise
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404
+from django.db import transaction
+from advertise.models import Advertise
 from advertise.serializers import DashboardAdvertiseSerializer
-from api.permissions import IsSuperUser, IsOwner, CollectionRetrievePermission
+from api.cache import cached_response
+from api.conditional import conditional_response
+from api.filters import FullTextSearchFilter
+from api.permissions import IsSuperUser, IsOwner, CollectionRetrievePermission, CanPlay
+from api.resize import resolve_source, resize_cache, FITS, FORMATS
+from api import timeseries
+from api.rollups import header_totals
+from api.streaming import IgnoreClientContentNegotiation, stream_media_file
 from movie.models import Genre, Artist, Country, Movie, TvSeries, Season, Episode, MediaGallery, Slider, Collection, \
-    Media, Comment, Rating, SeenMedia, MediaFile, Cast
+    Media, Comment, Rating, MediaFile, Cast, ProcessingJob
+from movie import autocomplete, heartbeat
+from movie.jobs import enqueue
+from movie.uploads import write_part, upload_lock, assemble_parts, remove_parts, empty_bitmap, set_chunk, \
+    count_chunks, assign_file_name, write_chunk, content_digest
 from movie.serializers import GenreSerializer, CountrySerializer, ArtistSerializer, CreateMovieSerializer, \
     MovieSerializer, SeriesSerializer, CreateSeriesSerializer, SeasonSerializer, EpisodeSerializer, \
     MediaGallerySerializer, SliderSerializer, CollectionSerializer, MediaInputSerializer, CreateCommentSerializer, \
     RatingSerializer, DashboardCommentSerializer, DashboardSliderSerializer, AdminMovieSerializer, \
     AdminTvSeriesSerializer, AdminCollectionSerializer, CommentSerializer, MyCommentSerializer, \
-    UpdateCommentSerializer, CreateEpisodeSerializer, MediaSerializer, CreateSliderSerializer
+    UpdateCommentSerializer, CreateEpisodeSerializer, MediaSerializer, CreateSliderSerializer, MediaFileStatusSerializer, \
+    HeartbeatSerializer
 from plan.serializers import DashboardPlanSerializer
 from user.models import User
 from user.serializers import RegisterUserSerializer, LoginUserSerializers, LoginSuperUserSerializers, \
     DashboardUserSerializer
 from django.template.loader import render_to_string
-from django.db.models import Q, Exists, OuterRef, Case, When, Value, BooleanField
-from plan.models import Subscription, Plan
+from django.db.models import Case, When, Value, BooleanField, Prefetch
+from plan.models import Plan
 from django.db.models import Count
 
 
@@ -92,8 +105,9 @@ class ArtistViewSet(ModelViewSet):
     permission_classes = [IsSuperUser]
     serializer_class = ArtistSerializer
     queryset = Artist.objects.filter().order_by('-pk')
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name', 'id']
+    filter_backends = [FullTextSearchFilter]
+    search_fields = ['name', 'biography']
+    search_kind = 'artist'
 
 
 class MovieViewSet(ModelViewSet):
@@ -115,7 +129,6 @@ class MovieViewSet(ModelViewSet):
         elif self.action in ['retrieve', 'list']:
             return Movie.objects \
                 .select_related("media", "video", "media__trailer") \
-                .annotate(rating=Avg('media__rating__rating', default=0)) \
                 .prefetch_related(Prefetch("media__casts", queryset=Cast.objects.select_related('artist'),
                                            to_attr='media_casts'), "media__countries", "media__genres",
                                   Prefetch("media__comment_set",
@@ -131,6 +144,19 @@ class MovieViewSet(ModelViewSet):
             return super().get_object().media
         return super().get_object()
 
+    @conditional_response('movie:{pk}')
+    @cached_response('catalog', 'movie:{pk}')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(methods=['GET'], detail=True, url_path='stream', url_name='stream', permission_classes=[CanPlay],
+            content_negotiation_class=IgnoreClientContentNegotiation)
+    def stream(self, request, pk):
+        movie = get_object_or_404(CanPlay.published(Movie.objects.select_related('video', 'media'), request.user),
+                                  pk=pk, video__is_complete=True)
+        self.check_object_permissions(request, movie)
+        return stream_media_file(request, movie.video)
+
 
 class SeriesViewSet(ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
@@ -150,7 +176,6 @@ class SeriesViewSet(ModelViewSet):
             return TvSeries.objects.prefetch_related('season_set')
         if self.action in ['retrieve', 'list']:
             return TvSeries.objects.select_related("media", "media__trailer") \
-                .annotate(rating=Avg('media__rating__rating', default=0)) \
                 .prefetch_related(
                 Prefetch("media__casts", queryset=Cast.objects.select_related('artist').distinct('artist', 'position'),
                          to_attr='media_casts'), "media__countries", "media__genres",
@@ -170,7 +195,13 @@ class SeriesViewSet(ModelViewSet):
             return super().get_object().media
         return super().get_object()
 
+    @conditional_response('series:{pk}')
+    @cached_response('catalog', 'series:{pk}')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(methods=['GET'], detail=True, url_path='season', url_name='season')
+    @conditional_response('series:{pk}')
     def season(self, request, pk):
         queryset = Season.objects.filter(series_id=pk).annotate(episode_number=Count("episode")).order_by("-number")
         page = self.paginate_queryset(queryset)
@@ -182,15 +213,41 @@ class SeriesViewSet(ModelViewSet):
         return self.get_paginated_response(serializer.data)
 
 
+def with_episode_details(queryset, distinct_casts=False):
+    """
+    Everything ``EpisodeSerializer`` reads, in a fixed number of queries whatever the page size.
+
+    ``distinct_casts`` drops repeated artist and position pairs with DISTINCT ON, PostgreSQL only.
+    """
+    casts = Cast.objects.select_related('artist')
+    if distinct_casts:
+        casts = casts.distinct('artist', 'position')
+    return queryset.select_related("video", "trailer").prefetch_related(
+        Prefetch("casts", queryset=casts, to_attr='media_casts'),
+        Prefetch("comment_set",
+                 queryset=Comment.objects.filter(state=Comment.CommentState.ACCEPT).select_related('user', 'episode__season')
+                 .order_by('-created_at')[:5], to_attr='comments'),
+        Prefetch("mediagallery_set",
+                 queryset=MediaGallery.objects.select_related('file').order_by('-pk')[:5],
+                 to_attr='gallery'))
+
+
 class SeasonViewSet(ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
     permission_classes = [IsSuperUser]
     serializer_class = SeasonSerializer
     queryset = Season.objects.all()
+    query_budgets = {'episode': 10}
+
+    @conditional_response('season:{pk}')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     @action(methods=['GET'], detail=True, url_path='episode', url_name='episode')
+    @conditional_response('season:{pk}')
     def episode(self, request, pk):
-        queryset = self.get_object().episode_set.annotate(comments_count=Count("comment")).filter().order_by("-number")
+        queryset = with_episode_details(self.get_object().episode_set.annotate(comments_count=Count("comment"))) \
+            .order_by("-number")
         page = self.paginate_queryset(queryset)
         serializer = EpisodeSerializer(page, context={
             'request': self.request,
@@ -208,18 +265,7 @@ class EpisodeViewSet(ModelViewSet):
         if self.action in ['partial_update']:
             return Episode.objects.filter().order_by('-pk')
         elif self.action in ['retrieve', 'list']:
-            return Episode.objects.select_related("video", "trailer") \
-                .annotate(rating_avg=Avg('rating', default=0)) \
-                .prefetch_related(
-                Prefetch("casts", queryset=Cast.objects.select_related('artist').distinct('artist', 'position'),
-                         to_attr='media_casts'),
-                Prefetch("comment_set",
-                         queryset=Comment.objects.filter(state=Comment.CommentState.ACCEPT)
-                         .order_by('-created_at')[:5], to_attr='comments'),
-                Prefetch("mediagallery_set",
-                         queryset=MediaGallery.objects.order_by('-pk')[:5],
-                         to_attr='gallery')) \
-                .order_by('-pk')
+            return with_episode_details(Episode.objects.all(), distinct_casts=True).order_by('-pk')
 
         else:
             return TvSeries.objects.filter()
@@ -230,6 +276,18 @@ class EpisodeViewSet(ModelViewSet):
         elif self.action in ['retrieve', 'list']:
             return EpisodeSerializer
 
+    @conditional_response('episode:{pk}')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(methods=['GET'], detail=True, url_path='stream', url_name='stream', permission_classes=[CanPlay],
+            content_negotiation_class=IgnoreClientContentNegotiation)
+    def stream(self, request, pk):
+        episode = get_object_or_404(CanPlay.published(Episode.objects.select_related('video', 'season__series__media'),
+                                                      request.user), pk=pk, video__is_complete=True)
+        self.check_object_permissions(request, episode)
+        return stream_media_file(request, episode.video)
+
     @action(methods=['GET'], detail=True, url_path='gallery', url_name='gallery')
     def gallery(self, request, pk):
         queryset = MediaGallery.objects.filter(episode=pk).select_related('file').order_by("-pk")
@@ -276,10 +334,21 @@ class SliderViewSet(ModelViewSet):
         elif self.action in ['retrieve', 'list']:
             return SliderSerializer
 
+    @cached_response('catalog', 'slider')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response('catalog', 'slider')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class CollectionViewSet(ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
     serializer_class = CollectionSerializer
+    filter_backends = [FullTextSearchFilter]
+    search_fields = ['name']
+    search_kind = 'collection'
 
     def get_permissions(self):
         if self.action == 'list':
@@ -301,6 +370,10 @@ class CollectionViewSet(ModelViewSet):
             return Collection.objects.prefetch_related('media').filter()
         return Collection.objects.filter()
 
+    @cached_response('collection')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     @action(methods=['POST'], detail=True, url_path='state', url_name='state')
     def change_state(self, request, pk):
         state = request.data.get('state', None)
@@ -461,11 +534,6 @@ class RatingViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.DestroyModel
     queryset = Rating.objects.all()
     permission_classes = [IsAuthenticated]
 
-    def create(self, request, *args, **kwargs):
-        request.data._mutable = True
-        request.data['user'] = request.user.id
-        return super().create(request, *args, **kwargs)
-
     @action(methods=['get'], detail=False, url_name='my_rating', url_path='me')
     def me_rating(self, request):
         queryset = Rating.objects.filter(user=request.user).order_by('-created_at')
@@ -482,29 +550,23 @@ class RatingViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.DestroyModel
 class DashboardViewSet(GenericViewSet):
     http_method_names = ['get']
     permission_classes = [IsSuperUser]
+    query_budgets = {
+        'header_information': 3,
+        'recently_user': 3,
+        'popular_plan': 3,
+        'recently_comment': 4,
+        'advertise': 3,
+        'views_series': 3,
+        'advertise_series': 3,
+    }
 
     @action(methods=['get'], detail=False, url_name='header', url_path='header')
     def header_information(self, request):
-        now = timezone.now()
-        users = User.objects.aggregate(
-            total=Count('id'),
-            old=Count('id', filter=Q(date_joined__lte=now - timedelta(days=7))),
-        )
-        movies = SeenMedia.objects.aggregate(
-            total=Count('id'),
-            old=Count('id', filter=Q(created_at__lte=now - timedelta(days=7))),
-        )
-
-        vip = Subscription.objects.aggregate(
-            total=Count('id', filter=Q(end_date__gte=now)),
-            old=Count('id',
-                      filter=Q(end_date__gte=now - timedelta(days=7)) & Q(created_at__lte=now - timedelta(days=7))),
-        )
-
-        ads = AdvertiseSeen.objects.aggregate(
-            total=Count('id'),
-            old=Count('id', filter=Q(created_at__lte=now - timedelta(days=7)))
-        )
+        totals = header_totals()
+        users = {'total': totals['signups_total'], 'old': totals['signups_old']}
+        movies = {'total': totals['views_total'], 'old': totals['views_old']}
+        vip = {'total': totals['subscriptions_total'], 'old': totals['subscriptions_old']}
+        ads = {'total': totals['ad_impressions_total'], 'old': totals['ad_impressions_old']}
 
         user_ratio = 0
         if users['total'] > 100:
@@ -537,25 +599,20 @@ class DashboardViewSet(GenericViewSet):
 
     @action(methods=['get'], detail=False, url_name='recently_user', url_path='recently_user')
     def recently_user(self, request):
-        now = timezone.now()
-        is_premium = Exists(Subscription.objects.filter(user=OuterRef("pk"), end_date__gt=now))
-        seen_movies = Count("seenmedia")
-        recently_users = User.objects.filter(is_superuser=False).annotate(seen_movies=seen_movies,
-                                                                          is_premium=is_premium).order_by(
-            "-date_joined").all()[:10]
+        recently_users = User.objects.filter(is_superuser=False).select_related('stats').order_by("-date_joined")[:10]
         recently_users_serializer = DashboardUserSerializer(recently_users, many=True)
 
         return Response(recently_users_serializer.data)
 
     @action(methods=['get'], detail=False, url_name='popular_plan', url_path='popular_plan')
     def popular_plan(self, request):
-        plan = Plan.objects.annotate(count_of_sub=Count("subscription")).order_by("-count_of_sub").all()[:10]
+        plan = Plan.objects.order_by("-subscription_count")[:10]
         plan_serializer = DashboardPlanSerializer(plan, many=True)
         return Response(plan_serializer.data)
 
     @action(methods=['get'], detail=False, url_name='recently_comment', url_path='recently_comment')
     def recently_comment(self, request):
-        comment = Comment.objects.all().order_by("-created_at")[:10]
+        comment = Comment.objects.select_related('user', 'media').order_by("-created_at")[:10]
         comment_serializer = DashboardCommentSerializer(comment, context={
             'request': self.request,
             'format': self.format_kwarg,
@@ -575,18 +632,57 @@ class DashboardViewSet(GenericViewSet):
 
     @action(methods=['get'], detail=False, url_name='advertise', url_path='advertise')
     def advertise(self, request):
-        advertise = Advertise.objects.annotate(view_number=Count("advertiseseen")).order_by("-created_at").all()[:10]
+        advertise = Advertise.objects.order_by("-created_at")[:10]
         advertise_serializer = DashboardAdvertiseSerializer(advertise, many=True)
         return Response(advertise_serializer.data)
 
+    def time_series(self, kind, subject_param):
+        params = self.request.query_params
+        now = timezone.now()
+        try:
+            end = parse_datetime(params['end']) if 'end' in params else now
+            start = parse_datetime(params['start']) if 'start' in params else end - timedelta(days=7)
+            subject = int(params.get(subject_param, timeseries.ALL))
+        except ValueError:
+            raise ValidationError(detail={'detail': 'start and end must be ISO 8601 datetimes, '
+                                                    f'{subject_param} an id.'})
+        if start is None or end is None:
+            raise ValidationError(detail={'detail': 'start and end must be ISO 8601 datetimes.'})
+        bucket = params.get('bucket')
+        if bucket is not None and bucket not in timeseries.BUCKETS:
+            raise ValidationError(detail={'bucket': f"Must be one of {', '.join(timeseries.BUCKETS)}."})
+        start, end = [value if timezone.is_aware(value) else timezone.make_aware(value) for value in (start, end)]
+        if start >= end:
+            raise ValidationError(detail={'detail': 'start must be before end.'})
+
+        seconds, starts, counts = timeseries.series(kind, start, end, subject, bucket)
+        return Response({
+            'bucket_seconds': seconds,
+            'start': starts[0],
+            'end': end,
+            'total': sum(counts),
+            'points': [{'start': bucket_start, 'count': count} for bucket_start, count in zip(starts, counts)],
+        })
+
+    @action(methods=['get'], detail=False, url_name='views_series', url_path='views_series')
+    def views_series(self, request):
+        return self.time_series(timeseries.VIEWS, 'media')
+
+    @action(methods=['get'], detail=False, url_name='advertise_series', url_path='advertise_series')
+    def advertise_series(self, request):
+        return self.time_series(timeseries.AD_IMPRESSIONS, 'advertise')
+
 
 class AdminMediaViewSet(GenericViewSet):
     http_method_names = ['get']
     permission_classes = [IsSuperUser]
+    count_strategy = 'estimated'
+    query_budgets = {'movie': 8, 'series': 8}
 
     @action(methods=['get'], detail=False, url_name='movie', url_path='movie')
     def movie(self, request, *args, **kwargs):
-        movies = Movie.objects.select_related('media').order_by('-pk')
+        movies = Movie.objects.select_related('media').prefetch_related('media__genres', 'media__countries') \
+            .order_by('-pk')
         queryset = self.filter_queryset(movies)
         page = self.paginate_queryset(queryset)
         serializer = AdminMovieSerializer(page, many=True)
@@ -594,7 +690,8 @@ class AdminMediaViewSet(GenericViewSet):
 
     @action(methods=['get'], detail=False, url_name='series', url_path='series')
     def series(self, request, *args, **kwargs):
-        series = TvSeries.objects.select_related('media').order_by('-pk')
+        series = TvSeries.objects.select_related('media').prefetch_related('media__genres', 'media__countries') \
+            .order_by('-pk')
         queryset = self.filter_queryset(series)
         page = self.paginate_queryset(queryset)
         serializer = AdminTvSeriesSerializer(page, many=True)
@@ -653,6 +750,20 @@ class AdminMediaViewSet(GenericViewSet):
         return self.get_paginated_response(serializer.data)
 
 
+class MediaFileViewSet(GenericViewSet):
+    """
+    Raw uploads, attached to a title or not; viewers play titles through their own ``stream`` action.
+    """
+    http_method_names = ['get', 'head']
+    permission_classes = [IsSuperUser]
+    queryset = MediaFile.objects.filter(is_complete=True)
+
+    @action(methods=['GET'], detail=True, url_path='stream', url_name='stream',
+            content_negotiation_class=IgnoreClientContentNegotiation)
+    def stream(self, request, pk):
+        return stream_media_file(request, self.get_object())
+
+
 class MediaUploaderView(APIView):
     parser_classes = (MultiPartParser, FormParser)
     permission_classes = [IsSuperUser]
@@ -662,6 +773,7 @@ class MediaUploaderView(APIView):
         chunk_index = int(request.data.get("chunk_index", 0))
         upload_id = request.data.get("id", None)
         total_chunk = request.data.get("total_chunk", None)
+        parallel = str(request.data.get("parallel", "")).lower() in ("1", "true")
 
         if file_obj is None:
             raise ValidationError({"file": ["This field is required."]})
@@ -671,9 +783,16 @@ class MediaUploaderView(APIView):
 
         total_chunk = int(total_chunk)
 
+        if file_obj.size > settings.MEDIA_UPLOAD_MAX_CHUNK_SIZE:
+            raise ValidationError(
+                {"file": [f"Chunk size must not exceed {settings.MEDIA_UPLOAD_MAX_CHUNK_SIZE} bytes."]})
+
         if chunk_index + 1 > total_chunk:
             raise ValidationError("chunk index must be less than total chunk")
 
+        if chunk_index < 0:
+            raise ValidationError({"chunk_index": ["This field must not be negative."]})
+
         if upload_id is not None:
             try:
                 media_file = MediaFile.objects.get(upload_id=upload_id, user=request.user, total_chunk=total_chunk,
@@ -682,58 +801,104 @@ class MediaUploaderView(APIView):
                 if media_file.is_expire():
                     return Response(status=status.HTTP_410_GONE)
 
+                if media_file.is_parallel:
+                    return self.receive_part(media_file, chunk_index, file_obj)
+
                 if chunk_index != media_file.chunks_uploaded + 1:
                     return Response({"upload_id": media_file.upload_id, "chunk_index": media_file.chunks_uploaded + 1},
                                     status=status.HTTP_200_OK)
 
-                file_path = media_file.file.path
-                with open(file_path, 'ab') as f:
-                    f.write(file_obj.read())
+                media_file.chunk_digests[str(chunk_index)] = write_chunk(file_obj, media_file.file.path, append=True)
 
                 media_file.chunks_uploaded = chunk_index
                 media_file.save()
 
             except MediaFile.DoesNotExist:
                 raise NotFound("file is not exist")
+        elif parallel:
+            media_file = MediaFile(user=request.user, total_chunk=total_chunk, is_parallel=True,
+                                   chunks_bitmap=empty_bitmap(total_chunk))
+            assign_file_name(media_file, file_obj.name)
+            media_file.save()
+            return self.receive_part(media_file, chunk_index, file_obj)
         else:
             if chunk_index != 0:
                 raise ValidationError({"chunk_index": ["This field must be 0."]})
-            media_file = MediaFile.objects.create(user=request.user, file=file_obj, total_chunk=total_chunk)
+            media_file = MediaFile(user=request.user, total_chunk=total_chunk)
+            assign_file_name(media_file, file_obj.name)
+            media_file.chunk_digests[str(chunk_index)] = write_chunk(file_obj, media_file.file.path)
+            media_file.save()
 
         if total_chunk == chunk_index + 1:
-            media_file.is_complete = True
-            mimetype, encoding = mimetypes.guess_type(media_file.file.path)
-            media_file.mimetype = mimetype
-            if "video" in mimetype:
-                try:
-                    video = VideoFileClip(media_file.file.path)
-                    thumb_temp = video.get_frame(video.duration * 0.3 if video.duration * 0.3 < 5 else 5)
-                    image = Image.fromarray(thumb_temp)
-                    thumbnail_buffer = BytesIO()
-                    image.save(thumbnail_buffer, format='JPEG')
-                    thumbnail_buffer.seek(0)
-                    media_file.thumbnail.save(name=os.path.splitext(media_file.file.name)[0] + ".jpeg",
-                                              content=thumbnail_buffer)
-                    thumbnail_buffer.close()
-                    video.close()
-                except Exception:
-                    pass
-
-            media_file.save()
-            return Response({"id": media_file.pk, "upload_id": media_file.upload_id, "is_complete": True},
-                            status=status.HTTP_201_CREATED)
+            return self.complete_upload(media_file)
 
         return Response({"upload_id": media_file.upload_id, "chunk_index": media_file.chunks_uploaded + 1},
                         status=status.HTTP_200_OK)
 
+    def receive_part(self, media_file, chunk_index, file_obj):
+        digest = write_part(media_file, chunk_index, file_obj)
+
+        with upload_lock(media_file):
+            media_file.refresh_from_db()
+            if media_file.is_complete:
+                remove_parts(media_file)
+                return Response({"id": media_file.pk, "upload_id": media_file.upload_id, "is_complete": True},
+                                status=status.HTTP_201_CREATED)
+
+            media_file.chunks_bitmap = set_chunk(media_file.chunks_bitmap, chunk_index)
+            media_file.chunks_uploaded = count_chunks(media_file.chunks_bitmap)
+            media_file.chunk_digests[str(chunk_index)] = digest
+            if media_file.chunks_uploaded == media_file.total_chunk:
+                assemble_parts(media_file)
+                return self.complete_upload(media_file)
+
+            media_file.save(update_fields=['chunks_bitmap', 'chunks_uploaded', 'chunk_digests'])
+
+        return Response({"upload_id": media_file.upload_id, "chunks_uploaded": media_file.chunks_uploaded,
+                         "total_chunk": media_file.total_chunk}, status=status.HTTP_200_OK)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            media_file = MediaFile.objects.get(upload_id=request.query_params.get("id", None), user=request.user)
+        except MediaFile.DoesNotExist:
+            raise NotFound("file is not exist")
+
+        return Response(MediaFileStatusSerializer(media_file, context={'request': request}).data,
+                        status=status.HTTP_200_OK)
+
+    @staticmethod
+    def complete_upload(media_file):
+        media_file.is_complete = True
+        mimetype, encoding = mimetypes.guess_type(media_file.file.path)
+        media_file.mimetype = mimetype
+        is_video = mimetype is not None and "video" in mimetype
+        media_file.processing_state = MediaFile.ProcessingState.PENDING if is_video \
+            else MediaFile.ProcessingState.READY
+        media_file.content_hash = content_digest(media_file.chunk_digests, media_file.total_chunk)
+        stored_name = media_file.file.name
+        is_duplicate = media_file.content_hash is not None and media_file.link_duplicate()
+
+        with transaction.atomic():
+            media_file.save()
+            if media_file.processing_state == MediaFile.ProcessingState.PENDING:
+                enqueue(ProcessingJob.JobKind.THUMBNAIL, media_file)
+                enqueue(ProcessingJob.JobKind.PREVIEW_TRACK, media_file)
+
+        if is_duplicate:
+            media_file.file.storage.delete(stored_name)
+
+        return Response({"id": media_file.pk, "upload_id": media_file.upload_id, "is_complete": True},
+                        status=status.HTTP_201_CREATED)
+
 
 class MediaViewSet(GenericViewSet, mixins.ListModelMixin):
     http_method_names = ['get']
     permission_classes = [IsSuperUser]
     serializer_class = MediaSerializer
     queryset = Media.objects.filter().order_by('-pk')
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name', 'id', 'synopsis']
+    filter_backends = [FullTextSearchFilter]
+    search_fields = ['name', 'synopsis']
+    search_kind = 'media'
 
     @action(methods=['GET'], detail=True, url_path='gallery', url_name='gallery')
     def gallery(self, request, pk):
@@ -745,3 +910,73 @@ class MediaViewSet(GenericViewSet, mixins.ListModelMixin):
             'view': self
         })
         return self.get_paginated_response(serializer.data)
+
+
+class AutocompleteViewSet(ViewSet):
+    permission_classes = [IsSuperUser]
+
+    def list(self, request):
+        kind = request.query_params.get("kind", "media")
+        if kind not in autocomplete.LOADERS:
+            raise ValidationError({"kind": [f"{kind} is not a valid choice."]})
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), settings.AUTOCOMPLETE_MAX_LIMIT)
+        except ValueError:
+            raise ValidationError({"limit": ["limit must be an integer."]})
+
+        suggestions = autocomplete.suggest(kind, request.query_params.get("q", ""), max(limit, 1))
+        return Response([{"id": pk, "name": name} for pk, name in suggestions])
+
+
+class HeartbeatViewSet(ViewSet):
+    """
+    Playback progress reported by players every few seconds, stored in batches by ``movie.heartbeat``.
+    """
+    permission_classes = [IsAuthenticated]
+    query_budget = 1
+
+    def create(self, request):
+        serializer = HeartbeatSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            heartbeat.get_buffer().add(request.user.pk, data.get('movie'), data.get('episode'), data['position'])
+        except heartbeat.BufferFull:
+            raise Throttled(wait=settings.HEARTBEAT_FLUSH_INTERVAL, detail="Too many active streams, retry later.")
+        return Response(status=status.HTTP_202_ACCEPTED)
+
+
+class ImageResizeView(APIView):
+    """
+    Resized copies of the public catalog images, open to everyone. Uploaded media files and
+    anything outside ``IMAGE_RESIZE_DIRECTORIES`` are not served.
+    """
+    permission_classes = [AllowAny]
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request, *args, **kwargs):
+        try:
+            width = int(request.query_params.get("w", 0))
+            height = int(request.query_params.get("h", 0))
+        except ValueError:
+            raise ValidationError({"size": ["w and h must be integers."]})
+
+        if (width, height) not in settings.IMAGE_RESIZE_SIZES:
+            raise ValidationError({"size": [f"{width}x{height} is not an allowed size."]})
+
+        fit = request.query_params.get("fit", "cover")
+        if fit not in FITS:
+            raise ValidationError({"fit": [f"{fit} is not a valid choice."]})
+
+        image_format = request.query_params.get("format", "webp")
+        if image_format not in FORMATS:
+            raise ValidationError({"format": [f"{image_format} is not a valid choice."]})
+
+        source = resolve_source(request.query_params.get("path", ""))
+        if source is None:
+            raise NotFound("image is not exist")
+
+        path = resize_cache.get(source, width, height, fit, image_format)
+        response = FileResponse(open(path, 'rb'), content_type=FORMATS[image_format][1])
+        response['Cache-Control'] = f"public, max-age={settings.IMAGE_RESIZE_MAX_AGE}"
+        return response
@@ -0,0 +1,240 @@
+import heapq
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import PyLibMCCache, PyMemcacheCache
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+from django.db.models import Count
+
+from movie.models import Media, Artist
+
+WORD_RE = re.compile(r'\w+')
+GENERATION_KEY = 'autocomplete:generation'
+# Removals are logged under numbered keys for the other processes; one that finds an entry gone
+# from the cache, or too many to catch up with, rebuilds instead.
+REMOVED_KEY = 'autocomplete:removed'
+REMOVED_TIMEOUT = 24 * 60 * 60
+REMOVED_MAX_CATCH_UP = 1000
+# Two processes may draw the same serial from the other backends' incr (a get and a set), and one of
+# the removals would be lost; with those every removal makes the other processes rebuild instead.
+ATOMIC_INCR_BACKENDS = (RedisCache, PyMemcacheCache, PyLibMCCache, LocMemCache)
+# Prefixes this short match a large share of the keys; their suggestions are memoized.
+MEMO_PREFIX_LENGTH = 2
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall(text.casefold()))
+
+
+def name_keys(name):
+    """
+    Every word of a name starts a key, so ``god`` finds "The Godfather".
+    """
+    words = normalize(name).split(' ')
+    return [' '.join(words[index:]) for index in range(len(words)) if words[index]]
+
+
+class PrefixIndex:
+    """
+    Names of one kind of object in a sorted array of ``(key, pk)`` searched with bisect.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.names = {}
+        self.popularity = {}
+        self.memo = {}
+        self.lock = threading.Lock()
+
+    def load(self, rows):
+        keys, names, popularity = [], {}, {}
+        for pk, name, score in rows:
+            names[pk], popularity[pk] = name, score or 0
+            keys += [(key, pk) for key in name_keys(name)]
+        keys.sort()
+        with self.lock:
+            self.keys, self.names, self.popularity = keys, names, popularity
+            self.memo = {}
+
+    def _remove(self, pk):
+        self.memo = {}
+        for key in name_keys(self.names.pop(pk, '')):
+            index = bisect_left(self.keys, (key, pk))
+            if index < len(self.keys) and self.keys[index] == (key, pk):
+                del self.keys[index]
+
+    def add(self, pk, name, popularity=None):
+        with self.lock:
+            self._remove(pk)
+            self.names[pk] = name
+            if popularity is not None or pk not in self.popularity:
+                self.popularity[pk] = popularity or 0
+            for key in name_keys(name):
+                insort(self.keys, (key, pk))
+
+    def remove(self, pk):
+        with self.lock:
+            self._remove(pk)
+            self.popularity.pop(pk, None)
+
+    def adjust(self, pk, delta):
+        with self.lock:
+            if pk in self.popularity:
+                self.popularity[pk] += delta
+                self.memo = {}
+
+    def suggest(self, prefix, limit):
+        """
+        Up to ``limit`` ``(pk, name)`` whose name has a word starting with ``prefix``, most popular first.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self.lock:
+            memoized = len(prefix) <= MEMO_PREFIX_LENGTH
+            if memoized and (prefix, limit) in self.memo:
+                return self.memo[prefix, limit]
+
+            start = bisect_left(self.keys, (prefix,))
+            end = bisect_left(self.keys, (prefix + '\U0010ffff',), start)
+            pks = {pk for _, pk in self.keys[start:end]}
+            best = heapq.nlargest(limit, pks, key=lambda pk: (self.popularity[pk], -pk))
+            suggestions = [(pk, self.names[pk]) for pk in best]
+            if memoized:
+                self.memo[prefix, limit] = suggestions
+            return suggestions
+
+
+def media_rows():
+    return Media.objects.values_list('pk', 'name', 'rating_count').iterator()
+
+
+def artist_rows():
+    return Artist.objects.annotate(popularity=Count('cast')).values_list('pk', 'name', 'popularity').iterator()
+
+
+LOADERS = {
+    'media': media_rows,
+    'artist': artist_rows,
+}
+
+indexes = {}
+state = {'generation': None, 'removed': None, 'checked_at': 0.0}
+state_lock = threading.Lock()
+
+
+def generation_cache():
+    return caches[settings.AUTOCOMPLETE_CACHE]
+
+
+def removed_key(serial):
+    return f'{REMOVED_KEY}:{serial}'
+
+
+def forget_removed(since, serial):
+    """
+    Remove the entries logged between ``since`` and ``serial`` from the local indexes.
+    Returns False when they can't all be read and the indexes must be rebuilt.
+    """
+    if since is None or serial <= since:
+        return True
+    if serial - since > REMOVED_MAX_CATCH_UP:
+        return False
+    removals = generation_cache().get_many([removed_key(number) for number in range(since + 1, serial + 1)])
+    if len(removals) < serial - since:
+        return False
+    for kind, pk in removals.values():
+        index = indexes.get(kind)
+        if index is not None:
+            index.remove(pk)
+    return True
+
+
+def get_index(kind):
+    """
+    The index of ``kind``, built on first use. It is rebuilt once another process renames an
+    entry, and the entries other processes removed are dropped from it.
+
+    Processes share a generation token and the removal log in a cache every
+    ``AUTOCOMPLETE_CHECK_INTERVAL`` seconds at most, so most suggestions touch neither the cache
+    nor the database.
+    """
+    now = time.monotonic()
+    if now - state['checked_at'] >= settings.AUTOCOMPLETE_CHECK_INTERVAL:
+        with state_lock:
+            shared = generation_cache().get_many([GENERATION_KEY, REMOVED_KEY])
+            generation, serial = shared.get(GENERATION_KEY), shared.get(REMOVED_KEY, 0)
+            if generation != state['generation'] or not forget_removed(state['removed'], serial):
+                indexes.clear()
+                state['generation'] = generation
+            state['removed'] = serial
+            state['checked_at'] = now
+
+    index = indexes.get(kind)
+    if index is None:
+        index = PrefixIndex()
+        index.load(LOADERS[kind]())
+        indexes[kind] = index
+    return index
+
+
+def new_generation():
+    generation = uuid.uuid4().hex
+    generation_cache().set(GENERATION_KEY, generation, timeout=None)
+    with state_lock:
+        state['generation'] = generation
+
+
+def renamed(kind, update):
+    """
+    Once the transaction commits, apply ``update`` to the local index of ``kind`` and tell the
+    other processes to rebuild theirs.
+    """
+    def apply():
+        new_generation()
+        index = indexes.get(kind)
+        if index is not None:
+            update(index)
+
+    transaction.on_commit(apply)
+
+
+def removed(kind, pk):
+    """
+    Once the transaction commits, remove ``pk`` from the local index of ``kind`` and log the
+    removal so the other processes remove just that entry too. Without an atomic incr in
+    ``AUTOCOMPLETE_CACHE`` the other processes rebuild their indexes instead.
+    """
+    def apply():
+        cache = generation_cache()
+        if isinstance(cache, ATOMIC_INCR_BACKENDS):
+            cache.add(REMOVED_KEY, 0, timeout=None)
+            serial = cache.incr(REMOVED_KEY)
+            cache.set(removed_key(serial), (kind, pk), timeout=REMOVED_TIMEOUT)
+        else:
+            new_generation()
+        index = indexes.get(kind)
+        if index is not None:
+            index.remove(pk)
+
+    transaction.on_commit(apply)
+
+
+def adjust_popularity(kind, pk, delta):
+    """
+    Popularity only moves the local index; other processes pick it up with their next rebuild.
+    """
+    index = indexes.get(kind)
+    if index is not None:
+        transaction.on_commit(lambda: index.adjust(pk, delta))
+
+
+def suggest(kind, prefix, limit):
+    return get_index(kind).suggest(prefix, limit)
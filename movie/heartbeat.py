@@ -0,0 +1,242 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction, close_old_connections, router
+from django.db.models import Q
+from django.dispatch import Signal
+
+from movie.models import SeenMedia, Movie, Episode
+from user.models import User
+
+logger = logging.getLogger(__name__)
+
+SPILL_SUFFIX = '.jsonl'
+ROTATED_SUFFIX = '.flushing'
+
+# Sent with ``instances``, the SeenMedia rows a flush created, so counters apply one update per key.
+sessions_started = Signal()
+
+
+class BufferFull(Exception):
+    pass
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def merge(pending, key, position, at):
+    """
+    Keep the most recent heartbeat of a stream.
+    """
+    current = pending.get(key)
+    if current is None or current[1] <= at:
+        pending[key] = (position, at)
+
+
+def write(pending, batch_size=1000):
+    """
+    Store ``{(user, movie, episode): (position, at)}``: move the position of each stream's
+    SeenMedia, or create one when the stream was idle for longer than ``HEARTBEAT_SESSION_TIMEOUT``.
+
+    ``bulk_create`` sends no ``post_save``; the created rows are sent together in ``sessions_started``
+    instead. Heartbeats older than the stored position are ignored, which makes replaying a spill
+    file harmless. Returns the number of rows written.
+    """
+    users = set(User.objects.filter(pk__in={key[0] for key in pending}).values_list('pk', flat=True))
+    movies = set(Movie.objects.filter(pk__in={key[1] for key in pending if key[1]}).values_list('pk', flat=True))
+    episodes = set(Episode.objects.filter(pk__in={key[2] for key in pending if key[2]}).values_list('pk', flat=True))
+    pending = {key: value for key, value in pending.items()
+               if key[0] in users and (key[1] in movies if key[1] else key[2] in episodes)}
+    if not pending:
+        return 0
+
+    timeout = timedelta(seconds=settings.HEARTBEAT_SESSION_TIMEOUT)
+    oldest = datetime.fromtimestamp(min(at for _, at in pending.values()), dt_timezone.utc)
+    current = {}
+    for row in SeenMedia.objects.filter(Q(movie__in=movies) | Q(episode__in=episodes), user__in=users,
+                                        updated_at__gte=oldest - timeout).order_by('updated_at'):
+        current[row.user_id, row.movie_id, row.episode_id] = row
+
+    updated, created = [], []
+    for (user_id, movie_id, episode_id), (position, at) in pending.items():
+        at = datetime.fromtimestamp(at, dt_timezone.utc)
+        row = current.get((user_id, movie_id, episode_id))
+        if row is None or row.updated_at < at - timeout:
+            created.append(SeenMedia(user_id=user_id, movie_id=movie_id, episode_id=episode_id, position=position))
+        elif row.updated_at < at:
+            row.position, row.updated_at = position, at
+            updated.append(row)
+
+    using = router.db_for_write(SeenMedia)
+    with transaction.atomic(using=using):
+        SeenMedia.objects.bulk_update(updated, ['position', 'updated_at'], batch_size=batch_size)
+        SeenMedia.objects.bulk_create(created, batch_size=batch_size)
+        if created:
+            sessions_started.send(sender=SeenMedia, instances=created, using=using)
+    return len(updated) + len(created)
+
+
+class HeartbeatBuffer:
+    """
+    The latest position of every active stream ``(user, movie, episode)``, written to the
+    database in batches every ``flush_interval`` seconds or once ``flush_size`` streams are waiting.
+
+    A stream's heartbeats replace each other, so memory grows with the number of streams and is
+    capped at ``max_streams``; past that, new streams get ``BufferFull``. Every heartbeat is first
+    appended to a spill file of this process, which a later process replays if this one dies
+    before flushing it.
+    """
+
+    def __init__(self, spill_dir, max_streams, flush_size, flush_interval):
+        self.spill_dir = spill_dir
+        self.max_streams = max_streams
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self.pending = {}
+        self.spilled = []
+        self.spill = None
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        os.makedirs(spill_dir, exist_ok=True)
+
+    @property
+    def spill_path(self):
+        return os.path.join(self.spill_dir, f'{self.pid}{SPILL_SUFFIX}')
+
+    def add(self, user_id, movie_id, episode_id, position, at=None):
+        key = (user_id, movie_id, episode_id)
+        at = at or time.time()
+        with self.lock:
+            if key not in self.pending and len(self.pending) >= self.max_streams:
+                raise BufferFull()
+            if self.spill is None:
+                self.spill = open(self.spill_path, 'a')
+            self.spill.write(json.dumps([user_id, movie_id, episode_id, position, at]) + '\n')
+            self.spill.flush()
+            merge(self.pending, key, position, at)
+            waiting = len(self.pending)
+        if waiting >= self.flush_size:
+            self.wakeup.set()
+        self.start()
+
+    def rotate(self):
+        """
+        Close the spill file holding the pending heartbeats; a new one is opened by the next heartbeat.
+        """
+        if self.spill is None:
+            return
+        self.spill.close()
+        self.spill = None
+        rotated = os.path.join(self.spill_dir, f'{self.pid}.{time.time_ns()}{ROTATED_SUFFIX}')
+        os.replace(self.spill_path, rotated)
+        self.spilled.append(rotated)
+
+    def replay(self):
+        """
+        Take over the spill files of processes that are gone and queue their heartbeats.
+        """
+        for name in sorted(os.listdir(self.spill_dir)):
+            if not name.endswith((SPILL_SUFFIX, ROTATED_SUFFIX)):
+                continue
+            try:
+                pid = int(name.split('.')[0])
+            except ValueError:
+                continue
+            if pid != self.pid and process_alive(pid):
+                continue
+            claimed = os.path.join(self.spill_dir, f'{self.pid}.{time.time_ns()}{ROTATED_SUFFIX}')
+            try:
+                os.rename(os.path.join(self.spill_dir, name), claimed)
+            except FileNotFoundError:
+                # Another process claimed it first.
+                continue
+            with open(claimed) as file, self.lock:
+                for line in file:
+                    try:
+                        user_id, movie_id, episode_id, position, at = json.loads(line)
+                    except ValueError:
+                        # The last line of a crashed process may be cut short.
+                        continue
+                    merge(self.pending, (user_id, movie_id, episode_id), position, at)
+                self.spilled.append(claimed)
+            logger.info("Replayed heartbeat spill file %s", name)
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                self.rotate()
+                spilled, self.spilled = self.spilled, []
+            try:
+                written = write(pending) if pending else 0
+            except Exception:
+                with self.lock:
+                    for key, (position, at) in pending.items():
+                        merge(self.pending, key, position, at)
+                    self.spilled = spilled + self.spilled
+                raise
+            for path in spilled:
+                os.remove(path)
+            return written
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='heartbeat-flusher', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Heartbeat flush failed, %s streams kept for the next one", len(self.pending))
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """
+    The buffer of this process, created on first use (again after a fork) and seeded with the
+    heartbeats left behind by dead processes.
+    """
+    global _buffer
+    if _buffer is None or _buffer.pid != os.getpid():
+        with _buffer_lock:
+            if _buffer is None or _buffer.pid != os.getpid():
+                buffer = HeartbeatBuffer(settings.HEARTBEAT_SPILL_DIR, settings.HEARTBEAT_MAX_STREAMS,
+                                         settings.HEARTBEAT_FLUSH_SIZE, settings.HEARTBEAT_FLUSH_INTERVAL)
+                buffer.replay()
+                atexit.register(flush_at_exit, buffer)
+                _buffer = buffer
+    return _buffer
+
+
+def flush_at_exit(buffer):
+    try:
+        buffer.flush()
+    except Exception:
+        logger.exception("Heartbeat flush at exit failed, the spill file is replayed on the next start")
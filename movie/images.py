@@ -0,0 +1,109 @@
+import os
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import ImageField
+
+PIL_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+
+
+def derivative_name(name, width, image_format):
+    root, _ = os.path.splitext(name)
+    return f"{root}-{width}w.{image_format}"
+
+
+def derivative_names(name):
+    return [derivative_name(name, width, image_format)
+            for width in settings.IMAGE_DERIVATIVE_WIDTHS
+            for image_format in settings.IMAGE_DERIVATIVE_FORMATS]
+
+
+def completion_marker(name):
+    """
+    The derivative written last by ``generate_derivatives``; once it exists, all of them do.
+    """
+    return derivative_name(name, min(settings.IMAGE_DERIVATIVE_WIDTHS), settings.IMAGE_DERIVATIVE_FORMATS[-1])
+
+
+def has_derivatives(field_file):
+    """
+    Whether the derivatives of ``field_file`` were recorded on its row, without touching the storage.
+    """
+    return field_file.name in getattr(field_file.instance, 'derived_images', ())
+
+
+def image_names(instance):
+    return {getattr(instance, field.name).name for field in instance._meta.fields if isinstance(field, ImageField)}
+
+
+def record_derivatives(instance, field_name):
+    """
+    Add the image of ``field_name`` to the row's ``derived_images`` and drop the images it no
+    longer uses. Nothing is recorded when the image was replaced since ``instance`` was loaded;
+    the job queued for the new image records that one.
+    """
+    model = type(instance)
+    with transaction.atomic():
+        current = model.objects.select_for_update().filter(pk=instance.pk).first()
+        name = getattr(instance, field_name).name
+        if current is None or getattr(current, field_name).name != name:
+            return
+        in_use = image_names(current)
+        derived = [derived for derived in current.derived_images if derived in in_use and derived != name]
+        model.objects.filter(pk=instance.pk).update(derived_images=derived + [name])
+
+
+def generate_derivatives(field_file):
+    """
+    Store a downscaled copy of ``field_file`` next to it for every configured width and format.
+
+    Images are never upscaled: widths above the original are stored at the original width.
+    """
+    storage = field_file.storage
+    with storage.open(field_file.name) as f:
+        image = Image.open(f)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+
+    for width in sorted(settings.IMAGE_DERIVATIVE_WIDTHS, reverse=True):
+        target_width = min(width, image.width)
+        target_height = max(round(image.height * target_width / image.width), 1)
+        resized = image.resize((target_width, target_height), Image.LANCZOS)
+        for image_format in settings.IMAGE_DERIVATIVE_FORMATS:
+            converted = resized
+            if image_format == 'jpeg' and resized.mode != 'RGB':
+                converted = resized.convert('RGB')
+            elif resized.mode not in ('RGB', 'RGBA'):
+                converted = resized.convert('RGBA')
+
+            buffer = BytesIO()
+            converted.save(buffer, format=PIL_FORMATS[image_format], quality=settings.IMAGE_DERIVATIVE_QUALITY)
+            name = derivative_name(field_file.name, width, image_format)
+            storage.delete(name)
+            storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def delete_derivatives(storage, name):
+    for derivative in derivative_names(name):
+        storage.delete(derivative)
+
+
+def srcset(field_file):
+    """
+    Map of ``"<width>w"`` to the derivative URL per format, or None until the derivatives exist.
+    """
+    if not field_file or not has_derivatives(field_file):
+        return None
+    return {
+        f"{width}w": {
+            image_format: field_file.storage.url(derivative_name(field_file.name, width, image_format))
+            for image_format in settings.IMAGE_DERIVATIVE_FORMATS
+        }
+        for width in settings.IMAGE_DERIVATIVE_WIDTHS
+    }
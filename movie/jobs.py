@@ -0,0 +1,93 @@
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+
+from movie.models import ProcessingJob, MediaFile
+
+HANDLERS = {}
+
+# Sent after a job ran and its media file's processing state was updated, with ``job``.
+job_finished = Signal()
+
+
+def register(kind):
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+
+    return decorator
+
+
+def enqueue(kind, media_file=None, payload=None):
+    return ProcessingJob.objects.create(kind=kind, media_file=media_file, payload=payload or {})
+
+
+def claim(limit):
+    """
+    Move up to ``limit`` pending jobs to the running state and return their ids.
+
+    A job is only claimed when the conditional update succeeds, so several workers can
+    drain the same queue without running a job twice.
+    """
+    candidates = ProcessingJob.objects.filter(state=ProcessingJob.JobState.PENDING) \
+                     .order_by('created_at').values_list('pk', flat=True)[:limit]
+    claimed = []
+    for pk in candidates:
+        if ProcessingJob.objects.filter(pk=pk, state=ProcessingJob.JobState.PENDING) \
+                .update(state=ProcessingJob.JobState.RUNNING, started_at=timezone.now(), attempts=F('attempts') + 1):
+            claimed.append(pk)
+    return claimed
+
+
+def requeue_stale():
+    """
+    Give jobs whose worker died mid-run another chance.
+    """
+    deadline = timezone.now() - timedelta(seconds=settings.MEDIA_JOB_TIMEOUT)
+    return ProcessingJob.objects.filter(state=ProcessingJob.JobState.RUNNING, started_at__lt=deadline) \
+        .update(state=ProcessingJob.JobState.PENDING)
+
+
+def run(job_id):
+    job = ProcessingJob.objects.select_related('media_file').get(pk=job_id)
+    media_file = job.media_file
+    if media_file is not None:
+        MediaFile.objects.filter(pk=media_file.pk).update(processing_state=MediaFile.ProcessingState.PROCESSING)
+
+    try:
+        HANDLERS[job.kind](job)
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < settings.MEDIA_JOB_MAX_ATTEMPTS:
+            job.state = ProcessingJob.JobState.PENDING
+        else:
+            job.state = ProcessingJob.JobState.FAILED
+    else:
+        job.state = ProcessingJob.JobState.DONE
+        job.error = None
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['state', 'error', 'finished_at'])
+
+    if media_file is not None:
+        update_processing_state(media_file.pk)
+    job_finished.send(sender=ProcessingJob, job=job)
+
+    return job.state
+
+
+def update_processing_state(media_file_id):
+    jobs = ProcessingJob.objects.filter(media_file_id=media_file_id)
+    if jobs.filter(state=ProcessingJob.JobState.FAILED).exists():
+        state = MediaFile.ProcessingState.FAILED
+    elif jobs.filter(state=ProcessingJob.JobState.RUNNING).exists():
+        state = MediaFile.ProcessingState.PROCESSING
+    elif jobs.filter(state=ProcessingJob.JobState.PENDING).exists():
+        state = MediaFile.ProcessingState.PENDING
+    else:
+        state = MediaFile.ProcessingState.READY
+    MediaFile.objects.filter(pk=media_file_id).update(processing_state=state)
@@ -0,0 +1,68 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.management.base import BaseCommand
+
+from movie.uploads import write_chunk
+
+MB = 1024 * 1024
+
+
+def peak_rss():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+class Command(BaseCommand):
+    help = "Measure peak RSS of one upload worker writing a chunk with the buffered and the streaming path."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[8, 32, 128],
+                            help="Chunk sizes in megabytes.")
+        parser.add_argument('--mode', choices=['read', 'stream'],
+                            help="Run a single measurement in this process. Used internally.")
+        parser.add_argument('--size', type=int, help="Chunk size in megabytes for --mode.")
+
+    def handle(self, *args, **options):
+        if options['mode']:
+            self.stdout.write(json.dumps(self.measure(options['mode'], options['size'])))
+            return
+
+        self.stdout.write(f"{'chunk':>8} {'mode':>8} {'peak rss':>12} {'growth':>12}")
+        for size in options['sizes']:
+            for mode in ('read', 'stream'):
+                # Every measurement runs in a fresh interpreter, so peak RSS is not inherited.
+                output = subprocess.run(
+                    [sys.executable, sys.argv[0], 'benchmark_chunk_writes', '--mode', mode, '--size', str(size)],
+                    check=True, capture_output=True, text=True
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                self.stdout.write(f"{size:>6}MB {mode:>8} {result['peak'] / MB:>10.1f}MB "
+                                  f"{result['growth'] / MB:>10.1f}MB")
+
+    @staticmethod
+    def measure(mode, size):
+        block = os.urandom(MB)
+        with tempfile.TemporaryDirectory() as directory:
+            file_obj = TemporaryUploadedFile('chunk.bin', 'application/octet-stream', size * MB, None)
+            for _ in range(size):
+                file_obj.write(block)
+            file_obj.seek(0)
+            destination = os.path.join(directory, 'destination.bin')
+
+            baseline = peak_rss()
+            if mode == 'read':
+                with open(destination, 'ab') as f:
+                    f.write(file_obj.read())
+            else:
+                write_chunk(file_obj, destination, append=True)
+            peak = peak_rss()
+            file_obj.close()
+
+        return {'peak': peak, 'growth': peak - baseline}
@@ -0,0 +1,71 @@
+import itertools
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from movie.heartbeat import HeartbeatBuffer
+from movie.models import SeenMedia, Movie
+from user.models import User
+
+
+def per_heartbeat(user_id, movie_id, position):
+    """
+    What a plain DRF endpoint would do: one UPDATE, and an INSERT when the stream is new.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.HEARTBEAT_SESSION_TIMEOUT)
+    if not SeenMedia.objects.filter(user_id=user_id, movie_id=movie_id, updated_at__gte=cutoff) \
+            .update(position=position, updated_at=timezone.now()):
+        SeenMedia.objects.create(user_id=user_id, movie_id=movie_id, position=position)
+
+
+class Command(BaseCommand):
+    help = "Compare one write per heartbeat with the buffered writer on the configured database. " \
+           "Uses existing users and movies; the SeenMedia rows it creates are deleted afterwards."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--streams', type=int, default=1000, help="Concurrent streams (user and movie pairs).")
+        parser.add_argument('--heartbeats', type=int, default=10, help="Heartbeats sent by every stream.")
+        parser.add_argument('--flush-size', type=int, default=settings.HEARTBEAT_FLUSH_SIZE)
+
+    def handle(self, *args, **options):
+        users = list(User.objects.order_by('pk').values_list('pk', flat=True)[:options['streams']])
+        movies = list(Movie.objects.order_by('pk').values_list('pk', flat=True)[:options['streams']])
+        if not users or not movies:
+            raise CommandError("Needs at least one user and one movie.")
+        streams = list(itertools.islice(itertools.product(users, movies), options['streams']))
+        heartbeats = [(user_id, movie_id, tick * 10) for tick in range(options['heartbeats'])
+                      for user_id, movie_id in streams]
+        first_pk = (SeenMedia.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+
+        try:
+            start = time.perf_counter()
+            for user_id, movie_id, position in heartbeats:
+                per_heartbeat(user_id, movie_id, position)
+            direct = time.perf_counter() - start
+            SeenMedia.objects.filter(pk__gte=first_pk).delete()
+
+            with tempfile.TemporaryDirectory() as spill_dir:
+                buffer = HeartbeatBuffer(spill_dir, max_streams=len(streams) + 1, flush_size=options['flush_size'],
+                                         flush_interval=60 * 60)
+                latencies = []
+                start = time.perf_counter()
+                for user_id, movie_id, position in heartbeats:
+                    began = time.perf_counter()
+                    buffer.add(user_id, movie_id, None, position)
+                    latencies.append(time.perf_counter() - began)
+                buffer.flush()
+                buffered = time.perf_counter() - start
+        finally:
+            SeenMedia.objects.filter(pk__gte=first_pk).delete()
+
+        self.stdout.write(f"{len(heartbeats)} heartbeats from {len(streams)} streams")
+        self.stdout.write(f"{'strategy':>10} {'total':>10} {'per second':>12}")
+        for name, seconds in (('direct', direct), ('buffered', buffered)):
+            self.stdout.write(f"{name:>10} {seconds:>9.2f}s {len(heartbeats) / seconds:>12.0f}")
+        self.stdout.write(f"buffered add() p50 {statistics.median(latencies) * 1e6:.0f}us, "
+                          f"p99 {statistics.quantiles(latencies, n=100)[-1] * 1e6:.0f}us")
@@ -0,0 +1,93 @@
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.backends.sqlite3.base import SQLiteCursorWrapper
+
+from movie.search import SQLiteBackend, terms
+
+SYLLABLES = ['ka', 'ro', 'mi', 'tan', 'sel', 'vo', 'ri', 'del', 'ash', 'um', 'ne', 'bar', 'lo', 'sha', 'zin', 'po']
+
+
+def vocabulary(generator, size):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(generator.choices(SYLLABLES, k=generator.randint(2, 4))))
+    words = sorted(words)
+    # Frequency follows the position in the list; keep it unrelated to the spelling.
+    generator.shuffle(words)
+    return words
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def like_search(cursor, query, page_size):
+    """
+    What ``SearchFilter`` with page number pagination runs: a count and the first page.
+    """
+    params = [f"%{query}%", f"%{query}%"]
+    cursor.execute("SELECT COUNT(*) FROM media WHERE name LIKE %s OR synopsis LIKE %s", params)
+    cursor.fetchall()
+    cursor.execute("SELECT id FROM media WHERE name LIKE %s OR synopsis LIKE %s ORDER BY id DESC LIMIT %s",
+                   params + [page_size])
+    return cursor.fetchall()
+
+
+class Command(BaseCommand):
+    help = "Compare LIKE scans with the FTS5 index on a standalone SQLite database of synthetic titles."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--titles', type=int, default=100_000, help="Number of synthetic titles.")
+        parser.add_argument('--queries', type=int, default=200, help="Number of random queries per strategy.")
+        parser.add_argument('--limit', type=int, default=500, help="Results the index returns per query.")
+        parser.add_argument('--words', type=int, default=20_000, help="Vocabulary size; word use follows Zipf's law.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        with tempfile.TemporaryDirectory() as directory:
+            db = sqlite3.connect(os.path.join(directory, 'benchmark.sqlite3'))
+            cursor = db.cursor(factory=SQLiteCursorWrapper)
+            cursor.execute("CREATE TABLE media (id integer PRIMARY KEY, name text, synopsis text)")
+
+            words = vocabulary(generator, options['words'])
+            weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+            rows = []
+            for pk in range(1, options['titles'] + 1):
+                name = ' '.join(generator.choices(words, cum_weights=weights, k=generator.randint(1, 4)))
+                synopsis = ' '.join(generator.choices(words, cum_weights=weights, k=30))
+                rows.append((pk, name, synopsis))
+            cursor.executemany("INSERT INTO media (id, name, synopsis) VALUES (%s, %s, %s)", rows)
+
+            start = time.perf_counter()
+            SQLiteBackend.create(cursor, 'media')
+            SQLiteBackend.upsert(cursor, 'media', rows)
+            db.commit()
+            self.stdout.write(f"indexed {len(rows)} titles in {time.perf_counter() - start:.2f}s")
+
+            # What a user types: one or two words of an existing title, the last one still incomplete.
+            queries = []
+            for _ in range(options['queries']):
+                title = generator.choice(rows)[1].split()
+                typed = title[:generator.randint(1, min(len(title), 2))]
+                typed[-1] = typed[-1][:generator.randint(3, max(len(typed[-1]), 3))]
+                queries.append(' '.join(typed))
+            like = [timed(lambda: like_search(cursor, query, 20)) for query in queries]
+            fts = [timed(lambda: SQLiteBackend.search(cursor, 'media', terms(query), options['limit']))
+                   for query in queries]
+            db.close()
+
+        self.stdout.write(f"{'strategy':>10} {'p50':>10} {'p95':>10} {'max':>10}")
+        for name, timings in (('like', like), ('fts5', fts)):
+            percentiles = statistics.quantiles(timings, n=20)
+            self.stdout.write(f"{name:>10} {statistics.median(timings):>8.2f}ms {percentiles[-1]:>8.2f}ms "
+                              f"{max(timings):>8.2f}ms")
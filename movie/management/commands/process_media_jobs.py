@@ -0,0 +1,77 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from movie import jobs
+from movie.models import ProcessingJob
+from movie.sweeper import sweep_all
+
+
+def init_worker():
+    django.setup()
+    import movie.tasks  # noqa: F401  registers the job handlers
+
+
+class Command(BaseCommand):
+    help = "Drain the media processing queue with a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Number of worker processes.")
+        parser.add_argument('--interval', type=float, default=2,
+                            help="Seconds to wait between polls when the queue is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit as soon as the queue is empty.")
+        parser.add_argument('--sweep-interval', type=float, default=settings.MEDIA_SWEEP_INTERVAL,
+                            help="Seconds between sweeps of expired and orphaned uploads, 0 disables them.")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        running = {}
+        last_sweep = None
+
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(f"requeued {requeued} stale jobs")
+
+        # Connections must not be shared with the forked workers.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            while True:
+                sweep_due = last_sweep is None or time.monotonic() - last_sweep >= options['sweep_interval']
+                if options['sweep_interval'] and sweep_due:
+                    for name, stats in sweep_all().items():
+                        self.stdout.write(f"swept {name}: {stats}")
+                    last_sweep = time.monotonic()
+
+                free = workers - len(running)
+                if free > 0:
+                    for job_id in jobs.claim(free):
+                        running[executor.submit(jobs.run, job_id)] = job_id
+                    connections.close_all()
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+
+                done, _ = wait(running, timeout=options['interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        state = future.result()
+                    except BrokenProcessPool:
+                        lost = [job_id, *running.values()]
+                        ProcessingJob.objects.filter(pk__in=lost).update(state=ProcessingJob.JobState.PENDING)
+                        raise CommandError(f"worker pool died, jobs {lost} were requeued")
+                    except Exception as e:
+                        self.stderr.write(f"job {job_id}: {e}")
+                        continue
+                    self.stdout.write(f"job {job_id}: {ProcessingJob.JobState(state).label}")
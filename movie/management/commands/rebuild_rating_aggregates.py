@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from movie.models import Media, Episode
+from movie.ratings import rebuild_aggregates, remove_duplicates
+
+
+class Command(BaseCommand):
+    help = "Recompute the rating sum, count and histogram of every media and episode from the ratings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of rows loaded and updated per batch.")
+        parser.add_argument('--remove-duplicates', action='store_true',
+                            help="First delete all but the newest rating of a user for the same media or episode.")
+
+    def handle(self, *args, **options):
+        if options['remove_duplicates']:
+            self.stdout.write(f"Rating: {remove_duplicates()} duplicates removed")
+        for model, field in ((Media, 'media'), (Episode, 'episode')):
+            changed = rebuild_aggregates(model, field, options['batch_size'])
+            self.stdout.write(f"{model.__name__}: {changed} rows corrected")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movie.search import INDEXES, backend, rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of media, artists and collections from their tables. " \
+           "Run it with --missing at every deploy, before the server starts: requests never create the indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kinds', nargs='*', help=f"Indexes to rebuild out of {', '.join(INDEXES)}; "
+                                                     f"all of them by default.")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of rows indexed per batch.")
+        parser.add_argument('--missing', action='store_true',
+                            help="Only create and fill the indexes that do not exist yet.")
+
+    def handle(self, *args, **options):
+        if backend() is None:
+            raise CommandError("The default database has no full-text search backend.")
+        unknown = set(options['kinds']) - set(INDEXES)
+        if unknown:
+            raise CommandError(f"Unknown indexes: {', '.join(sorted(unknown))}")
+        for kind in options['kinds'] or INDEXES:
+            if rebuild(kind, options['batch_size'], options['missing']):
+                self.stdout.write(f"{kind}: rebuilt")
+            else:
+                self.stdout.write(f"{kind}: exists")
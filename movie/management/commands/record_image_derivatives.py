@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from movie.images import completion_marker, record_derivatives
+from movie.jobs import enqueue
+from movie.models import ProcessingJob
+from movie.signals import IMAGE_FIELDS
+
+
+class Command(BaseCommand):
+    help = "Record the image derivatives already in the storage on their rows and queue jobs for the missing ones."
+
+    def handle(self, *args, **options):
+        for model, field_names in IMAGE_FIELDS.items():
+            recorded = queued = 0
+            for instance in model.objects.iterator():
+                for field_name in field_names:
+                    field_file = getattr(instance, field_name)
+                    if not field_file or field_file.name in instance.derived_images:
+                        continue
+                    if field_file.storage.exists(completion_marker(field_file.name)):
+                        record_derivatives(instance, field_name)
+                        recorded += 1
+                        continue
+                    payload = {'model': model._meta.label, 'pk': instance.pk, 'field': field_name}
+                    if not ProcessingJob.objects.filter(kind=ProcessingJob.JobKind.IMAGE_DERIVATIVES,
+                                                        state=ProcessingJob.JobState.PENDING,
+                                                        payload=payload).exists():
+                        enqueue(ProcessingJob.JobKind.IMAGE_DERIVATIVES, payload=payload)
+                        queued += 1
+            self.stdout.write(f"{model.__name__}: {recorded} recorded, {queued} queued")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from movie.sweeper import sweep_all
+
+
+class Command(BaseCommand):
+    help = "Delete expired partial uploads and complete uploads that nothing references."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Number of rows deleted per batch.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report what would be deleted.")
+
+    def handle(self, *args, **options):
+        prefix = "would sweep" if options['dry_run'] else "swept"
+        for name, stats in sweep_all(options['batch_size'], options['dry_run']).items():
+            self.stdout.write(f"{prefix} {name}: {stats}")
@@ -5,6 +5,8 @@ from django.db.models import *
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from movie.packaging import remove_hls, remove_sprites
+from movie.uploads import remove_parts
 from user.models import User
 from django.utils.crypto import get_random_string
 
@@ -21,8 +23,19 @@ def media_poster_path_file(instance, filename):
     return f"poster/{get_random_string(length=8)}-{instance.name}-{filename}"
 
 
+class DerivedImages(Model):
+    """
+    ``derived_images`` lists the stored image names of the row whose responsive derivatives exist.
+    The IMAGE_DERIVATIVES job records them, so serializers never have to ask the storage.
+    """
+    derived_images = JSONField(default=list, editable=False)
+
+    class Meta:
+        abstract = True
+
+
 # Create your models here.
-class Media(Model):
+class Media(DerivedImages):
     class MediaType(TextChoices):
         FREE = "Free", _("Free")
         SUBSCRIPTION = "Subscription", _("Subscription")
@@ -38,6 +51,13 @@ class Media(Model):
     genres = ManyToManyField('Genre', through='GenreMedia')
     countries = ManyToManyField('Country', through='CountryMedia')
     casts = ManyToManyField('Artist', through='Cast')
+    rating_sum = IntegerField(default=0, editable=False)
+    rating_count = IntegerField(default=0, editable=False)
+    rating_histogram = JSONField(default=list, editable=False)
+
+    @property
+    def rating_average(self):
+        return self.rating_sum / self.rating_count if self.rating_count else 0
 
     def delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
@@ -83,7 +103,7 @@ def season_poster_path_file(instance, filename):
     return f"poster/season/{get_random_string(length=8)}-{instance.name}-{filename}"
 
 
-class Season(Model):
+class Season(DerivedImages):
     series = ForeignKey(TvSeries, on_delete=CASCADE)
     number = IntegerField()
     name = CharField(max_length=255, null=True, blank=True)
@@ -113,7 +133,7 @@ def episode_poster_path_file(instance, filename):
     return f"poster/episode/{get_random_string(length=8)}-{instance.name}-{filename}"
 
 
-class Episode(Model):
+class Episode(DerivedImages):
     season = ForeignKey(Season, on_delete=CASCADE)
     number = IntegerField(null=False, blank=False)
     name = CharField(max_length=100, null=True, blank=True)
@@ -125,6 +145,13 @@ class Episode(Model):
     thumbnail = ImageField(upload_to=episode_thumbnail_path_file)
     poster = ImageField(upload_to=episode_poster_path_file)
     publication_date = DateTimeField(null=False, blank=False)
+    rating_sum = IntegerField(default=0, editable=False)
+    rating_count = IntegerField(default=0, editable=False)
+    rating_histogram = JSONField(default=list, editable=False)
+
+    @property
+    def rating_average(self):
+        return self.rating_sum / self.rating_count if self.rating_count else 0
 
     def delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
@@ -142,7 +169,7 @@ def genre_poster_path_file(instance, filename):
     return f"genre-poster/{get_random_string(length=8)}-{instance.title}-{filename}"
 
 
-class Genre(Model):
+class Genre(DerivedImages):
     title = CharField(max_length=100)
     poster = ImageField(upload_to=genre_poster_path_file)
 
@@ -156,7 +183,7 @@ def country_flag_path_file(instance, filename):
     return f"country-flag/{get_random_string(length=8)}-{instance.name}-{filename}"
 
 
-class Country(Model):
+class Country(DerivedImages):
     name = CharField(max_length=100)
     flag = ImageField(upload_to=country_flag_path_file)
 
@@ -186,7 +213,7 @@ def artist_path_file(instance, filename):
     return f"artists/{get_random_string(length=8)}-{instance.name}-{filename}"
 
 
-class Artist(Model):
+class Artist(DerivedImages):
     name = CharField(max_length=100)
     biography = TextField()
     image = ImageField(upload_to=artist_path_file)
@@ -218,7 +245,7 @@ def slider_poster_path_file(instance, filename):
     return f"poster/slider/{get_random_string(length=8)}-{instance.media.name}-{filename}"
 
 
-class Slider(Model):
+class Slider(DerivedImages):
     media = ForeignKey(Media, on_delete=CASCADE, null=False)
     description = TextField()
     title = CharField(max_length=250)
@@ -236,7 +263,7 @@ def collection_poster_path_file(instance, filename):
     return f"collection-poster/{get_random_string(length=8)}-{instance.name}-{filename}"
 
 
-class Collection(Model):
+class Collection(DerivedImages):
     class CollectionState(IntegerChoices):
         PENDING = 0, _("Pending")
         ACCEPT = 1, _("Accept")
@@ -280,12 +307,28 @@ class Rating(Model):
     episode = ForeignKey(Episode, on_delete=CASCADE, null=True)
     created_at = DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['user', 'media'], condition=Q(episode__isnull=True),
+                             name='unique_user_media_rating'),
+            UniqueConstraint(fields=['user', 'episode'], condition=Q(media__isnull=True),
+                             name='unique_user_episode_rating'),
+        ]
+
 
 class SeenMedia(Model):
     user = ForeignKey(User, on_delete=CASCADE)
     movie = ForeignKey(Movie, on_delete=CASCADE, null=True)
     episode = ForeignKey(Episode, on_delete=CASCADE, null=True)
     created_at = DateTimeField(auto_now_add=True)
+    # Playback position in seconds, moved by player heartbeats (movie.heartbeat).
+    position = PositiveIntegerField(default=0)
+    updated_at = DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            Index(fields=['user', 'updated_at'], name='seen_media_user_updated'),
+        ]
 
 
 class CollectionMedia(Model):
@@ -293,6 +336,9 @@ class CollectionMedia(Model):
     media = ForeignKey(Media, on_delete=CASCADE)
 
 
+UPLOAD_EXPIRE_TIME = timedelta(hours=12)
+
+
 def generate_upload_id():
     return uuid.uuid4().hex
 
@@ -306,6 +352,12 @@ def media_thumbnail_filename(instance, filename):
 
 
 class MediaFile(Model):
+    class ProcessingState(IntegerChoices):
+        PENDING = 0, _("Pending")
+        PROCESSING = 1, _("Processing")
+        READY = 2, _("Ready")
+        FAILED = 3, _("Failed")
+
     upload_id = CharField(max_length=32, unique=True, editable=False,
                           default=generate_upload_id)
     user = ForeignKey(User, on_delete=DO_NOTHING, blank=False, null=False)
@@ -314,17 +366,98 @@ class MediaFile(Model):
     chunks_uploaded = IntegerField(default=0)
     is_complete = BooleanField(default=False)
     total_chunk = IntegerField(null=False, blank=False)
+    is_parallel = BooleanField(default=False)
+    chunks_bitmap = BinaryField(null=True, editable=False)
     thumbnail = ImageField(null=True, upload_to=media_thumbnail_filename)
     mimetype = CharField(null=True, max_length=255)
+    processing_state = SmallIntegerField(choices=ProcessingState.choices, default=ProcessingState.PENDING,
+                                         null=False)
+    chunk_digests = JSONField(default=dict, editable=False)
+    content_hash = CharField(max_length=64, null=True, db_index=True, editable=False)
+    hls_playlist = FileField(null=True, max_length=255, editable=False)
+    preview_track = FileField(null=True, max_length=255, editable=False)
 
     def delete(self, *args, **kwargs):
         super(MediaFile, self).delete(*args, **kwargs)
-        if self.file:
+        if self.file and not self.is_shared('file'):
             storage, path = self.file.storage, self.file.path
             storage.delete(path)
 
-        if self.thumbnail:
+        if self.thumbnail and not self.is_shared('thumbnail'):
             self.thumbnail.delete(save=False)
 
+        if self.is_parallel:
+            remove_parts(self)
+
+        if self.hls_playlist:
+            remove_hls(self)
+
+        if self.preview_track and not self.is_shared('preview_track'):
+            remove_sprites(self.preview_track)
+
+    def is_shared(self, field_name):
+        """
+        Whether another complete upload still references the file stored in ``field_name``.
+        """
+        if self.content_hash is None:
+            return False
+        return MediaFile.objects.filter(content_hash=self.content_hash, is_complete=True,
+                                        **{field_name: getattr(self, field_name).name}) \
+            .exclude(pk=self.pk).exists()
+
+    def link_duplicate(self):
+        """
+        Point this upload at the stored bytes of an identical complete upload, if there is one.
+
+        The thumbnail and preview track are reused as well when the original is already processed. The caller is
+        responsible for removing the bytes this upload stored itself once the row is saved.
+        """
+        original = MediaFile.objects.filter(content_hash=self.content_hash, is_complete=True) \
+            .exclude(pk=self.pk).order_by('pk').first()
+        if original is None:
+            return False
+
+        self.file.name = original.file.name
+        if original.processing_state == MediaFile.ProcessingState.READY:
+            self.thumbnail.name = original.thumbnail.name
+            self.preview_track.name = original.preview_track.name
+            self.processing_state = MediaFile.ProcessingState.READY
+        return True
+
     def is_expire(self):
-        return not self.is_complete and timedelta(hours=12) + self.uploaded_on < timezone.now()
+        return not self.is_complete and UPLOAD_EXPIRE_TIME + self.uploaded_on < timezone.now()
+
+
+class MediaFileRendition(Model):
+    media_file = ForeignKey(MediaFile, related_name='renditions', on_delete=CASCADE)
+    height = IntegerField()
+    video_bitrate = IntegerField()
+    audio_bitrate = IntegerField(null=True)
+    playlist = FileField(max_length=255)
+
+
+class ProcessingJob(Model):
+    class JobKind(TextChoices):
+        THUMBNAIL = "Thumbnail", _("Thumbnail")
+        HLS = "HLS", _("HLS")
+        IMAGE_DERIVATIVES = "Image Derivatives", _("Image Derivatives")
+        PREVIEW_TRACK = "Preview Track", _("Preview Track")
+
+    class JobState(IntegerChoices):
+        PENDING = 0, _("Pending")
+        RUNNING = 1, _("Running")
+        DONE = 2, _("Done")
+        FAILED = 3, _("Failed")
+
+    kind = CharField(max_length=50, choices=JobKind.choices)
+    media_file = ForeignKey(MediaFile, on_delete=CASCADE, null=True)
+    payload = JSONField(default=dict)
+    state = SmallIntegerField(choices=JobState.choices, default=JobState.PENDING, null=False)
+    attempts = SmallIntegerField(default=0)
+    error = TextField(null=True, blank=True)
+    created_at = DateTimeField(auto_now_add=True)
+    started_at = DateTimeField(null=True)
+    finished_at = DateTimeField(null=True)
+
+    class Meta:
+        indexes = [Index(fields=['state', 'created_at'])]
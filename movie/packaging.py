@@ -0,0 +1,116 @@
+import math
+import os
+import shutil
+
+from django.conf import settings
+
+HLS_DIRECTORY = 'hls'
+MASTER_PLAYLIST = 'master.m3u8'
+SPRITES_DIRECTORY = 'sprites'
+PREVIEW_TRACK = 'preview.vtt'
+
+
+def hls_name(media_file, *parts):
+    return '/'.join([HLS_DIRECTORY, media_file.upload_id, *parts])
+
+
+def hls_dir(media_file):
+    return os.path.join(settings.MEDIA_ROOT, HLS_DIRECTORY, media_file.upload_id)
+
+
+def remove_hls(media_file):
+    shutil.rmtree(hls_dir(media_file), ignore_errors=True)
+
+
+def select_ladder(source_height):
+    """
+    Rungs of ``HLS_BITRATE_LADDER`` that do not upscale the source; always at least the lowest one.
+    """
+    ladder = sorted(settings.HLS_BITRATE_LADDER)
+    rungs = [rung for rung in ladder if rung[0] <= source_height]
+    return rungs or ladder[:1]
+
+
+def ffmpeg_hls_command(source, output_dir, rungs, has_audio):
+    """
+    Build one ffmpeg invocation that decodes the source once and encodes every rung of the ladder.
+
+    Produces ``<height>p/index.m3u8`` with its segments for each rung and a master playlist
+    in ``output_dir``.
+    """
+    splits = ''.join(f'[v{index}]' for index in range(len(rungs)))
+    filters = [f'[0:v]split={len(rungs)}{splits}']
+    filters += [f'[v{index}]scale=-2:{height}[v{index}out]' for index, (height, _, _) in enumerate(rungs)]
+
+    command = [settings.FFMPEG_BINARY, '-y', '-loglevel', 'error', '-i', source,
+               '-filter_complex', ';'.join(filters)]
+    stream_map = []
+    for index, (height, video_bitrate, audio_bitrate) in enumerate(rungs):
+        command += ['-map', f'[v{index}out]', f'-c:v:{index}', 'libx264', f'-b:v:{index}', f'{video_bitrate}k',
+                    f'-maxrate:v:{index}', f'{int(video_bitrate * 1.07)}k',
+                    f'-bufsize:v:{index}', f'{video_bitrate * 2}k']
+        entry = f'v:{index}'
+        if has_audio:
+            command += ['-map', 'a:0', f'-c:a:{index}', 'aac', f'-b:a:{index}', f'{audio_bitrate}k']
+            entry += f',a:{index}'
+        stream_map.append(f'{entry},name:{height}p')
+
+    command += ['-preset', 'veryfast', '-sc_threshold', '0',
+                '-force_key_frames', f'expr:gte(t,n_forced*{settings.HLS_SEGMENT_SECONDS})',
+                '-f', 'hls', '-hls_time', str(settings.HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+                '-hls_segment_filename', os.path.join(output_dir, '%v', 'segment_%05d.ts'),
+                '-master_pl_name', MASTER_PLAYLIST, '-var_stream_map', ' '.join(stream_map),
+                os.path.join(output_dir, '%v', 'index.m3u8')]
+    return command
+
+
+def sprites_name(media_file, *parts):
+    return '/'.join([SPRITES_DIRECTORY, media_file.upload_id, *parts])
+
+
+def sprites_dir(media_file):
+    return os.path.join(settings.MEDIA_ROOT, SPRITES_DIRECTORY, media_file.upload_id)
+
+
+def remove_sprites(preview_track):
+    """
+    Remove a preview track together with the sprite sheets stored beside it.
+    """
+    shutil.rmtree(os.path.dirname(preview_track.path), ignore_errors=True)
+
+
+def ffmpeg_sprites_command(source, output_dir, tile_width, tile_height):
+    """
+    Build an ffmpeg invocation that decodes the source in one sequential pass and tiles one frame
+    every ``PREVIEW_INTERVAL`` seconds into ``sprite-<n>.jpg`` sheets.
+    """
+    filters = f"fps=1/{settings.PREVIEW_INTERVAL},scale={tile_width}:{tile_height}," \
+              f"tile={settings.PREVIEW_COLUMNS}x{settings.PREVIEW_ROWS}"
+    return [settings.FFMPEG_BINARY, '-y', '-loglevel', 'error', '-i', source, '-an', '-vf', filters,
+            '-q:v', '5', os.path.join(output_dir, 'sprite-%03d.jpg')]
+
+
+def format_timestamp(seconds):
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+    minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+
+def preview_vtt(duration, tile_width, tile_height):
+    """
+    WebVTT track mapping every ``PREVIEW_INTERVAL`` window to its tile in the sprite sheets.
+    """
+    interval = settings.PREVIEW_INTERVAL
+    per_sheet = settings.PREVIEW_COLUMNS * settings.PREVIEW_ROWS
+    lines = ["WEBVTT", ""]
+    for index in range(max(math.ceil(duration / interval), 1)):
+        sheet, position = divmod(index, per_sheet)
+        row, column = divmod(position, settings.PREVIEW_COLUMNS)
+        start, end = index * interval, min((index + 1) * interval, duration)
+        lines += [f"{format_timestamp(start)} --> {format_timestamp(end)}",
+                  f"sprite-{sheet + 1:03d}.jpg#xywh={column * tile_width},{row * tile_height},"
+                  f"{tile_width},{tile_height}",
+                  ""]
+    return "\n".join(lines)
@@ -0,0 +1,204 @@
+import threading
+from collections import defaultdict
+
+from django.db import transaction, connection
+from django.db.models import Count, F, Max
+from django.dispatch import Signal
+from django.utils import timezone
+
+from movie.models import Rating, Media, Episode
+
+RATING_MIN = 0
+RATING_MAX = 10
+
+# Sent with the target model as sender, its ``pk`` and the change of its rating count whenever
+# stored aggregates change; the aggregates are written with ``update()``, which sends no ``post_save``.
+rating_changed = Signal()
+
+
+# Targets of ratings removed by a cascade or a queryset delete, recomputed once the transaction commits.
+_pending = threading.local()
+
+
+def empty_histogram():
+    return [0] * (RATING_MAX - RATING_MIN + 1)
+
+
+def rating_target(rating):
+    """
+    The model and primary key whose aggregates a rating contributes to.
+    """
+    if rating.media_id is not None:
+        return Media, rating.media_id
+    return Episode, rating.episode_id
+
+
+def target_field(model):
+    return 'media' if model is Media else 'episode'
+
+
+def record_rating(rating, added=None, removed=None):
+    """
+    Fold a rating change into the aggregates of its media or episode.
+
+    ``added`` is the new value and ``removed`` the value it replaces; either may be None.
+    The target row is locked for the histogram update, so concurrent ratings never lose a count.
+    """
+    model, pk = rating_target(rating)
+    with transaction.atomic():
+        target = model.objects.select_for_update().filter(pk=pk).only('rating_histogram').first()
+        if target is None:
+            return
+
+        histogram = target.rating_histogram or empty_histogram()
+        delta_sum = delta_count = 0
+        if removed is not None:
+            histogram[removed - RATING_MIN] -= 1
+            delta_sum -= removed
+            delta_count -= 1
+        if added is not None:
+            histogram[added - RATING_MIN] += 1
+            delta_sum += added
+            delta_count += 1
+
+        model.objects.filter(pk=pk).update(rating_sum=F('rating_sum') + delta_sum,
+                                           rating_count=F('rating_count') + delta_count,
+                                           rating_histogram=histogram)
+    rating_changed.send(sender=model, pk=pk, count_delta=delta_count)
+
+
+def recompute_later(rating):
+    """
+    Recompute the aggregates of the rating's target once the transaction commits, once for all the
+    ratings removed with it. Targets deleted in the same transaction are skipped then.
+    """
+    model, pk = rating_target(rating)
+    targets = getattr(_pending, 'targets', None)
+    if targets is None:
+        targets = _pending.targets = defaultdict(set)
+    targets[model].add(pk)
+    transaction.on_commit(recompute_pending)
+
+
+def recompute_pending():
+    # The first callback of a transaction takes all of its targets; a rolled back one leaves its
+    # targets to the next, which recomputing again makes harmless.
+    targets, _pending.targets = getattr(_pending, 'targets', None), None
+    for model, pks in (targets or {}).items():
+        recompute_aggregates(model, pks)
+
+
+def rating_histograms(field, **filters):
+    histograms = defaultdict(empty_histogram)
+    for pk, value, count in Rating.objects.filter(**{f'{field}__isnull': False}, **filters) \
+            .values_list(field, 'rating').annotate(count=Count('id')).order_by():
+        histograms[pk][value - RATING_MIN] = count
+    return histograms
+
+
+def recompute_aggregates(model, pks):
+    """
+    Recompute the aggregates of the ``model`` rows ``pks`` that still exist from their ratings.
+    """
+    field = target_field(model)
+    changes = []
+    with transaction.atomic():
+        targets = list(model.objects.select_for_update().filter(pk__in=pks)
+                       .only('rating_sum', 'rating_count', 'rating_histogram'))
+        if not targets:
+            return
+        histograms = rating_histograms(field, **{f'{field}__in': pks})
+        for target in targets:
+            histogram = histograms.get(target.pk, empty_histogram())
+            rating_count = sum(histogram)
+            rating_sum = sum((index + RATING_MIN) * count for index, count in enumerate(histogram))
+            if (target.rating_sum, target.rating_count, target.rating_histogram) != \
+                    (rating_sum, rating_count, histogram):
+                model.objects.filter(pk=target.pk).update(rating_sum=rating_sum, rating_count=rating_count,
+                                                          rating_histogram=histogram)
+                changes.append((target.pk, rating_count - target.rating_count))
+    for pk, count_delta in changes:
+        rating_changed.send(sender=model, pk=pk, count_delta=count_delta)
+
+
+def upsert_rating(user, value, media=None, episode=None):
+    """
+    Store ``user``'s rating of a media or an episode and return it.
+
+    A first rating is a single ``INSERT ... ON CONFLICT DO NOTHING`` against the conditional unique
+    constraints of ``Rating``, so concurrent submits can never create a second row. When the row
+    already exists it is locked and changed instead, or inserted again if it was deleted meanwhile.
+    """
+    target_field, other_field = ('media', 'episode') if media is not None else ('episode', 'media')
+    opts = Rating._meta
+    quote = connection.ops.quote_name
+    columns = [quote(opts.get_field(name).column) for name in ('rating', 'user', target_field, 'created_at')]
+    sql = f"INSERT INTO {quote(opts.db_table)} ({', '.join(columns)}) VALUES (%s, %s, %s, %s) " \
+          f"ON CONFLICT ({columns[1]}, {columns[2]}) WHERE {quote(opts.get_field(other_field).column)} IS NULL " \
+          f"DO NOTHING RETURNING {quote(opts.pk.column)}"
+    created_at = timezone.now()
+    target = media if media is not None else episode
+
+    with transaction.atomic():
+        for attempt in range(2):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [value, user.pk, target.pk,
+                                     opts.get_field('created_at').get_db_prep_value(created_at, connection)])
+                row = cursor.fetchone()
+
+            if row is not None:
+                rating = Rating(pk=row[0], rating=value, user=user, media=media, episode=episode,
+                                created_at=created_at)
+                record_rating(rating, added=value)
+                return rating
+
+            # A concurrent delete may remove the conflicting row before it is locked; insert again then.
+            rating = Rating.objects.select_for_update() \
+                .filter(user=user, **{target_field: target, other_field: None}).first()
+            if rating is not None:
+                break
+        else:
+            raise Rating.DoesNotExist("The rating was deleted by concurrent requests while being stored.")
+
+        previous = rating.rating
+        if previous != value:
+            rating.rating = value
+            rating.save(update_fields=['rating'])
+            record_rating(rating, added=value, removed=previous)
+        return rating
+
+
+def remove_duplicates():
+    """
+    Keep only the newest rating of every user for the same media or episode.
+
+    Rows left over from before the unique constraints existed must be removed before they can be added.
+    """
+    removed = 0
+    for field, other_field in (('media', 'episode'), ('episode', 'media')):
+        duplicates = Rating.objects.filter(**{f'{field}__isnull': False, f'{other_field}__isnull': True}) \
+            .values('user', field).annotate(count=Count('id'), newest=Max('id')).filter(count__gt=1).order_by()
+        for duplicate in duplicates:
+            removed += Rating.objects.filter(user=duplicate['user'], **{field: duplicate[field]}) \
+                .exclude(pk=duplicate['newest']).delete()[0]
+    return removed
+
+
+def rebuild_aggregates(model, field, batch_size=1000):
+    """
+    Recompute the aggregates of every ``model`` row from the ``Rating`` table.
+
+    Returns the number of rows whose stored aggregates were out of date.
+    """
+    histograms = rating_histograms(field)
+    changed = []
+    for target in model.objects.only('rating_sum', 'rating_count', 'rating_histogram').iterator(batch_size):
+        histogram = histograms.get(target.pk, empty_histogram())
+        rating_count = sum(histogram)
+        rating_sum = sum((index + RATING_MIN) * count for index, count in enumerate(histogram))
+        if (target.rating_sum, target.rating_count, target.rating_histogram) != (rating_sum, rating_count, histogram):
+            target.rating_sum, target.rating_count, target.rating_histogram = rating_sum, rating_count, histogram
+            changed.append(target)
+
+    model.objects.bulk_update(changed, ['rating_sum', 'rating_count', 'rating_histogram'], batch_size=batch_size)
+    return len(changed)
@@ -0,0 +1,191 @@
+import re
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from movie.models import Media, Artist, Collection
+
+TERM_RE = re.compile(r'\w+')
+
+# Indexed kinds: the model, the field ranked highest and the optional body field.
+INDEXES = {
+    'media': (Media, 'name', 'synopsis'),
+    'artist': (Artist, 'name', 'biography'),
+    'collection': (Collection, 'name', None),
+}
+
+
+def terms(query):
+    return TERM_RE.findall(query.lower())
+
+
+def table_name(kind):
+    return f"search_{kind}"
+
+
+class SQLiteBackend:
+    """
+    One FTS5 table per kind with the object's primary key as rowid, ranked with bm25.
+    """
+
+    @staticmethod
+    def create(cursor, kind):
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table_name(kind)} USING fts5("
+                       f"title, body, tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+
+    @staticmethod
+    def upsert(cursor, kind, rows):
+        cursor.executemany(f"INSERT OR REPLACE INTO {table_name(kind)} (rowid, title, body) VALUES (%s, %s, %s)",
+                           rows)
+
+    @staticmethod
+    def delete(cursor, kind, pks):
+        cursor.executemany(f"DELETE FROM {table_name(kind)} WHERE rowid = %s", [(pk,) for pk in pks])
+
+    @staticmethod
+    def clear(cursor, kind):
+        cursor.execute(f"DELETE FROM {table_name(kind)}")
+
+    @staticmethod
+    def search(cursor, kind, query_terms, limit):
+        expression = ' '.join(f'"{term}"*' for term in query_terms)
+        cursor.execute(f"SELECT rowid FROM {table_name(kind)} WHERE {table_name(kind)} MATCH %s "
+                       f"ORDER BY bm25({table_name(kind)}, 10.0, 1.0) LIMIT %s", [expression, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgreSQLBackend:
+    """
+    One table per kind holding a weighted tsvector behind a GIN index, ranked with ts_rank.
+    """
+
+    @staticmethod
+    def create(cursor, kind):
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table_name(kind)} "
+                       f"(object_id bigint PRIMARY KEY, document tsvector NOT NULL)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {table_name(kind)}_document "
+                       f"ON {table_name(kind)} USING gin (document)")
+
+    @staticmethod
+    def upsert(cursor, kind, rows):
+        cursor.executemany(f"INSERT INTO {table_name(kind)} (object_id, document) VALUES "
+                           f"(%s, setweight(to_tsvector('simple', %s), 'A') || "
+                           f"setweight(to_tsvector('simple', %s), 'B')) "
+                           f"ON CONFLICT (object_id) DO UPDATE SET document = EXCLUDED.document", rows)
+
+    @staticmethod
+    def delete(cursor, kind, pks):
+        cursor.execute(f"DELETE FROM {table_name(kind)} WHERE object_id = ANY(%s)", [list(pks)])
+
+    @staticmethod
+    def clear(cursor, kind):
+        cursor.execute(f"TRUNCATE {table_name(kind)}")
+
+    @staticmethod
+    def search(cursor, kind, query_terms, limit):
+        expression = ' & '.join(f"{term}:*" for term in query_terms)
+        cursor.execute(f"SELECT object_id FROM {table_name(kind)}, to_tsquery('simple', %s) query "
+                       f"WHERE document @@ query ORDER BY ts_rank(document, query) DESC LIMIT %s",
+                       [expression, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgreSQLBackend,
+}
+
+# (alias, kind) -> True once the index exists, else when it was last found missing.
+_tables = {}
+
+
+def backend():
+    """
+    The full-text backend of the default database, or None when the database has none.
+    """
+    return BACKENDS.get(connection.vendor)
+
+
+def document(instance, kind):
+    _, title_field, body_field = INDEXES[kind]
+    body = (getattr(instance, body_field) or '') if body_field else ''
+    return instance.pk, getattr(instance, title_field) or '', body
+
+
+def index_exists(kind):
+    """
+    Whether the index of ``kind`` was created. Once found it is not looked up again in this process;
+    a missing one is looked up again after ``SEARCH_INDEX_CHECK_INTERVAL`` seconds.
+
+    Requests and signals never create it: ``rebuild_search_index --missing`` does, at deploy time.
+    Until then saves skip the index and searches fall back to ``SearchFilter``.
+    """
+    key = (connection.alias, kind)
+    checked = _tables.get(key)
+    if checked is True:
+        return True
+    now = time.monotonic()
+    if checked is None or now - checked >= settings.SEARCH_INDEX_CHECK_INTERVAL:
+        with connection.cursor() as cursor:
+            exists = table_name(kind) in connection.introspection.table_names(cursor)
+        _tables[key] = True if exists else now
+        return exists
+    return False
+
+
+def populate(cursor, kind, batch_size=1000):
+    model, title_field, body_field = INDEXES[kind]
+    fields = ['pk', title_field] + ([body_field] if body_field else [])
+    batch = []
+    for row in model.objects.order_by().values_list(*fields).iterator(batch_size):
+        batch.append((row[0], row[1] or '', (row[2] or '') if body_field else ''))
+        if len(batch) >= batch_size:
+            backend().upsert(cursor, kind, batch)
+            batch = []
+    if batch:
+        backend().upsert(cursor, kind, batch)
+
+
+def index(instance, kind):
+    if backend() is None or not index_exists(kind):
+        return
+    with connection.cursor() as cursor:
+        backend().upsert(cursor, kind, [document(instance, kind)])
+
+
+def unindex(pk, kind):
+    if backend() is None or not index_exists(kind):
+        return
+    with connection.cursor() as cursor:
+        backend().delete(cursor, kind, [pk])
+
+
+def rebuild(kind, batch_size=1000, missing=False):
+    """
+    Create the index of ``kind`` if needed and fill it from the model's rows. With ``missing`` an
+    existing index is left alone. Returns whether the index was filled.
+    """
+    with connection.cursor() as cursor:
+        exists = table_name(kind) in connection.introspection.table_names(cursor)
+        if exists and missing:
+            return False
+        if exists:
+            backend().clear(cursor, kind)
+        else:
+            backend().create(cursor, kind)
+        populate(cursor, kind, batch_size)
+    _tables.pop((connection.alias, kind), None)
+    return True
+
+
+def search(kind, query, limit=None):
+    """
+    Primary keys of up to ``limit`` (``SEARCH_MAX_RESULTS``) ``kind`` objects matching every term
+    of ``query`` as a prefix, best match first.
+    """
+    query_terms = terms(query)
+    if not query_terms:
+        return []
+    with connection.cursor() as cursor:
+        return backend().search(cursor, kind, query_terms, limit or settings.SEARCH_MAX_RESULTS)
@@ -1,12 +1,35 @@
 from rest_framework.serializers import *
 from django.db import transaction
+from django.db.models import F, Manager
 from rest_framework.validators import UniqueValidator
-from api.validators import MediaEpisodeValidator
+from api.validators import MediaEpisodeValidator, OneFieldsSet
+from movie.images import srcset
+from movie.ratings import upsert_rating
 from movie.models import Genre, Country, Artist, Media, Movie, Cast, TvSeries, Season, \
     Episode, MediaGallery, Slider, Collection, Comment, Rating, MediaFile
 from user.serializers import CommentUserSerializer
 
 
+class SrcsetField(Field):
+    """
+    Read-only map of the responsive derivatives of an image field, keyed by width then format.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        derivatives = srcset(value)
+        request = self.context.get('request', None)
+        if derivatives is None or request is None:
+            return derivatives
+        return {
+            width: {image_format: request.build_absolute_uri(url) for image_format, url in urls.items()}
+            for width, urls in derivatives.items()
+        }
+
+
 class CreateCommentSerializer(ModelSerializer):
     user = HiddenField(default=CurrentUserDefault())
 
@@ -56,9 +79,11 @@ class CommentEpisodeSerializer(ModelSerializer):
 
 
 class CommentMediaSerializer(ModelSerializer):
+    poster_srcset = SrcsetField(source='poster')
+
     class Meta:
         model = Media
-        fields = ('id', 'poster', 'name')
+        fields = ('id', 'poster', 'name', 'poster_srcset')
         read_only_fields = ('poster', 'name')
 
 
@@ -84,9 +109,33 @@ class MyCommentSerializer(ModelSerializer):
 
 
 class DashboardCommentMediaSerializer(ModelSerializer):
+    poster_srcset = SrcsetField(source='poster')
+
     class Meta:
         model = Media
-        fields = ("name", 'poster')
+        fields = ("name", 'poster', 'poster_srcset')
+
+
+def resolve_comment_media(comments):
+    """
+    Set the series media on episode comments saved without one, with a single query for all of them.
+    """
+    episode_ids = {comment.episode_id for comment in comments if comment.media_id is None and comment.episode_id}
+    if not episode_ids:
+        return
+    media = {item.episode_id: item for item in Media.objects.filter(tvseries__season__episode__in=episode_ids)
+             .annotate(episode_id=F('tvseries__season__episode'))}
+    for comment in comments:
+        if comment.media_id is None and comment.episode_id in media:
+            comment.media = media[comment.episode_id]
+
+
+class DashboardCommentListSerializer(ListSerializer):
+
+    def to_representation(self, data):
+        comments = list(data.all() if isinstance(data, Manager) else data)
+        resolve_comment_media(comments)
+        return super().to_representation(comments)
 
 
 class DashboardCommentSerializer(ModelSerializer):
@@ -96,37 +145,48 @@ class DashboardCommentSerializer(ModelSerializer):
     class Meta:
         model = Comment
         fields = ('comment', 'created_at', "state", "username", "media")
+        list_serializer_class = DashboardCommentListSerializer
 
     def to_representation(self, instance):
-        if instance.media is None:
-            media = Media.objects.filter(tvseries__season__episode=instance.episode).get()
-            instance.media = media
-
+        resolve_comment_media([instance])
         return super().to_representation(instance)
 
 
 class GenreSerializer(ModelSerializer):
+    poster_srcset = SrcsetField(source='poster')
+
     class Meta:
         model = Genre
-        fields = "__all__"
+        exclude = ['derived_images']
 
 
 class CountrySerializer(ModelSerializer):
+    flag_srcset = SrcsetField(source='flag')
+
     class Meta:
         model = Country
-        fields = "__all__"
+        exclude = ['derived_images']
 
 
 class ArtistSerializer(ModelSerializer):
+    image_srcset = SrcsetField(source='image')
+
     class Meta:
         model = Artist
-        fields = "__all__"
+        exclude = ['derived_images']
 
 
 class MediaFileSerializer(ModelSerializer):
     class Meta:
         model = MediaFile
-        fields = ['file', 'id', 'mimetype', 'thumbnail']
+        fields = ['file', 'id', 'mimetype', 'thumbnail', 'processing_state', 'preview_track']
+
+
+class MediaFileStatusSerializer(ModelSerializer):
+    class Meta:
+        model = MediaFile
+        fields = ['id', 'upload_id', 'is_complete', 'chunks_uploaded', 'total_chunk', 'mimetype', 'thumbnail',
+                  'processing_state']
 
 
 class MediaGallerySerializer(ModelSerializer):
@@ -223,7 +283,7 @@ class CreateMovieSerializer(ModelSerializer):
 
     class Meta:
         model = Media
-        fields = "__all__"
+        exclude = ['derived_images']
 
     def create(self, validated_data):
         casts = map(lambda c: Cast(position=c['position'], artist_id=int(c['artist_id'])), validated_data.pop('casts'))
@@ -300,19 +360,22 @@ class MediaSerializer(ModelSerializer):
     genres = GenreSerializer(read_only=True, many=True)
     countries = CountrySerializer(read_only=True, many=True)
     trailer = MediaFileSerializer(read_only=True)
+    poster_srcset = SrcsetField(source='poster')
+    thumbnail_srcset = SrcsetField(source='thumbnail')
 
     class Meta:
         model = Media
-        exclude = ['casts']
+        exclude = ['casts', 'derived_images']
 
 
 class MovieSerializer(ModelSerializer):
     media = MediaSerializer(read_only=True, allow_null=False)
-    rating = FloatField(read_only=True)
+    rating = FloatField(source='media.rating_average', read_only=True)
     comments = CommentSerializer(read_only=True, many=True)
     video = MediaFileSerializer(read_only=True)
     casts = CastSerializer(source="media.media_casts", read_only=True, many=True)
     gallery = MediaGallerySerializer(read_only=True, many=True)
+    playlist = FileField(source='video.hls_playlist', read_only=True)
 
     class Meta:
         model = Movie
@@ -328,7 +391,7 @@ class CreateSeriesSerializer(ModelSerializer):
 
     class Meta:
         model = Media
-        fields = "__all__"
+        exclude = ['derived_images']
 
     def create(self, validated_data):
         countries = validated_data.pop('countries')
@@ -380,7 +443,7 @@ class CreateSeriesSerializer(ModelSerializer):
 class SeriesSerializer(ModelSerializer):
     media = MediaSerializer(read_only=True)
     casts = CastSerializer(source="media.media_casts", read_only=True, many=True)
-    rating = FloatField(read_only=True)
+    rating = FloatField(source='media.rating_average', read_only=True)
     comments = CommentSerializer(read_only=True)
     gallery = MediaGallerySerializer(read_only=True, many=True)
 
@@ -391,10 +454,12 @@ class SeriesSerializer(ModelSerializer):
 
 class SeasonSerializer(ModelSerializer):
     episode_number = IntegerField(read_only=True, required=False)
+    poster_srcset = SrcsetField(source='poster')
+    thumbnail_srcset = SrcsetField(source='thumbnail')
 
     class Meta:
         model = Season
-        fields = "__all__"
+        exclude = ['derived_images']
         validators = [
             UniqueTogetherValidator(
                 queryset=Season.objects.all(),
@@ -439,7 +504,7 @@ class CreateEpisodeSerializer(ModelSerializer):
 
     class Meta:
         model = Episode
-        fields = "__all__"
+        exclude = ['derived_images']
         validators = [
             UniqueTogetherValidator(
                 queryset=Episode.objects.all(),
@@ -498,21 +563,26 @@ class CreateEpisodeSerializer(ModelSerializer):
 
 class EpisodeSerializer(ModelSerializer):
     casts = CastSerializer(source="media_casts", read_only=True, many=True)
-    rating = FloatField(source='rating_avg', read_only=True)
+    rating = FloatField(source='rating_average', read_only=True)
     comments = CommentSerializer(read_only=True, many=True)
     comments_count = IntegerField(read_only=True, required=False)
     trailer = MediaFileSerializer(read_only=True)
     video = MediaFileSerializer(read_only=True)
     gallery = MediaGallerySerializer(read_only=True, many=True)
+    playlist = FileField(source='video.hls_playlist', read_only=True)
+    poster_srcset = SrcsetField(source='poster')
+    thumbnail_srcset = SrcsetField(source='thumbnail')
 
     class Meta:
         model = Episode
-        fields = "__all__"
+        exclude = ['derived_images']
 
 
 class SliderMediaSerializer(ModelSerializer):
     genres = GenreSerializer(read_only=True, many=True)
     countries = CountrySerializer(read_only=True, many=True)
+    poster_srcset = SrcsetField(source='poster')
+    thumbnail_srcset = SrcsetField(source='thumbnail')
 
     class Meta:
         model = Media
@@ -521,10 +591,12 @@ class SliderMediaSerializer(ModelSerializer):
 
 class SliderSerializer(ModelSerializer):
     media = SliderMediaSerializer(read_only=True)
+    poster_srcset = SrcsetField(source='poster')
+    thumbnail_srcset = SrcsetField(source='thumbnail')
 
     class Meta:
         model = Slider
-        fields = "__all__"
+        exclude = ['derived_images']
 
 
 class CreateSliderSerializer(ModelSerializer):
@@ -532,7 +604,7 @@ class CreateSliderSerializer(ModelSerializer):
 
     class Meta:
         model = Slider
-        fields = "__all__"
+        exclude = ['derived_images']
 
     def to_representation(self, instance):
         return SliderSerializer(instance).data
@@ -540,6 +612,7 @@ class CreateSliderSerializer(ModelSerializer):
 
 class CollectionSerializer(ModelSerializer):
     user = HiddenField(default=CurrentUserDefault())
+    poster_srcset = SrcsetField(source='poster')
 
     class Meta:
         model = Collection
@@ -553,6 +626,8 @@ class MediaInputSerializer(Serializer):
 
 
 class RatingSerializer(ModelSerializer):
+    user = PrimaryKeyRelatedField(read_only=True)
+
     class Meta:
         model = Rating
         fields = "__all__"
@@ -571,14 +646,17 @@ class RatingSerializer(ModelSerializer):
         return res
 
     def create(self, validated_data):
-        try:
-            instance = Rating.objects.get(media=validated_data.get('media'), user=validated_data['user'],
-                                          episode=validated_data.get('episode'))
-            instance = super().update(instance, validated_data)
-        except Rating.DoesNotExist:
-            instance = Rating.objects.create(**validated_data)
+        return upsert_rating(self.context['request'].user, validated_data['rating'],
+                             media=validated_data.get('media'), episode=validated_data.get('episode'))
 
-        return instance
+
+class HeartbeatSerializer(Serializer):
+    movie = IntegerField(required=False, min_value=1)
+    episode = IntegerField(required=False, min_value=1)
+    position = IntegerField(min_value=0)
+
+    class Meta:
+        validators = [OneFieldsSet(['movie', 'episode'])]
 
 
 class DashboardSliderSerializer(ModelSerializer):
@@ -586,7 +664,7 @@ class DashboardSliderSerializer(ModelSerializer):
 
     class Meta:
         model = Slider
-        fields = "__all__"
+        exclude = ['derived_images']
 
 
 class AdminMovieSerializer(ModelSerializer):
@@ -0,0 +1,164 @@
+from django.db.models.signals import post_save, pre_save, post_delete, post_init
+from django.dispatch import receiver
+
+from movie import autocomplete
+from movie.images import has_derivatives, delete_derivatives
+from movie.jobs import enqueue
+from movie.models import Movie, Episode, MediaFile, ProcessingJob, Media, Season, Slider, Genre, Country, Artist, \
+    Collection, Rating, Cast
+from movie.ratings import record_rating, rating_changed, recompute_later
+from movie.search import INDEXES, index, unindex
+
+IMAGE_FIELDS = {
+    Media: ('poster', 'thumbnail'),
+    Season: ('poster', 'thumbnail'),
+    Episode: ('poster', 'thumbnail'),
+    Slider: ('poster', 'thumbnail'),
+    Genre: ('poster',),
+    Country: ('flag',),
+    Artist: ('image',),
+    Collection: ('poster',),
+}
+
+
+def enqueue_hls(media_file_id):
+    media_file = MediaFile.objects.filter(pk=media_file_id, is_complete=True, mimetype__startswith='video/').first()
+    if media_file is None:
+        return
+    if not ProcessingJob.objects.filter(media_file=media_file, kind=ProcessingJob.JobKind.HLS).exists():
+        enqueue(ProcessingJob.JobKind.HLS, media_file)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=Episode)
+def package_video(sender, instance, **kwargs):
+    enqueue_hls(instance.video_id)
+
+
+def file_name(value):
+    return getattr(value, 'name', value) or ''
+
+
+def load_images(sender, instance, **kwargs):
+    # Deferred fields are left out rather than loaded.
+    instance._previous_images = {field_name: file_name(instance.__dict__[field_name])
+                                 for field_name in IMAGE_FIELDS[sender] if field_name in instance.__dict__}
+
+
+def remember_images(sender, instance, update_fields=None, **kwargs):
+    """
+    Look up the stored name of images assigned on a row loaded without them; the others were
+    remembered when the row was loaded.
+    """
+    if instance._state.adding:
+        return
+    unknown = [field_name for field_name in IMAGE_FIELDS[sender] if field_name not in instance._previous_images
+               and field_name in instance.__dict__ and (update_fields is None or field_name in update_fields)]
+    if unknown:
+        instance._previous_images.update(sender.objects.filter(pk=instance.pk).values(*unknown).first() or {})
+
+
+def queue_image_derivatives(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Queue derivatives for every image that changed, unless they exist or a pending job will build them.
+    """
+    for field_name in IMAGE_FIELDS[sender]:
+        if update_fields is not None and field_name not in update_fields:
+            continue
+        field_file = getattr(instance, field_name)
+        previous = None if created else instance._previous_images.get(field_name)
+        if previous == field_file.name:
+            continue
+        instance._previous_images[field_name] = field_file.name
+        if previous:
+            delete_derivatives(field_file.storage, previous)
+
+        payload = {'model': sender._meta.label, 'pk': instance.pk, 'field': field_name}
+        if field_file and not has_derivatives(field_file) and not ProcessingJob.objects.filter(
+                kind=ProcessingJob.JobKind.IMAGE_DERIVATIVES, state=ProcessingJob.JobState.PENDING,
+                payload=payload).exists():
+            enqueue(ProcessingJob.JobKind.IMAGE_DERIVATIVES, payload=payload)
+
+
+def remove_image_derivatives(sender, instance, **kwargs):
+    for field_name in IMAGE_FIELDS[sender]:
+        field_file = getattr(instance, field_name)
+        if field_file:
+            delete_derivatives(field_file.storage, field_file.name)
+
+
+for model in IMAGE_FIELDS:
+    post_init.connect(load_images, sender=model)
+    pre_save.connect(remember_images, sender=model)
+    post_save.connect(queue_image_derivatives, sender=model)
+    post_delete.connect(remove_image_derivatives, sender=model)
+
+
+@receiver(post_delete, sender=Rating)
+def forget_rating(sender, instance, origin=None, **kwargs):
+    # Ratings deleted along with their media, episode or user are recomputed per target afterwards.
+    if origin is instance:
+        record_rating(instance, removed=instance.rating)
+    else:
+        recompute_later(instance)
+
+
+SEARCH_KINDS = {model: kind for kind, (model, _, _) in INDEXES.items()}
+
+
+def index_document(sender, instance, **kwargs):
+    index(instance, SEARCH_KINDS[sender])
+
+
+def unindex_document(sender, instance, **kwargs):
+    unindex(instance.pk, SEARCH_KINDS[sender])
+
+
+for model in SEARCH_KINDS:
+    post_save.connect(index_document, sender=model)
+    post_delete.connect(unindex_document, sender=model)
+
+
+@receiver(pre_save, sender=Media)
+@receiver(pre_save, sender=Artist)
+def remember_name(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None:
+        instance._previous_name = None
+    elif update_fields is not None and 'name' not in update_fields:
+        instance._previous_name = instance.name
+    else:
+        instance._previous_name = sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Media)
+def suggest_media(sender, instance, **kwargs):
+    if instance.name != getattr(instance, '_previous_name', None):
+        autocomplete.renamed('media', lambda index: index.add(instance.pk, instance.name, instance.rating_count))
+
+
+@receiver(post_save, sender=Artist)
+def suggest_artist(sender, instance, **kwargs):
+    if instance.name != getattr(instance, '_previous_name', None):
+        autocomplete.renamed('artist', lambda index: index.add(instance.pk, instance.name))
+
+
+@receiver(post_delete, sender=Media)
+@receiver(post_delete, sender=Artist)
+def forget_suggestion(sender, instance, **kwargs):
+    autocomplete.removed(sender.__name__.lower(), instance.pk)
+
+
+@receiver(post_save, sender=Cast)
+def count_artist_cast(sender, instance, created, **kwargs):
+    if created:
+        autocomplete.adjust_popularity('artist', instance.artist_id, 1)
+
+
+@receiver(post_delete, sender=Cast)
+def uncount_artist_cast(sender, instance, **kwargs):
+    autocomplete.adjust_popularity('artist', instance.artist_id, -1)
+
+
+@receiver(rating_changed, sender=Media)
+def count_media_rating(sender, pk, count_delta, **kwargs):
+    autocomplete.adjust_popularity('media', pk, count_delta)
@@ -0,0 +1,106 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from movie.models import MediaFile, UPLOAD_EXPIRE_TIME
+from movie.packaging import remove_hls, remove_sprites
+from movie.uploads import remove_parts
+
+
+def expired_uploads(now=None):
+    now = now or timezone.now()
+    return MediaFile.objects.filter(is_complete=False, uploaded_on__lt=now - UPLOAD_EXPIRE_TIME)
+
+
+def orphaned_files(now=None):
+    """
+    Complete uploads that nothing points at once the grace period for attaching them is over.
+    """
+    now = now or timezone.now()
+    return MediaFile.objects.filter(is_complete=True,
+                                    uploaded_on__lt=now - timedelta(seconds=settings.MEDIA_ORPHAN_GRACE),
+                                    media__isnull=True, movie__isnull=True, episode_video__isnull=True,
+                                    episode_trailer__isnull=True, mediagallery__isnull=True)
+
+
+class SweepStats:
+    def __init__(self):
+        self.rows = 0
+        self.files = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def __str__(self):
+        elapsed = max(self.elapsed, 1e-6)
+        return f"{self.rows} rows, {self.files} files, {self.bytes / 1024 / 1024:.1f}MB in {elapsed:.2f}s " \
+               f"({self.rows / elapsed:.0f} rows/s, {self.bytes / 1024 / 1024 / elapsed:.1f}MB/s)"
+
+
+def file_size(name):
+    try:
+        return default_storage.size(name)
+    except OSError:
+        return 0
+
+
+def sweep(queryset, batch_size=500, dry_run=False, stats=None):
+    """
+    Delete the ``MediaFile`` rows of ``queryset`` and their stored files, ``batch_size`` rows at a time.
+
+    Files that deduplicated uploads outside the batch still reference are kept. With ``dry_run``
+    nothing is deleted and the returned stats describe what would have been removed.
+    """
+    stats = stats or SweepStats()
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')
+                     .only('pk', 'upload_id', 'file', 'thumbnail', 'content_hash', 'is_parallel', 'hls_playlist',
+                           'preview_track')
+                     [:batch_size])
+        if not batch:
+            return stats
+        last_pk = batch[-1].pk
+
+        names = {name for media_file in batch for name in (media_file.file.name, media_file.thumbnail.name) if name}
+        tracks = {media_file.preview_track for media_file in batch if media_file.preview_track}
+        hashes = {media_file.content_hash for media_file in batch if media_file.content_hash}
+        if hashes:
+            for file_name, thumbnail_name, track_name in MediaFile.objects \
+                    .filter(content_hash__in=hashes, is_complete=True) \
+                    .exclude(pk__in=[media_file.pk for media_file in batch]) \
+                    .values_list('file', 'thumbnail', 'preview_track'):
+                names.discard(file_name)
+                names.discard(thumbnail_name)
+                tracks = {track for track in tracks if track.name != track_name}
+
+        stats.rows += len(batch)
+        stats.files += len(names)
+        stats.bytes += sum(file_size(name) for name in names)
+        if dry_run:
+            continue
+
+        MediaFile.objects.filter(pk__in=[media_file.pk for media_file in batch]).delete()
+        for name in names:
+            default_storage.delete(name)
+        for media_file in batch:
+            if media_file.is_parallel:
+                remove_parts(media_file)
+            if media_file.hls_playlist:
+                remove_hls(media_file)
+        for track in tracks:
+            remove_sprites(track)
+
+
+def sweep_all(batch_size=500, dry_run=False):
+    now = timezone.now()
+    return {
+        'expired': sweep(expired_uploads(now), batch_size, dry_run),
+        'orphaned': sweep(orphaned_files(now), batch_size, dry_run),
+    }
@@ -0,0 +1,98 @@
+import os
+import shutil
+import subprocess
+from io import BytesIO
+
+from PIL import Image
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from moviepy.video.io.VideoFileClip import VideoFileClip
+
+from movie.images import generate_derivatives, record_derivatives
+from movie.jobs import register
+from movie.models import ProcessingJob, MediaFileRendition
+from movie.packaging import hls_dir, hls_name, remove_hls, select_ladder, ffmpeg_hls_command, MASTER_PLAYLIST, \
+    sprites_dir, sprites_name, ffmpeg_sprites_command, preview_vtt, PREVIEW_TRACK
+
+
+@register(ProcessingJob.JobKind.THUMBNAIL)
+def extract_thumbnail(job):
+    media_file = job.media_file
+    video = VideoFileClip(media_file.file.path)
+    try:
+        thumb_temp = video.get_frame(video.duration * 0.3 if video.duration * 0.3 < 5 else 5)
+    finally:
+        video.close()
+
+    image = Image.fromarray(thumb_temp)
+    thumbnail_buffer = BytesIO()
+    image.save(thumbnail_buffer, format='JPEG')
+    thumbnail_buffer.seek(0)
+    media_file.thumbnail.save(name=os.path.splitext(media_file.file.name)[0] + ".jpeg", content=thumbnail_buffer,
+                              save=False)
+    thumbnail_buffer.close()
+    media_file.save(update_fields=['thumbnail'])
+
+
+@register(ProcessingJob.JobKind.HLS)
+def package_hls(job):
+    media_file = job.media_file
+    video = VideoFileClip(media_file.file.path)
+    source_height, has_audio = video.size[1], video.audio is not None
+    video.close()
+
+    rungs = select_ladder(source_height)
+    remove_hls(media_file)
+    output_dir = hls_dir(media_file)
+    for height, _, _ in rungs:
+        os.makedirs(os.path.join(output_dir, f'{height}p'), exist_ok=True)
+
+    subprocess.run(ffmpeg_hls_command(media_file.file.path, output_dir, rungs, has_audio),
+                   check=True, capture_output=True)
+
+    with transaction.atomic():
+        media_file.renditions.all().delete()
+        MediaFileRendition.objects.bulk_create([
+            MediaFileRendition(media_file=media_file, height=height, video_bitrate=video_bitrate,
+                               audio_bitrate=audio_bitrate if has_audio else None,
+                               playlist=hls_name(media_file, f'{height}p', 'index.m3u8'))
+            for height, video_bitrate, audio_bitrate in rungs
+        ])
+        media_file.hls_playlist = hls_name(media_file, MASTER_PLAYLIST)
+        media_file.save(update_fields=['hls_playlist'])
+
+
+@register(ProcessingJob.JobKind.IMAGE_DERIVATIVES)
+def build_image_derivatives(job):
+    model = apps.get_model(job.payload['model'])
+    instance = model.objects.filter(pk=job.payload['pk']).first()
+    if instance is None:
+        return
+
+    field_file = getattr(instance, job.payload['field'])
+    if field_file:
+        generate_derivatives(field_file)
+        record_derivatives(instance, job.payload['field'])
+
+
+@register(ProcessingJob.JobKind.PREVIEW_TRACK)
+def build_preview_track(job):
+    media_file = job.media_file
+    video = VideoFileClip(media_file.file.path, audio=False)
+    (width, height), duration = video.size, video.duration
+    video.close()
+
+    tile_width = settings.PREVIEW_TILE_WIDTH
+    tile_height = max(round(height * tile_width / width), 1)
+    output_dir = sprites_dir(media_file)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+
+    subprocess.run(ffmpeg_sprites_command(media_file.file.path, output_dir, tile_width, tile_height),
+                   check=True, capture_output=True)
+    with open(os.path.join(output_dir, PREVIEW_TRACK), 'w') as f:
+        f.write(preview_vtt(duration, tile_width, tile_height))
+
+    media_file.preview_track = sprites_name(media_file, PREVIEW_TRACK)
+    media_file.save(update_fields=['preview_track'])
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.core.files import locks
+from django.core.files.move import file_move_safe
+
+PARTS_DIRECTORY = 'upload-parts'
+
+
+def parts_dir(media_file):
+    return os.path.join(settings.MEDIA_ROOT, PARTS_DIRECTORY, media_file.upload_id)
+
+
+def part_path(media_file, chunk_index):
+    return os.path.join(parts_dir(media_file), f"{chunk_index}.part")
+
+
+def assign_file_name(media_file, filename):
+    field_file = media_file.file
+    media_file.file = field_file.storage.get_available_name(field_file.field.generate_filename(media_file, filename))
+
+
+def blocks(file_obj):
+    """
+    The content of ``file_obj`` in ``MEDIA_UPLOAD_BLOCK_SIZE`` reads. ``chunks()`` of an in-memory
+    upload is a single ``read()`` of everything, which copies the whole chunk at once.
+    """
+    file_obj.seek(0)
+    return iter(partial(file_obj.read, settings.MEDIA_UPLOAD_BLOCK_SIZE), b'')
+
+
+def write_chunk(file_obj, path, append=False):
+    """
+    Stream an uploaded chunk to ``path`` without ever holding the whole chunk in memory and
+    return the sha256 hex digest of the chunk.
+
+    Chunks larger than ``FILE_UPLOAD_MAX_MEMORY_SIZE`` are spooled to a temporary file by the
+    upload handler; when a new file is written from one of those, the temporary file is simply
+    moved into place. Otherwise data is copied in ``MEDIA_UPLOAD_BLOCK_SIZE`` blocks.
+    """
+    digest = hashlib.sha256()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not append and hasattr(file_obj, 'temporary_file_path'):
+        for block in blocks(file_obj):
+            digest.update(block)
+        file_move_safe(file_obj.temporary_file_path(), path, allow_overwrite=True)
+        return digest.hexdigest()
+
+    with open(path, 'ab' if append else 'wb') as f:
+        for block in blocks(file_obj):
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+
+def content_digest(chunk_digests, total_chunk):
+    """
+    Combine the per-chunk digests of an upload into one content digest.
+
+    This is a hash list rather than a hash of the whole file, so it can be built while chunks
+    stream in, in any order. Identical files uploaded with the same chunk size share a digest.
+    Returns None when a chunk digest is missing.
+    """
+    combined = hashlib.sha256()
+    for chunk_index in range(total_chunk):
+        chunk_digest = chunk_digests.get(str(chunk_index))
+        if chunk_digest is None:
+            return None
+        combined.update(bytes.fromhex(chunk_digest))
+    return combined.hexdigest()
+
+
+def empty_bitmap(total_chunk):
+    return bytes((total_chunk + 7) // 8)
+
+
+def set_chunk(bitmap, chunk_index):
+    bitmap = bytearray(bitmap)
+    bitmap[chunk_index // 8] |= 1 << (chunk_index % 8)
+    return bytes(bitmap)
+
+
+def count_chunks(bitmap):
+    return sum(bin(byte).count('1') for byte in bytes(bitmap))
+
+
+def write_part(media_file, chunk_index, file_obj):
+    """
+    Store one chunk of a parallel upload as its own part file and return its digest.
+
+    The part is written to a unique temporary name and renamed into place, so two requests
+    carrying the same chunk never interleave their bytes.
+    """
+    directory = parts_dir(media_file)
+    os.makedirs(directory, exist_ok=True)
+    path = part_path(media_file, chunk_index)
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    digest = write_chunk(file_obj, temp_path)
+    os.replace(temp_path, path)
+    return digest
+
+
+@contextmanager
+def upload_lock(media_file):
+    """
+    Exclusive per-upload lock shared by every worker process on this host.
+    """
+    directory = parts_dir(media_file)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'wb') as f:
+        locks.lock(f, locks.LOCK_EX)
+        try:
+            yield
+        finally:
+            locks.unlock(f)
+
+
+def assemble_parts(media_file):
+    """
+    Concatenate every part of a parallel upload into ``media_file.file``, then drop the parts.
+
+    Must be called while holding ``upload_lock`` for the upload.
+    """
+    path = media_file.file.path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as destination:
+        for chunk_index in range(media_file.total_chunk):
+            with open(part_path(media_file, chunk_index), 'rb') as part:
+                shutil.copyfileobj(part, destination, settings.MEDIA_UPLOAD_BLOCK_SIZE)
+    remove_parts(media_file)
+
+
+def remove_parts(media_file):
+    shutil.rmtree(parts_dir(media_file), ignore_errors=True)
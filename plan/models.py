@@ -10,6 +10,8 @@ class Plan(models.Model):
     days = models.IntegerField(null=False)
     price = models.IntegerField(null=False)
     is_enable = models.BooleanField(null=False, blank=False, default=True)
+    # Maintained by plan.signals; rebuild with the rebuild_popularity_counters command.
+    subscription_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
 
 
 class Payment(models.Model):
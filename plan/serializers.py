@@ -6,4 +6,4 @@ from plan.models import Plan
 class DashboardPlanSerializer(serializers.ModelSerializer):
     class Meta:
         model = Plan
-        exclude = ("description")
+        exclude = ("description",)
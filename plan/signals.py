@@ -0,0 +1,17 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from plan.models import Plan, Subscription
+
+
+@receiver(post_save, sender=Subscription)
+def count_subscription(sender, instance, created, **kwargs):
+    if created:
+        Plan.objects.filter(pk=instance.plan_id).update(subscription_count=F('subscription_count') + 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def uncount_subscription(sender, instance, **kwargs):
+    Plan.objects.filter(pk=instance.plan_id, subscription_count__gt=0) \
+        .update(subscription_count=F('subscription_count') - 1)
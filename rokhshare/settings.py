@@ -24,7 +24,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 
 SECRET_KEY = config('SECRET_KEY')
-DEBUG = config('DEBUG')
+DEBUG = config('DEBUG', cast=bool)
 
 ALLOWED_HOSTS = [config('ALLOWED_HOSTS')]
 
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
     'movie.apps.MovieConfig',
     'plan.apps.PlanConfig',
     'user.apps.UserConfig',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -64,6 +65,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'rokhshare.urls'
@@ -161,4 +163,123 @@ SIMPLE_JWT = {
 }
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Chunked media uploads. Chunks above FILE_UPLOAD_MAX_MEMORY_SIZE are spooled to disk by the
+# upload handler and then streamed to their destination in MEDIA_UPLOAD_BLOCK_SIZE blocks.
+MEDIA_UPLOAD_MAX_CHUNK_SIZE = config('MEDIA_UPLOAD_MAX_CHUNK_SIZE', default=128 * 1024 * 1024, cast=int)
+MEDIA_UPLOAD_BLOCK_SIZE = config('MEDIA_UPLOAD_BLOCK_SIZE', default=1024 * 1024, cast=int)
+
+# Background media processing, drained by the process_media_jobs command.
+MEDIA_JOB_TIMEOUT = config('MEDIA_JOB_TIMEOUT', default=60 * 60, cast=int)
+MEDIA_JOB_MAX_ATTEMPTS = config('MEDIA_JOB_MAX_ATTEMPTS', default=3, cast=int)
+
+# Media playback. Set MEDIA_STREAM_OFFLOAD to "x-accel-redirect" (nginx) or "x-sendfile" (apache,
+# lighttpd) to let the front-end server transfer the bytes. MEDIA_STREAM_ACCEL_PREFIX must be an
+# internal location aliased to MEDIA_ROOT.
+MEDIA_STREAM_OFFLOAD = config('MEDIA_STREAM_OFFLOAD', default='')
+MEDIA_STREAM_ACCEL_PREFIX = config('MEDIA_STREAM_ACCEL_PREFIX', default='/protected-media/')
+
+# HLS packaging of movie and episode videos. Each rung is (height, video kbps, audio kbps).
+FFMPEG_BINARY = config('FFMPEG_BINARY', default='ffmpeg')
+HLS_SEGMENT_SECONDS = config('HLS_SEGMENT_SECONDS', default=6, cast=int)
+HLS_BITRATE_LADDER = [
+    (360, 800, 96),
+    (480, 1400, 128),
+    (720, 2800, 128),
+    (1080, 5000, 160),
+]
+
+# Sweeping of expired partial uploads and of complete uploads nothing references.
+MEDIA_ORPHAN_GRACE = config('MEDIA_ORPHAN_GRACE', default=24 * 60 * 60, cast=int)
+MEDIA_SWEEP_INTERVAL = config('MEDIA_SWEEP_INTERVAL', default=60 * 60, cast=int)
+
+# Responsive derivatives generated for every catalog image.
+IMAGE_DERIVATIVE_WIDTHS = [160, 320, 640, 1280]
+IMAGE_DERIVATIVE_FORMATS = ['webp', 'jpeg']
+IMAGE_DERIVATIVE_QUALITY = config('IMAGE_DERIVATIVE_QUALITY', default=80, cast=int)
+
+# On-the-fly image resizing. Only IMAGE_RESIZE_SIZES (width, height) are rendered; results live in a
+# disk cache bounded to IMAGE_RESIZE_CACHE_MAX_BYTES.
+IMAGE_RESIZE_SIZES = [
+    (100, 150),
+    (200, 300),
+    (400, 600),
+    (160, 90),
+    (320, 180),
+    (640, 360),
+    (1280, 720),
+]
+# Only images of the public catalog are served: the poster, thumbnail, flag and artist directories
+# of the upload_to paths in movie.models, minus the thumbnails generated for uploaded media files.
+IMAGE_RESIZE_DIRECTORIES = ['poster', 'thumbnail', 'genre-poster', 'country-flag', 'artists', 'collection-poster']
+IMAGE_RESIZE_PRIVATE_DIRECTORIES = ['thumbnail/file']
+IMAGE_RESIZE_CACHE_DIR = config('IMAGE_RESIZE_CACHE_DIR', default=os.path.join(BASE_DIR, 'cache', 'resize'))
+IMAGE_RESIZE_CACHE_MAX_BYTES = config('IMAGE_RESIZE_CACHE_MAX_BYTES', default=1024 * 1024 * 1024, cast=int)
+IMAGE_RESIZE_MAX_AGE = config('IMAGE_RESIZE_MAX_AGE', default=24 * 60 * 60, cast=int)
+
+# Scrub previews: one PREVIEW_TILE_WIDTH wide frame every PREVIEW_INTERVAL seconds, tiled into
+# PREVIEW_COLUMNS x PREVIEW_ROWS sprite sheets and indexed by a WebVTT track.
+PREVIEW_INTERVAL = config('PREVIEW_INTERVAL', default=10, cast=int)
+PREVIEW_TILE_WIDTH = config('PREVIEW_TILE_WIDTH', default=160, cast=int)
+PREVIEW_COLUMNS = 10
+PREVIEW_ROWS = 10
+
+# Cached responses of the public catalog endpoints, invalidated through model signals (api.signals).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': config('CATALOG_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CATALOG_CACHE_LOCATION', default=os.path.join(BASE_DIR, 'cache', 'catalog')),
+        'TIMEOUT': config('CATALOG_CACHE_TIMEOUT', default=60 * 60, cast=int),
+    },
+}
+
+# Full-text search (movie.search): the most results one query returns, best match first. A search
+# reaching it reports count_is_capped, its count and last page stop there. The indexes are created
+# by `manage.py rebuild_search_index --missing`, run at deploy; until then search uses LIKE. Each
+# process looks for a missing index again every SEARCH_INDEX_CHECK_INTERVAL seconds.
+SEARCH_MAX_RESULTS = config('SEARCH_MAX_RESULTS', default=500, cast=int)
+SEARCH_INDEX_CHECK_INTERVAL = config('SEARCH_INDEX_CHECK_INTERVAL', default=60, cast=int)
+
+# Autocomplete (movie.autocomplete): in-process prefix indexes, rebuilt when another process renamed
+# something. The shared generation token and the log of removed entries live in AUTOCOMPLETE_CACHE
+# and are checked every AUTOCOMPLETE_CHECK_INTERVAL seconds.
+AUTOCOMPLETE_CACHE = 'catalog'
+AUTOCOMPLETE_CHECK_INTERVAL = config('AUTOCOMPLETE_CHECK_INTERVAL', default=5, cast=int)
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+# Page counts of views with count_strategy 'cached' or 'estimated' (api.counting). Exact counts are
+# cached per SQL for PAGINATION_COUNT_TTL seconds; PostgreSQL planner estimates are used above
+# PAGINATION_ESTIMATE_THRESHOLD rows, and SQLite keeps signal-maintained counters for unfiltered
+# lists of PAGINATION_COUNTED_MODELS.
+PAGINATION_COUNT_CACHE = 'catalog'
+PAGINATION_COUNT_TTL = config('PAGINATION_COUNT_TTL', default=60, cast=int)
+PAGINATION_ESTIMATE_THRESHOLD = config('PAGINATION_ESTIMATE_THRESHOLD', default=100_000, cast=int)
+PAGINATION_ROW_COUNT_REFRESH = config('PAGINATION_ROW_COUNT_REFRESH', default=60 * 60, cast=int)
+PAGINATION_COUNTED_MODELS = ['movie.Movie', 'movie.TvSeries', 'movie.Artist', 'movie.Collection']
+
+# Per-request query stats (api.middleware): logged, sent in X-Query-Stats with DEBUG, and with
+# QUERY_BUDGET_STRICT a view exceeding its query_budget(s) fails the request instead of only logging.
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default=False, cast=bool)
+
+# Time series of views and ad impressions (api.timeseries): hourly buckets for ranges up to
+# TIMESERIES_HOURLY_MAX_DAYS, daily beyond, widened so a series never has more than TIMESERIES_MAX_POINTS.
+TIMESERIES_HOURLY_MAX_DAYS = 3
+TIMESERIES_MAX_POINTS = config('TIMESERIES_MAX_POINTS', default=500, cast=int)
+
+# Rollup increments of views, ad impressions and sign-ups (api.counters) are applied every
+# COUNTER_FLUSH_INTERVAL seconds instead of in the request's transaction; 0 applies them right away.
+COUNTER_FLUSH_INTERVAL = config('COUNTER_FLUSH_INTERVAL', default=5, cast=int)
+
+# Player heartbeats (movie.heartbeat): buffered per process and written in batches every
+# HEARTBEAT_FLUSH_INTERVAL seconds or once HEARTBEAT_FLUSH_SIZE streams are waiting. Past
+# HEARTBEAT_MAX_STREAMS waiting streams new ones get 429. A stream idle for HEARTBEAT_SESSION_TIMEOUT
+# seconds starts a new SeenMedia. Unflushed heartbeats are kept in HEARTBEAT_SPILL_DIR.
+HEARTBEAT_FLUSH_INTERVAL = config('HEARTBEAT_FLUSH_INTERVAL', default=5, cast=int)
+HEARTBEAT_FLUSH_SIZE = config('HEARTBEAT_FLUSH_SIZE', default=1000, cast=int)
+HEARTBEAT_MAX_STREAMS = config('HEARTBEAT_MAX_STREAMS', default=50_000, cast=int)
+HEARTBEAT_SESSION_TIMEOUT = config('HEARTBEAT_SESSION_TIMEOUT', default=30 * 60, cast=int)
+HEARTBEAT_SPILL_DIR = config('HEARTBEAT_SPILL_DIR', default=os.path.join(BASE_DIR, 'spill', 'heartbeats'))
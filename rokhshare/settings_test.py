@@ -0,0 +1,12 @@
+"""
+Settings for the test suite: ``python manage.py test --settings=rokhshare.settings_test``.
+
+The apps ship without migrations, so the test database is created straight from the models.
+Caches stay in memory and rollup counters are written right away, not by a background thread.
+"""
+from rokhshare.settings import *  # noqa: F401,F403
+from rokhshare.settings import CACHES
+
+MIGRATION_MODULES = {app: None for app in ('advertise', 'movie', 'plan', 'user', 'api')}
+CACHES['catalog'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'catalog'}
+COUNTER_FLUSH_INTERVAL = 0
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from user.stats import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the watch count, last watch and premium end of every user."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"UserStats: {rebuild()} rows updated")
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 
 # Create your models here.
@@ -12,3 +13,28 @@ class UserToken(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     token = models.CharField(max_length=100, null=False)
     expire_date = models.DateTimeField()
+
+
+class UserStats(models.Model):
+    """
+    Watch and subscription figures of a user, kept up to date by signals (``user.signals``) so
+    user lists can sort and filter on them without joining the watch history.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='stats')
+    seen_count = models.PositiveIntegerField(default=0, db_index=True)
+    last_seen_at = models.DateTimeField(null=True, db_index=True)
+    premium_until = models.DateTimeField(null=True, db_index=True)
+
+    @property
+    def is_premium(self):
+        return self.premium_until is not None and self.premium_until > timezone.now()
+
+    @classmethod
+    def change(cls, user_id, create=True, **updates):
+        """
+        Apply ``updates`` (expressions over the row's own fields) to the stats of ``user_id``,
+        creating the row first if the user has none yet and ``create`` is set.
+        """
+        if not cls.objects.filter(user_id=user_id).update(**updates) and create:
+            cls.objects.get_or_create(user_id=user_id)
+            cls.objects.filter(user_id=user_id).update(**updates)
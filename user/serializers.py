@@ -101,8 +101,8 @@ class LoginSuperUserSerializers(TokenObtainSerializer):
 
 
 class DashboardUserSerializer(serializers.ModelSerializer):
-    seen_movies = serializers.IntegerField()
-    is_premium = serializers.BooleanField()
+    seen_movies = serializers.IntegerField(source='stats.seen_count', read_only=True)
+    is_premium = serializers.BooleanField(source='stats.is_premium', read_only=True)
     full_name = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
@@ -0,0 +1,44 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from movie.heartbeat import sessions_started
+from movie.models import SeenMedia
+from plan.models import Subscription
+from user import stats
+from user.models import User, UserStats
+
+
+@receiver(post_save, sender=User)
+def create_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=SeenMedia)
+def count_seen(sender, instance, created, **kwargs):
+    if created:
+        stats.seen(instance)
+
+
+@receiver(sessions_started, sender=SeenMedia)
+def count_sessions(sender, instances, **kwargs):
+    stats.seen_many(instances)
+
+
+@receiver(post_delete, sender=SeenMedia)
+def uncount_seen(sender, instance, **kwargs):
+    stats.unseen(instance)
+
+
+@receiver(post_save, sender=Subscription)
+def extend_premium(sender, instance, created, **kwargs):
+    if created:
+        stats.subscribed(instance)
+    else:
+        # The end date may have moved back; only a recount is safe.
+        stats.recount_premium(instance.user_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def shorten_premium(sender, instance, **kwargs):
+    stats.recount_premium(instance.user_id, create=False)
@@ -0,0 +1,62 @@
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from movie.models import SeenMedia
+from plan.models import Subscription
+from user.models import User, UserStats
+
+
+def latest(model, field):
+    """
+    Subquery of the latest ``field`` among the ``model`` rows of the stats row's user.
+    """
+    return Subquery(model.objects.filter(user=OuterRef('user')).order_by().values('user')
+                    .annotate(latest=Max(field)).values('latest'))
+
+
+def seen(seen_media):
+    seen_many([seen_media])
+
+
+def seen_many(views):
+    """
+    Count the ``SeenMedia`` rows ``views`` with one update per user.
+    """
+    counts, latest_at = {}, {}
+    for seen_media in views:
+        counts[seen_media.user_id] = counts.get(seen_media.user_id, 0) + 1
+        latest_at[seen_media.user_id] = max(latest_at.get(seen_media.user_id, seen_media.created_at),
+                                            seen_media.created_at)
+    for user_id, count in counts.items():
+        UserStats.change(user_id, seen_count=F('seen_count') + count,
+                         last_seen_at=Greatest(Coalesce('last_seen_at', latest_at[user_id]), latest_at[user_id]))
+
+
+def unseen(seen_media):
+    # Deletes cascade from the user too, whose stats may be gone already.
+    UserStats.change(seen_media.user_id, create=False, seen_count=Greatest(F('seen_count') - 1, 0),
+                     last_seen_at=latest(SeenMedia, 'created_at'))
+
+
+def subscribed(subscription):
+    UserStats.change(subscription.user_id, premium_until=Greatest(Coalesce('premium_until', subscription.end_date),
+                                                                  subscription.end_date))
+
+
+def recount_premium(user_id, create=True):
+    UserStats.change(user_id, create=create, premium_until=latest(Subscription, 'end_date'))
+
+
+def rebuild():
+    """
+    Recompute the stats of every user from the watch history and the subscriptions.
+    """
+    UserStats.objects.bulk_create([UserStats(user_id=pk) for pk in User.objects.filter(stats__isnull=True)
+                                  .values_list('pk', flat=True)], ignore_conflicts=True)
+    seen_count = SeenMedia.objects.filter(user=OuterRef('user')).order_by().values('user') \
+        .annotate(count=Count('pk')).values('count')
+    return UserStats.objects.update(
+        seen_count=Coalesce(Subquery(seen_count), 0),
+        last_seen_at=latest(SeenMedia, 'created_at'),
+        premium_until=latest(Subscription, 'end_date'),
+    )